@@ -1,21 +1,54 @@
+import hashlib
+import os
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from database import get_async_db
 from models import Usuario
 from schemas import TokenData
+from services.cache import TTLCache
+from services.password_hasher import PasswordHasher, PasswordPoolSaturated
 
 # Configuración de seguridad
 SECRET_KEY = "tu-clave-secreta-muy-segura-cambiar-en-produccion"  # Cambiar en producción
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 120
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Costo de bcrypt. Al cambiarlo, los hashes existentes se recalculan en el siguiente login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Pool dedicado para bcrypt, separado del threadpool que atiende los endpoints
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "2"))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "64"))
+
+# Cache de identidad (email del token -> id, nombre y email del Usuario) para no consultar
+# la base en cada request autenticado. TTL corto: el cache es local a cada proceso.
+# El saldo y el hash de la contraseña no se cachean: se leen de la base cuando hacen falta.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "30"))
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "10000"))
+COLUMNAS_CACHE_USUARIO = ("id", "nombre", "email")
+
+# Cache de tokens ya verificados (hash del token -> payload); cada entrada vence con el
+# `exp` del propio token. TOKEN_CACHE_ENABLED=false verifica la firma en cada request.
+TOKEN_CACHE_ENABLED = os.getenv("TOKEN_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TOKEN_CACHE_MAXSIZE = int(os.getenv("TOKEN_CACHE_MAXSIZE", "10000"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+password_hasher = PasswordHasher(pwd_context, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE)
 security = HTTPBearer()
+user_cache = TTLCache(maxsize=USER_CACHE_MAXSIZE, ttl=USER_CACHE_TTL_SECONDS)
+token_cache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
 
 def verify_password(plain_password, hashed_password):
     """Verificar contraseña"""
@@ -25,6 +58,21 @@ def get_password_hash(password):
     """Hashear contraseña"""
     return pwd_context.hash(password)
 
+async def _en_pool_password(operacion):
+    """Esperar una operación del pool de bcrypt, respondiendo 503 si está saturado"""
+    try:
+        return await operacion
+    except PasswordPoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Demasiadas solicitudes de autenticación. Intenta de nuevo en unos segundos.",
+            headers={"Retry-After": "1"},
+        )
+
+async def hash_password_async(password: str) -> str:
+    """Hashear contraseña en el pool dedicado de bcrypt"""
+    return await _en_pool_password(password_hasher.hash(password))
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Crear token JWT"""
     to_encode = data.copy()
@@ -36,18 +84,58 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def authenticate_user(db: Session, email: str, password: str):
-    """Autenticar usuario"""
-    user = db.query(Usuario).filter(Usuario.email == email).first()
+def decode_access_token(token: str) -> dict:
+    """Verificar y decodificar un token JWT, reutilizando la verificación de tokens ya vistos"""
+    if not TOKEN_CACHE_ENABLED:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    clave = hashlib.sha256(token.encode()).digest()
+    payload = token_cache.get(clave)
+    if payload is None:
+        # Lanza JWTError si la firma o el exp no son válidos; esos tokens no se cachean
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        token_cache.set(clave, payload, expira_en=payload.get("exp"))
+    return payload
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    """
+    Obtener un usuario por email pasando por el cache de identidad.
+
+    Desde el cache solo vienen id, nombre y email; `saldo` y `password` quedan sin
+    cargar, así que quien los necesite los lee de la base con `db.refresh(user, [...])`.
+    """
+    valores = user_cache.get(email)
+    if valores is not None:
+        # Adjuntar a la sesión sin SELECT; las columnas que faltan quedan expiradas
+        user = Usuario(**valores)
+        make_transient_to_detached(user)
+        return await db.merge(user, load=False)
+    
+    user = await db.scalar(select(Usuario).where(Usuario.email == email))
+    if user is not None:
+        user_cache.set(email, {columna: getattr(user, columna) for columna in COLUMNAS_CACHE_USUARIO})
+    return user
+
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    """Autenticar usuario (bcrypt corre en el pool dedicado)"""
+    # Sin cache: el hash de la contraseña se lee siempre de la base
+    user = await db.scalar(select(Usuario).where(Usuario.email == email))
     if not user:
         return False
-    if not verify_password(password, user.password):
+    valido, nuevo_hash = await _en_pool_password(
+        password_hasher.verify_and_update(password, user.password)
+    )
+    if not valido:
         return False
+    if nuevo_hash:
+        # El costo de bcrypt cambió desde que se guardó el hash: guardarlo con el costo actual
+        user.password = nuevo_hash
+        await db.commit()
     return user
 
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener usuario actual desde el token JWT"""
     credentials_exception = HTTPException(
@@ -57,7 +145,7 @@ async def get_current_user(
     )
     try:
         token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_access_token(token)
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
@@ -65,7 +153,7 @@ async def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(Usuario).filter(Usuario.email == token_data.email).first()
+    user = await get_user_by_email(db, token_data.email)
     if user is None:
         raise credentials_exception
     return user
@@ -1,12 +1,46 @@
-from fastapi import FastAPI
+import logging
+
+from fastapi import FastAPI, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from database import engine, Base
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+from database import engine, async_engine, Base, SessionLocal
 from routers import usuario, producto, compra, conversion
 from routers import analytics
+from auth import user_cache, token_cache, password_hasher
+from routers.producto import menu_index, popularity_ranking, search_event_writer
+from services.analytics_rollups import reconstruir_resumenes, resumenes_desincronizados
+from services.popularity import popularidad_desincronizada, reconstruir_popularidad
+from services.personal_recommendations import personal_recommender
+from services.qr_expiry import qr_expiry_sweeper
+from services.qr_redemption import QR_INDICE_MEMORIA, qr_index
+from services.recommendations import recommendation_engine
+from services.wallet import abrir_libro
+
+logger = logging.getLogger(__name__)
+
+# Mensajes del driver que indican que la base está ocupada por otra transacción (se puede reintentar)
+ERRORES_BASE_OCUPADA = ("database is locked", "database is busy", "database table is locked")
 
 # Crear las tablas en la base de datos
 Base.metadata.create_all(bind=engine)
 
+# create_all no agrega índices nuevos a tablas que ya existen
+for table in Base.metadata.sorted_tables:
+    for index in table.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+# Bases con ventas anteriores a los contadores de popularidad: calcularlos una vez
+with SessionLocal() as db:
+    if popularidad_desincronizada(db):
+        reconstruir_popularidad(db)
+    # Lo mismo con los resúmenes por hora de /analytics
+    if resumenes_desincronizados(db):
+        reconstruir_resumenes(db)
+    # Saldos anteriores al libro de movimientos: registrarlos como apertura
+    abrir_libro(db)
+
 # Crear la aplicación FastAPI
 app = FastAPI(
     title="TapAndToast API",
@@ -21,6 +55,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "Link", "ETag", "X-Menu-Version"],
 )
 
 # Incluir los routers
@@ -30,6 +65,54 @@ app.include_router(compra.router)
 app.include_router(conversion.router)
 app.include_router(analytics.router)
 
+def base_ocupada(exc: Exception) -> bool:
+    """True si el error es la base ocupada (lock/busy de SQLite) o el pool sin conexiones libres."""
+    if isinstance(exc, PoolTimeoutError):
+        return True
+    mensaje = str(getattr(exc, "orig", exc)).lower()
+    return any(error in mensaje for error in ERRORES_BASE_OCUPADA)
+
+@app.exception_handler(OperationalError)
+@app.exception_handler(PoolTimeoutError)
+async def responder_base_ocupada(request: Request, exc: Exception):
+    """
+    La base no atendió a tiempo ("database is locked" de SQLite o el pool sin
+    conexiones libres). La transacción ya se deshizo, así que el cliente puede
+    reintentar: 503 con Retry-After en lugar de un 500 genérico. Cualquier otro
+    OperationalError (tabla inexistente, error de disco, conexión caída) sigue
+    siendo un 500.
+    """
+    if not base_ocupada(exc):
+        raise exc
+    logger.warning("Base ocupada en %s %s: %s", request.method, request.url.path, exc)
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "La base de datos está ocupada. Intenta de nuevo en unos segundos."},
+        headers={"Retry-After": "1"},
+    )
+
+@app.on_event("startup")
+def iniciar_tareas():
+    """Arrancar el barrido de QR vencidos, la carga del índice de QR y los recálculos de recomendaciones"""
+    qr_expiry_sweeper.al_expirar_compras = compra.publicar_compras_expiradas
+    qr_expiry_sweeper.iniciar()
+    recommendation_engine.iniciar()
+    personal_recommender.iniciar()
+    if QR_INDICE_MEMORIA:
+        qr_index.iniciar()
+
+@app.on_event("shutdown")
+async def cerrar_recursos():
+    """Escribir los eventos de búsqueda que sigan en cola y cerrar las conexiones"""
+    await run_in_threadpool(search_event_writer.cerrar)
+    await run_in_threadpool(qr_expiry_sweeper.cerrar)
+    await run_in_threadpool(qr_index.cerrar)
+    await run_in_threadpool(recommendation_engine.cerrar)
+    await run_in_threadpool(personal_recommender.cerrar)
+    if async_engine is not None:
+        # Las conexiones de aiosqlite viven en hilos propios: cerrarlas para poder salir
+        await async_engine.dispose()
+
 @app.get("/")
 def root():
     """Endpoint de bienvenida"""
@@ -43,3 +126,19 @@ def root():
 def health_check():
     """Endpoint de verificación de salud"""
     return {"status": "ok", "mensaje": "El servidor está funcionando correctamente"}
+
+@app.get("/metrics")
+def metrics():
+    """Contadores internos de los caches y servicios en memoria"""
+    return {
+        "cache_usuarios": user_cache.stats(),
+        "cache_tokens": token_cache.stats(),
+        "pool_passwords": password_hasher.stats(),
+        "eventos_busqueda": search_event_writer.stats(),
+        "menu": menu_index.stats(),
+        "popularidad": popularity_ranking.stats(),
+        "recomendaciones": recommendation_engine.stats(),
+        "recomendaciones_personales": personal_recommender.stats(),
+        "qr": qr_index.stats(),
+        "expiracion_qr": qr_expiry_sweeper.stats(),
+    }
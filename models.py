@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Enum, Index
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -16,6 +17,11 @@ class EstadoQR(enum.Enum):
     CANJEADO = "CANJEADO"
     EXPIRADO = "EXPIRADO"
 
+class TipoMovimientoSaldo(enum.Enum):
+    APERTURA = "APERTURA"  # saldo que ya tenía el usuario antes de existir el libro
+    RECARGA = "RECARGA"
+    COMPRA = "COMPRA"
+
 class NivelInteresSeatDelivery(enum.Enum):
     ALTO = "HIGH"
     MODERADO = "MODERATE"
@@ -64,7 +70,13 @@ class Compra(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     id_usuario = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
-    fecha_hora = Column(DateTime, default=func.now(), nullable=False)
+    # func.now() en SQLite guarda "YYYY-MM-DD HH:MM:SS"; los parámetros se enlazan con el
+    # mismo formato para que comparar contra fecha_hora (p. ej. el cursor del historial) sea exacto
+    fecha_hora = Column(
+        DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"),
+        default=func.now(),
+        nullable=False
+    )
     total = Column(Float, nullable=False)
     estado = Column(Enum(EstadoCompra), default=EstadoCompra.CARRITO, nullable=False)
     
@@ -77,6 +89,13 @@ class Compra(Base):
     usuario = relationship("Usuario", back_populates="compras")
     detalles = relationship("DetalleCompra", back_populates="compra")
     qr = relationship("QR", back_populates="compra", uselist=False)
+    
+    __table_args__ = (
+        # Historial paginado por cursor: WHERE id_usuario = ? ORDER BY fecha_hora DESC, id DESC
+        Index("ix_compras_usuario_fecha_id", "id_usuario", "fecha_hora", "id"),
+        # Bordes de ventana en /analytics que no caen en hora exacta (ver services/analytics_rollups.py)
+        Index("ix_compras_fecha_hora", "fecha_hora"),
+    )
 
 class DetalleCompra(Base):
     __tablename__ = "detalles_compra"
@@ -99,6 +118,11 @@ class QR(Base):
     
     # Relaciones
     compra = relationship("Compra", back_populates="qr")
+    
+    __table_args__ = (
+        # Barrido de expiración: WHERE estado = 'ACTIVO', recorriendo solo los activos
+        Index("ix_qrs_estado_compra", "estado", "id_compra"),
+    )
 
 class EncuestaSeatDelivery(Base):
     __tablename__ = "encuestas_seat_delivery"
@@ -135,3 +159,86 @@ class EventoBusquedaProducto(Base):
     limite = Column(Integer, nullable=True)
     resultados = Column(Integer, nullable=False, default=0)
     creado_en = Column(DateTime, default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # Bordes de ventana en /analytics que no caen en hora exacta
+        Index("ix_eventos_busqueda_creado_en", "creado_en"),
+    )
+
+
+class PopularidadProducto(Base):
+    """Contadores de ventas por producto, actualizados en cada compra (ver services/popularity.py)."""
+    __tablename__ = "popularidad_productos"
+
+    id_producto = Column(Integer, ForeignKey("productos.id"), primary_key=True)
+    ordenes = Column(Integer, nullable=False, default=0)  # compras que incluyen el producto
+    unidades = Column(Integer, nullable=False, default=0)
+
+
+# Resúmenes por hora para /analytics (ver services/analytics_rollups.py). `hora` es el
+# inicio de la hora en UTC, con el mismo formato que compras.fecha_hora.
+class ResumenHoraCompras(Base):
+    """Órdenes e ingresos de cada hora, sumados en cada compra."""
+    __tablename__ = "resumen_hora_compras"
+
+    hora = Column(DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"), primary_key=True)
+    ordenes = Column(Integer, nullable=False, default=0)
+    ingresos = Column(Float, nullable=False, default=0.0)
+
+
+class ResumenHoraCategoria(Base):
+    """Órdenes, unidades e ingresos de cada categoría en cada hora."""
+    __tablename__ = "resumen_hora_categorias"
+
+    hora = Column(DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"), primary_key=True)
+    id_tipo = Column(Integer, ForeignKey("tipos_producto.id"), primary_key=True)
+    ordenes = Column(Integer, nullable=False, default=0)  # compras con algún producto de la categoría
+    unidades = Column(Integer, nullable=False, default=0)
+    ingresos = Column(Float, nullable=False, default=0.0)
+
+
+class ResumenHoraBusquedas(Base):
+    """Búsquedas de productos de cada hora, sumadas al guardar cada lote de eventos."""
+    __tablename__ = "resumen_hora_busquedas"
+
+    hora = Column(DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"), primary_key=True)
+    busquedas = Column(Integer, nullable=False, default=0)
+
+
+class MovimientoSaldo(Base):
+    """
+    Libro de movimientos del monedero (solo se agregan filas). Montos en centavos,
+    con signo, y el saldo resultante después de cada movimiento (ver services/wallet.py).
+    """
+    __tablename__ = "movimientos_saldo"
+
+    id = Column(Integer, primary_key=True)
+    id_usuario = Column(Integer, ForeignKey("usuarios.id"), nullable=False)
+    tipo = Column(Enum(TipoMovimientoSaldo), nullable=False)
+    monto_centavos = Column(Integer, nullable=False)
+    saldo_centavos = Column(Integer, nullable=False)
+    id_compra = Column(Integer, ForeignKey("compras.id"), nullable=True)
+    id_recarga = Column(Integer, ForeignKey("recargas_saldo.id"), nullable=True)
+    # Mismo formato que compras.fecha_hora, para comparar contra fechas enlazadas como parámetro
+    fecha_hora = Column(
+        DateTime().with_variant(sqlite.DATETIME(truncate_microseconds=True), "sqlite"),
+        default=func.now(),
+        nullable=False
+    )
+
+    __table_args__ = (
+        # Saldo a una fecha: último movimiento del usuario con fecha_hora <= t
+        Index("ix_movimientos_saldo_usuario_fecha_id", "id_usuario", "fecha_hora", "id"),
+        # Verificación incremental: movimientos del usuario posteriores a su snapshot
+        Index("ix_movimientos_saldo_usuario_id", "id_usuario", "id"),
+    )
+
+
+class SnapshotSaldo(Base):
+    """Último saldo verificado de cada usuario: la verificación sigue desde acá (ver services/wallet.py)."""
+    __tablename__ = "snapshots_saldo"
+
+    id_usuario = Column(Integer, ForeignKey("usuarios.id"), primary_key=True)
+    id_movimiento = Column(Integer, ForeignKey("movimientos_saldo.id"), nullable=False)
+    saldo_centavos = Column(Integer, nullable=False)
+    verificado_en = Column(DateTime, default=func.now(), nullable=False)
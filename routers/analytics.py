@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
+from types import SimpleNamespace
 from typing import List, Optional, Dict, Tuple
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func
 from database import get_db
 from models import (
     Compra,
@@ -13,6 +14,9 @@ from models import (
     RecargaSaldoEvento,
     Usuario,
     EventoBusquedaProducto,
+    ResumenHoraBusquedas,
+    ResumenHoraCategoria,
+    ResumenHoraCompras,
 )
 from schemas import (
     ReordersByCategoryResponse,
@@ -28,8 +32,18 @@ from schemas import (
     MostRequestedCategoryStats,
 )
 
+from services.analytics_rollups import ANALYTICS_RESUMENES, ESTADOS_VALIDOS, hora_local, partir_ventana
+
 router = APIRouter(prefix="/analytics", tags=["analytics"])
 
+
+def _partir_ventana(start: datetime, end: datetime, timezone_offset_minutes: int = 0):
+    """Tramo de horas completas (leído de los resúmenes por hora) y bordes a leer crudos."""
+    if not ANALYTICS_RESUMENES:
+        return None, [(start, end)]
+    return partir_ventana(start, end, timezone_offset_minutes)
+
+
 @router.get("/reorders-by-category", response_model=ReordersByCategoryResponse)
 def reorders_by_category(
     start: Optional[datetime] = Query(None, description="Start datetime (inclusive) in UTC"),
@@ -190,42 +204,49 @@ def order_peak_hours(
         # Default to start of current day
         start = end.replace(hour=0, minute=0, second=0, microsecond=0)
     
-    # Query de compras en el rango con estados válidos (al menos pagadas)
-    compras = (
-        db.query(
-            Compra.id,
-            Compra.fecha_hora,
-            Compra.total
-        )
-        .filter(Compra.fecha_hora >= start, Compra.fecha_hora < end)
-        .filter(Compra.estado.in_([
-            EstadoCompra.PAGADO,
-            EstadoCompra.EN_PREPARACION,
-            EstadoCompra.LISTO,
-            EstadoCompra.ENTREGADO
-        ]))
-        .all()
-    )
+    # Órdenes e ingresos por hora local, agrupados en la base (a lo sumo 24 filas por
+    # consulta). Las horas completas de la ventana salen del resumen por hora; solo
+    # los bordes se leen de compras.
+    dialecto = db.get_bind().dialect.name
+    hourly_orders: Dict[int, int] = {h: 0 for h in range(24)}
+    hourly_revenue: Dict[int, float] = {h: 0.0 for h in range(24)}
     
-    # Convertir a hora local y agrupar por hora
-    def to_local_hour(dt: datetime, offset_min: int) -> int:
-        return ((dt + timedelta(minutes=offset_min)).hour) % 24
-    
-    # Agrupar por hora
-    hourly_data: Dict[int, List[float]] = {h: [] for h in range(24)}
-    
-    for compra in compras:
-        hour = to_local_hour(compra.fecha_hora, timezone_offset_minutes)
-        hourly_data[hour].append(compra.total)
+    tramo, bordes = _partir_ventana(start, end, timezone_offset_minutes)
+    consultas = []
+    if tramo:
+        consultas.append(
+            db.query(
+                hora_local(dialecto, ResumenHoraCompras.hora, timezone_offset_minutes),
+                func.sum(ResumenHoraCompras.ordenes),
+                func.sum(ResumenHoraCompras.ingresos),
+            )
+            .filter(ResumenHoraCompras.hora >= tramo[0], ResumenHoraCompras.hora < tramo[1])
+            .group_by("hora_local")
+        )
+    for desde, hasta in bordes:
+        # Compras del borde con estados válidos (al menos pagadas)
+        consultas.append(
+            db.query(
+                hora_local(dialecto, Compra.fecha_hora, timezone_offset_minutes),
+                func.count(),
+                func.sum(Compra.total),
+            )
+            .filter(Compra.fecha_hora >= desde, Compra.fecha_hora < hasta)
+            .filter(Compra.estado.in_(ESTADOS_VALIDOS))
+            .group_by("hora_local")
+        )
+    for consulta in consultas:
+        for hour, ordenes, ingresos in consulta.all():
+            hourly_orders[hour] += ordenes
+            hourly_revenue[hour] += ingresos or 0.0
     
     # Calcular estadísticas por hora
     hourly_stats = []
-    total_orders = len(compras)
+    total_orders = sum(hourly_orders.values())
     
     for hour in range(24):
-        orders = hourly_data[hour]
-        order_count = len(orders)
-        total_revenue = sum(orders)
+        order_count = hourly_orders[hour]
+        total_revenue = hourly_revenue[hour]
         avg_order_value = total_revenue / order_count if order_count > 0 else 0.0
         percentage = (order_count / total_orders * 100) if total_orders > 0 else 0.0
         
@@ -384,21 +405,33 @@ def product_search_peak_hours(
     if start is None:
         start = end - timedelta(days=30)
 
-    eventos = (
-        db.query(EventoBusquedaProducto.creado_en)
-        .filter(EventoBusquedaProducto.creado_en >= start, EventoBusquedaProducto.creado_en < end)
-        .all()
-    )
-
-    total_searches = len(eventos)
     hourly_counts = {hour: 0 for hour in range(24)}
 
-    def to_local_hour(dt: datetime, offset_min: int) -> int:
-        return ((dt + timedelta(minutes=offset_min)).hour) % 24
+    # Búsquedas por hora local, agrupadas en la base: las horas completas desde el
+    # resumen por hora y los bordes de la ventana desde los eventos
+    dialecto = db.get_bind().dialect.name
+    tramo, bordes = _partir_ventana(start, end, timezone_offset_minutes)
+    consultas = []
+    if tramo:
+        consultas.append(
+            db.query(
+                hora_local(dialecto, ResumenHoraBusquedas.hora, timezone_offset_minutes),
+                func.sum(ResumenHoraBusquedas.busquedas),
+            )
+            .filter(ResumenHoraBusquedas.hora >= tramo[0], ResumenHoraBusquedas.hora < tramo[1])
+            .group_by("hora_local")
+        )
+    for desde, hasta in bordes:
+        consultas.append(
+            db.query(hora_local(dialecto, EventoBusquedaProducto.creado_en, timezone_offset_minutes), func.count())
+            .filter(EventoBusquedaProducto.creado_en >= desde, EventoBusquedaProducto.creado_en < hasta)
+            .group_by("hora_local")
+        )
+    for consulta in consultas:
+        for hour, busquedas in consulta.all():
+            hourly_counts[hour] += busquedas
 
-    for (fecha_evento,) in eventos:
-        hora_local = to_local_hour(fecha_evento, timezone_offset_minutes)
-        hourly_counts[hora_local] += 1
+    total_searches = sum(hourly_counts.values())
 
     hourly_distribution = []
     for hour in range(24):
@@ -465,34 +498,67 @@ def most_requested_categories(
     if start is None:
         start = end - timedelta(days=30)
 
-    estados_validos = [
-        EstadoCompra.PAGADO,
-        EstadoCompra.EN_PREPARACION,
-        EstadoCompra.LISTO,
-        EstadoCompra.ENTREGADO,
-    ]
-
-    query = (
-        db.query(
-            TipoProducto.id.label("categoria_id"),
-            TipoProducto.nombre.label("categoria_nombre"),
-            func.count(func.distinct(Compra.id)).label("total_orders"),
-            func.coalesce(func.sum(DetalleCompra.cantidad), 0).label("total_units"),
-            func.coalesce(
-                func.sum(DetalleCompra.cantidad * DetalleCompra.precio_unitario_compra), 0.0
-            ).label("total_revenue"),
+    # Totales por categoría de cada tramo: las horas completas desde el resumen por
+    # hora y los bordes desde los detalles de compra. Cada compra cae en un solo
+    # tramo, así que las órdenes distintas de cada uno se pueden sumar.
+    tramo, bordes = _partir_ventana(start, end)
+    consultas = []
+    if tramo:
+        consultas.append(
+            db.query(
+                TipoProducto.id.label("categoria_id"),
+                TipoProducto.nombre.label("categoria_nombre"),
+                func.sum(ResumenHoraCategoria.ordenes).label("total_orders"),
+                func.sum(ResumenHoraCategoria.unidades).label("total_units"),
+                func.sum(ResumenHoraCategoria.ingresos).label("total_revenue"),
+            )
+            .select_from(ResumenHoraCategoria)
+            .join(TipoProducto, TipoProducto.id == ResumenHoraCategoria.id_tipo)
+            .filter(ResumenHoraCategoria.hora >= tramo[0], ResumenHoraCategoria.hora < tramo[1])
+            .group_by(TipoProducto.id, TipoProducto.nombre)
+        )
+    for desde, hasta in bordes:
+        consultas.append(
+            db.query(
+                TipoProducto.id.label("categoria_id"),
+                TipoProducto.nombre.label("categoria_nombre"),
+                func.count(func.distinct(Compra.id)).label("total_orders"),
+                func.coalesce(func.sum(DetalleCompra.cantidad), 0).label("total_units"),
+                func.coalesce(
+                    func.sum(DetalleCompra.cantidad * DetalleCompra.precio_unitario_compra), 0.0
+                ).label("total_revenue"),
+            )
+            .select_from(TipoProducto)
+            .join(Producto, Producto.id_tipo == TipoProducto.id)
+            .join(DetalleCompra, DetalleCompra.id_producto == Producto.id)
+            .join(Compra, Compra.id == DetalleCompra.id_compra)
+            .filter(Compra.fecha_hora >= desde, Compra.fecha_hora < hasta)
+            .filter(Compra.estado.in_(ESTADOS_VALIDOS))
+            .group_by(TipoProducto.id, TipoProducto.nombre)
         )
-        .select_from(TipoProducto)
-        .join(Producto, Producto.id_tipo == TipoProducto.id)
-        .join(DetalleCompra, DetalleCompra.id_producto == Producto.id)
-        .join(Compra, Compra.id == DetalleCompra.id_compra)
-        .filter(Compra.fecha_hora >= start, Compra.fecha_hora < end)
-        .filter(Compra.estado.in_(estados_validos))
-        .group_by(TipoProducto.id, TipoProducto.nombre)
-        .order_by(desc("total_orders"), desc("total_units"))
-    )
 
-    rows = query.all()
+    totales: Dict[int, List] = {}
+    for consulta in consultas:
+        for row in consulta.all():
+            acumulado = totales.setdefault(row.categoria_id, [row.categoria_nombre, 0, 0, 0.0])
+            acumulado[1] += row.total_orders
+            acumulado[2] += int(row.total_units or 0)
+            acumulado[3] += float(row.total_revenue or 0.0)
+
+    rows = sorted(
+        (
+            SimpleNamespace(
+                categoria_id=categoria_id,
+                categoria_nombre=nombre,
+                total_orders=ordenes,
+                total_units=unidades,
+                total_revenue=ingresos,
+            )
+            for categoria_id, (nombre, ordenes, unidades, ingresos) in totales.items()
+        ),
+        key=lambda row: (row.total_orders, row.total_units),
+        reverse=True,
+    )
     if not rows:
         return MostRequestedCategoriesResponse(
             start=start,
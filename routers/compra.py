@@ -1,158 +1,569 @@
+import base64
 import hashlib
 import uuid
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy.exc import IntegrityError
-from database import get_db
-from models import Usuario, Compra, DetalleCompra, Producto, QR, EstadoCompra, EstadoQR
+from database import engine, ejecutar_escritura, get_async_db, SessionLocal
+from models import Usuario, Compra, DetalleCompra, Producto, QR, EstadoCompra, EstadoQR, TipoMovimientoSaldo
 from schemas import (
     CompraCreate, 
     CompraResponse, 
     CompraEstadoUpdate,
+    CompraEstadoLoteUpdate,
+    CompraEstadoLoteResponse,
+    ResultadoTransicion,
     QREscanear,
     QRResponse
 )
 from auth import get_current_user
+from routers.producto import menu_index
+from services.order_events import hub, CANAL_STAFF, RESYNC, canal_usuario, formatear_evento_sse
+from services.http_cache import calcular_etag, etag_coincide, respuesta_no_modificada
+from services.analytics_rollups import sumar_compra
+from services.popularity import upsert_popularidad
+from services.qr_redemption import QR_INDICE_MEMORIA, canjear_qr, diagnosticar_qr, entregar_compra, qr_index
+from services.recommendations import recommendation_engine
+from services.wallet import a_centavos, debitar_saldo, registrar_movimiento
 
 router = APIRouter(prefix="/compras", tags=["compras"])
 
+# Estrategia de carga para serializar CompraResponse con un número fijo de consultas:
+# los detalles (uno-a-muchos) van en un SELECT ... IN aparte, y su producto/tipo
+# (muchos-a-uno) y el QR (uno-a-uno) se resuelven con JOINs.
+CARGA_COMPRA_COMPLETA = (
+    selectinload(Compra.detalles)
+    .joinedload(DetalleCompra.producto)
+    .joinedload(Producto.tipo_producto),
+    joinedload(Compra.qr),
+)
+
+ESTADOS_PENDIENTES = [EstadoCompra.PAGADO, EstadoCompra.EN_PREPARACION]
+
+# Transiciones de estado permitidas para el staff
+TRANSICIONES_VALIDAS = {
+    EstadoCompra.PAGADO: [EstadoCompra.EN_PREPARACION],
+    EstadoCompra.EN_PREPARACION: [EstadoCompra.LISTO],
+    EstadoCompra.LISTO: [EstadoCompra.ENTREGADO]
+}
+
+# Timestamp que se registra al llegar a cada estado
+FECHA_POR_ESTADO = {
+    EstadoCompra.EN_PREPARACION: "fecha_en_preparacion",
+    EstadoCompra.LISTO: "fecha_listo",
+    EstadoCompra.ENTREGADO: "fecha_entregado",
+}
+
+# Máximo de compras por request en PUT /compras/estado
+MAX_COMPRAS_POR_LOTE = 200
+
+# Si no hay eventos, se envía un comentario SSE para mantener viva la conexión
+INTERVALO_KEEPALIVE_SEGUNDOS = 15
+
+def serializar_compra(compra: Compra) -> dict:
+    """Serializar una compra como la devuelve la API (JSON-compatible)"""
+    return CompraResponse.model_validate(compra).model_dump(mode="json")
+
+def publicar_compra(tipo: str, compra: Compra) -> None:
+    """Notificar un cambio en una compra a las pantallas del staff y al dueño de la compra"""
+    publicar_serializada(tipo, compra.id_usuario, serializar_compra(compra))
+
+def publicar_serializada(tipo: str, usuario_id: int, data: dict) -> None:
+    """Como `publicar_compra`, con la compra ya serializada"""
+    hub.publicar(CANAL_STAFF, tipo, data)
+    hub.publicar(canal_usuario(usuario_id), tipo, data)
+
+def hay_suscriptores(usuario_id: int) -> bool:
+    """True si alguna pantalla del staff o del dueño recibiría un evento de sus compras"""
+    return bool(hub.total_suscriptores(CANAL_STAFF) or hub.total_suscriptores(canal_usuario(usuario_id)))
+
+def publicar_compras_expiradas(compra_ids: List[int]) -> None:
+    """
+    Emitir `compra_actualizada` por cada compra cuyo QR pasó a EXPIRADO. Lo llama el
+    barrido de expiración desde su hilo (ver services/qr_expiry.py), con el lote ya confirmado.
+    """
+    with SessionLocal() as db:
+        usuarios = db.execute(select(Compra.id, Compra.id_usuario).where(Compra.id.in_(compra_ids))).all()
+        a_publicar = [compra_id for compra_id, usuario_id in usuarios if hay_suscriptores(usuario_id)]
+        if not a_publicar:
+            return
+        compras = db.scalars(select(Compra).options(*CARGA_COMPRA_COMPLETA).where(Compra.id.in_(a_publicar))).all()
+        serializadas = [(compra.id_usuario, serializar_compra(compra)) for compra in compras]
+    for usuario_id, data in serializadas:
+        publicar_serializada("compra_actualizada", usuario_id, data)
+
+async def cargar_compra(db: AsyncSession, compra_id: int) -> Optional[Compra]:
+    """Obtener una compra con todo lo que necesita CompraResponse ya cargado"""
+    return await db.scalar(
+        select(Compra)
+        .options(*CARGA_COMPRA_COMPLETA)
+        .where(Compra.id == compra_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def etag_pagina(compras: Sequence[Compra], *parametros: object) -> str:
+    """
+    ETag de una página del historial, calculado de las compras ya cargadas: no agrega
+    consultas a la de la página.
+
+    Toda transición de estado registra su fecha_* y el QR solo puede dejar de estar
+    ACTIVO, así que (id, estado, fechas, estado del QR) de cada compra cambian cuando
+    cambia lo que se serializa de ella; la fila extra que se pide para saber si hay
+    página siguiente también entra. Cada detalle trae el producto actual (nombre,
+    precio, imagen, tipo), así que también entra la versión del menú: editar un
+    producto cambia el ETag.
+    """
+    if not menu_index.vigente():
+        await run_in_threadpool(menu_index.asegurar_cargado)
+    filas = [
+        (
+            compra.id,
+            compra.estado.value,
+            compra.fecha_en_preparacion,
+            compra.fecha_listo,
+            compra.fecha_entregado,
+            compra.qr.estado.value if compra.qr else None,
+        )
+        for compra in compras
+    ]
+    return calcular_etag(menu_index.version, *parametros, *filas)
+
 def generar_codigo_qr() -> str:
     """Generar un código QR único"""
     unique_id = str(uuid.uuid4())
     return hashlib.sha256(unique_id.encode()).hexdigest()
 
+def codificar_cursor(fecha_hora: datetime, compra_id: int) -> str:
+    """Cursor opaco para paginar por (fecha_hora, id)"""
+    crudo = f"{fecha_hora.isoformat()}|{compra_id}"
+    return base64.urlsafe_b64encode(crudo.encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decodificar un cursor generado por `codificar_cursor`"""
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        crudo = base64.urlsafe_b64decode(cursor + relleno).decode()
+        fecha_iso, compra_id = crudo.rsplit("|", 1)
+        return datetime.fromisoformat(fecha_iso), int(compra_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Cursor de paginación inválido"
+        )
+
 @router.get("/me", response_model=List[CompraResponse])
-def obtener_historial_compras(
+async def obtener_historial_compras(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = Query(None, description="Cursor devuelto en el header X-Next-Cursor de la página anterior"),
+    limit: int = Query(20, ge=1, le=100, description="Compras por página; el resto se pide con el cursor"),
+    since: Optional[datetime] = Query(None, description="Start datetime (inclusive) in UTC"),
+    until: Optional[datetime] = Query(None, description="End datetime (exclusive) in UTC"),
+    count: bool = Query(False, description="Incluir X-Total-Count (recorre todo el historial filtrado)"),
+    if_none_match: Optional[str] = Header(None),
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Obtener el historial de compras del usuario autenticado"""
-    compras = db.query(Compra).filter(
-        Compra.id_usuario == current_user.id,
-        Compra.estado != EstadoCompra.CARRITO
-    ).all()
+    """
+    Obtener el historial de compras del usuario autenticado, de la más reciente a la más antigua.
+
+    Paginación por cursor sobre (fecha_hora, id), `limit` compras por página (20 por
+    defecto): la consulta de la página es todo el costo de la request, sin importar
+    cuán largo sea el historial. Si hay más resultados, `X-Next-Cursor` y
+    `Link: <...>; rel="next"` apuntan a la siguiente página. Con `count=true` se agrega
+    `X-Total-Count` (cuántas compras hay con esos filtros), que sí recorre el historial.
+    Soporta `If-None-Match`: responde 304 sin cuerpo si la página no cambió.
+    """
+    filtros = [Compra.id_usuario == current_user.id, Compra.estado != EstadoCompra.CARRITO]
+    if since:
+        filtros.append(Compra.fecha_hora >= since)
+    if until:
+        filtros.append(Compra.fecha_hora < until)
+    query = select(Compra).options(*CARGA_COMPRA_COMPLETA).where(*filtros)
+    
+    if cursor:
+        fecha_cursor, id_cursor = decodificar_cursor(cursor)
+        query = query.where(or_(
+            Compra.fecha_hora < fecha_cursor,
+            and_(Compra.fecha_hora == fecha_cursor, Compra.id < id_cursor)
+        ))
+    
+    # Se pide una fila extra para saber si existe una página siguiente
+    compras = (await db.scalars(
+        query.order_by(Compra.fecha_hora.desc(), Compra.id.desc()).limit(limit + 1)
+    )).all()
+    
+    # Total sin el cursor, solo si se pide: cuesta una pasada por todo el historial filtrado
+    total = await db.scalar(select(func.count(Compra.id)).where(*filtros)) if count else None
+    
+    etag = await etag_pagina(compras, current_user.id, cursor, limit, since, until, total)
+    if etag_coincide(if_none_match, etag):
+        return respuesta_no_modificada(etag)
+    response.headers["ETag"] = etag
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    
+    if len(compras) > limit:
+        compras = compras[:limit]
+        ultima = compras[-1]
+        siguiente = codificar_cursor(ultima.fecha_hora, ultima.id)
+        response.headers["X-Next-Cursor"] = siguiente
+        response.headers["Link"] = f'<{request.url.include_query_params(cursor=siguiente)}>; rel="next"'
+    
     return compras
 
-@router.post("/", response_model=CompraResponse, status_code=status.HTTP_201_CREATED)
-def crear_compra(
-    compra_data: CompraCreate,
+@router.get("/me/stream")
+async def stream_mis_compras(
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Endpoint principal de negocio. Crear una nueva compra.
-    Procesa el pago y genera el QR para la orden.
+    Cambios de estado de las compras del usuario autenticado (Server-Sent Events).
+
+    Emite `compra_creada` / `compra_actualizada` con la compra completa cada vez que
+    cambia una compra del usuario. Si el cliente pierde eventos recibe `resync` y
+    debe volver a consultar `/compras/me`.
     """
-    if not compra_data.productos:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="La compra debe tener al menos un producto"
-        )
-    
-    # Calcular el total y verificar disponibilidad de productos
-    total = 0.0
-    productos_verificados = []
-    
-    for item in compra_data.productos:
-        if item.cantidad <= 0:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="La cantidad debe ser mayor a 0"
-            )
+    usuario_id = current_user.id
+    # La conexión puede durar horas: se libera la sesión ya, en lugar de al cerrar el stream
+    await db.close()
+
+    async def eventos():
+        suscripcion = hub.suscribir(canal_usuario(usuario_id))
+        try:
+            while True:
+                evento = await suscripcion.siguiente(INTERVALO_KEEPALIVE_SEGUNDOS)
+                if evento is None:
+                    yield ": keepalive\n\n"
+                elif evento is RESYNC:
+                    yield formatear_evento_sse("resync", {})
+                else:
+                    yield evento
+        finally:
+            hub.cancelar(suscripcion)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sumar_venta(sesion: Session, compra: Compra, cantidades: Dict[int, int], productos_verificados: List[dict]) -> None:
+    """Contadores derivados de una compra (sin commit)."""
+    sesion.execute(upsert_popularidad(engine.dialect.name, cantidades))
+    # fecha_hora ya viene del INSERT (RETURNING): la hora es la misma que guarda la compra
+    lineas = [
+        (item["producto"].id_tipo, item["cantidad"], item["producto"].precio) for item in productos_verificados
+    ]
+    for sentencia, parametros in sumar_compra(engine.dialect.name, compra.fecha_hora, compra.total, lineas):
+        sesion.execute(sentencia, parametros)
+
+def _registrar_compra(sesion: Session, id_usuario: int, cantidades: Dict[int, int]) -> Tuple[Compra, str]:
+    """
+    Verificar los productos, cobrar y registrar una compra, con commit. Retorna la
+    compra ya cargada para CompraResponse y su código QR; lanza HTTPException (después
+    del rollback) si un producto no existe o no está disponible, o si el saldo no alcanza.
+
+    Se ejecuta con `ejecutar_escritura`: toda la transacción en un solo paso, y la
+    conexión se devuelve al pool con el commit.
+    """
+    try:
+        # Resolver todos los productos del carrito en una sola consulta
+        productos = {
+            producto.id: producto
+            for producto in sesion.scalars(select(Producto).where(Producto.id.in_(list(cantidades)))).all()
+        }
         
-        producto = db.query(Producto).filter(Producto.id == item.id_producto).first()
-        if not producto:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Producto con ID {item.id_producto} no encontrado"
-            )
+        # Calcular el total y verificar disponibilidad de productos
+        total = 0.0
+        productos_verificados = []
+        
+        for id_producto, cantidad in cantidades.items():
+            producto = productos.get(id_producto)
+            if not producto:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Producto con ID {id_producto} no encontrado"
+                )
+            
+            if not producto.disponible:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"El producto '{producto.nombre}' no está disponible"
+                )
+            
+            subtotal = producto.precio * cantidad
+            total += subtotal
+            
+            productos_verificados.append({
+                "producto": producto,
+                "cantidad": cantidad,
+                "subtotal": subtotal
+            })
+        
+        # Total en centavos exactos: el mismo valor se descuenta del saldo y va al libro
+        total = a_centavos(total) / 100
         
-        if not producto.disponible:
+        # Descontar el saldo solo si alcanza, en un único UPDATE condicional: dos compras
+        # simultáneas no pueden gastar el mismo saldo (ver services/wallet.py)
+        saldo_restante = sesion.execute(debitar_saldo(id_usuario, total)).scalar_one_or_none()
+        if saldo_restante is None:
+            saldo_actual = sesion.scalar(select(Usuario.saldo).where(Usuario.id == id_usuario))
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"El producto '{producto.nombre}' no está disponible"
+                detail=f"Saldo insuficiente. Necesitas ${total:.2f}, tienes ${saldo_actual:.2f}"
             )
         
-        subtotal = producto.precio * item.cantidad
-        total += subtotal
-        
-        productos_verificados.append({
-            "producto": producto,
-            "cantidad": item.cantidad,
-            "subtotal": subtotal
-        })
-    
-    # Verificar que el usuario tenga saldo suficiente
-    if current_user.saldo < total:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Saldo insuficiente. Necesitas ${total:.2f}, tienes ${current_user.saldo:.2f}"
-        )
-    
-    try:
         # Crear la compra
         nueva_compra = Compra(
-            id_usuario=current_user.id,
+            id_usuario=id_usuario,
             total=total,
             estado=EstadoCompra.PAGADO
         )
-        db.add(nueva_compra)
-        db.flush()  # Para obtener el ID de la compra
+        sesion.add(nueva_compra)
+        sesion.flush()  # Para obtener el ID de la compra
         
-        # Crear los detalles de la compra
-        for item in productos_verificados:
-            detalle = DetalleCompra(
-                id_compra=nueva_compra.id,
-                id_producto=item["producto"].id,
-                cantidad=item["cantidad"],
-                precio_unitario_compra=item["producto"].precio
-            )
-            db.add(detalle)
+        # Movimiento del libro de saldos, con el saldo que dejó el UPDATE de arriba
+        sesion.execute(registrar_movimiento(
+            id_usuario, TipoMovimientoSaldo.COMPRA, -total, saldo_restante, id_compra=nueva_compra.id
+        ))
+        
+        # Crear los detalles de la compra en un único INSERT multi-fila
+        sesion.execute(
+            insert(DetalleCompra),
+            [
+                {
+                    "id_compra": nueva_compra.id,
+                    "id_producto": item["producto"].id,
+                    "cantidad": item["cantidad"],
+                    "precio_unitario_compra": item["producto"].precio,
+                }
+                for item in productos_verificados
+            ]
+        )
         
         # Generar y guardar el QR
         codigo_qr = generar_codigo_qr()
-        qr = QR(
-            id_compra=nueva_compra.id,
-            codigo_qr_hash=codigo_qr,
-            estado=EstadoQR.ACTIVO
+        sesion.execute(
+            insert(QR).values(
+                id_compra=nueva_compra.id,
+                codigo_qr_hash=codigo_qr,
+                estado=EstadoQR.ACTIVO
+            )
         )
-        db.add(qr)
-        
-        # Descontar el saldo del usuario
-        current_user.saldo -= total
         
-        # Confirmar la transacción
-        db.commit()
-        db.refresh(nueva_compra)
+        # Sumar la venta a los contadores de popularidad y a los resúmenes por hora
+        # de /analytics (mismo commit que la compra)
+        _sumar_venta(sesion, nueva_compra, cantidades, productos_verificados)
         
-        return nueva_compra
+        # Cargar la respuesta antes del commit: después ya no se vuelve a pedir una conexión
+        compra = sesion.scalar(
+            select(Compra).options(*CARGA_COMPRA_COMPLETA).where(Compra.id == nueva_compra.id)
+            .execution_options(populate_existing=True)
+        )
         
+        # Confirmar la transacción
+        sesion.commit()
+    except Exception:
+        sesion.rollback()
+        raise
+    return compra, codigo_qr
+
+@router.post("/", response_model=CompraResponse, status_code=status.HTTP_201_CREATED)
+async def crear_compra(
+    compra_data: CompraCreate,
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Endpoint principal de negocio. Crear una nueva compra.
+    Procesa el pago y genera el QR para la orden.
+    """
+    if not compra_data.productos:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La compra debe tener al menos un producto"
+        )
+    
+    # Validar cantidades y agrupar líneas repetidas del mismo producto
+    # (la PK de detalles_compra es (id_compra, id_producto))
+    cantidades: Dict[int, int] = {}
+    for item in compra_data.productos:
+        if item.cantidad <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="La cantidad debe ser mayor a 0"
+            )
+        cantidades[item.id_producto] = cantidades.get(item.id_producto, 0) + item.cantidad
+    
+    try:
+        nueva_compra, codigo_qr = await ejecutar_escritura(db, _registrar_compra, current_user.id, cantidades)
     except IntegrityError:
-        db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error al procesar la compra"
         )
+    
+    publicar_compra("compra_creada", nueva_compra)
+    qr_index.agregar(codigo_qr)
+    recommendation_engine.registrar_compra(nueva_compra.id, cantidades, nueva_compra.fecha_hora)
+    
+    return nueva_compra
+
+CONSULTA_PENDIENTES = select(Compra).options(*CARGA_COMPRA_COMPLETA).where(
+    Compra.estado.in_(ESTADOS_PENDIENTES)
+)
 
 @router.get("/pendientes", response_model=List[CompraResponse])
-def listar_compras_pendientes(db: Session = Depends(get_db)):
+async def listar_compras_pendientes(db: AsyncSession = Depends(get_async_db)):
     """(Staff) Listar todas las compras con estado 'PAGADO' o 'EN_PREPARACION'"""
-    compras = db.query(Compra).filter(
-        Compra.estado.in_([EstadoCompra.PAGADO, EstadoCompra.EN_PREPARACION])
-    ).all()
+    compras = (await db.scalars(CONSULTA_PENDIENTES)).all()
     return compras
 
+def snapshot_compras_pendientes() -> List[dict]:
+    """Compras pendientes serializadas, con una sesión síncrona propia de corta duración"""
+    db = SessionLocal()
+    try:
+        return [serializar_compra(compra) for compra in db.scalars(CONSULTA_PENDIENTES).all()]
+    finally:
+        db.close()
+
+@router.get("/pendientes/stream")
+async def stream_compras_pendientes():
+    """
+    (Staff) Feed en tiempo real de órdenes (Server-Sent Events).
+
+    Envía primero un evento `snapshot` con las compras pendientes y luego eventos
+    `compra_creada` / `compra_actualizada` a medida que ocurren. Los eventos traen la
+    compra completa (como `CompraResponse`), así que el cliente debe aplicarlos por `id`.
+    Si el cliente se retrasa demasiado, recibe un `snapshot` nuevo.
+    """
+    async def eventos():
+        suscripcion = hub.suscribir(CANAL_STAFF)
+        try:
+            snapshot = await run_in_threadpool(snapshot_compras_pendientes)
+            yield formatear_evento_sse("snapshot", snapshot)
+            while True:
+                evento = await suscripcion.siguiente(INTERVALO_KEEPALIVE_SEGUNDOS)
+                if evento is None:
+                    yield ": keepalive\n\n"
+                elif evento is RESYNC:
+                    snapshot = await run_in_threadpool(snapshot_compras_pendientes)
+                    yield formatear_evento_sse("snapshot", snapshot)
+                else:
+                    yield evento
+        finally:
+            hub.cancelar(suscripcion)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _transicionar_lote(sesion: Session, compra_ids: List[int], nuevo_estado: EstadoCompra):
+    """
+    Pasar al nuevo estado todas las compras de `compra_ids` que estén en un estado
+    de origen válido, con commit: un UPDATE por estado de origen. Retorna el estado
+    anterior de cada compra actualizada, el estado actual de las rechazadas y las
+    actualizadas serializadas para el SSE (solo si hay pantallas escuchando).
+    """
+    ahora = datetime.utcnow()
+    anteriores: Dict[int, EstadoCompra] = {}
+    usuarios: Dict[int, int] = {}
+    for estado_origen, destinos in TRANSICIONES_VALIDAS.items():
+        if nuevo_estado not in destinos:
+            continue
+        filas = sesion.execute(
+            update(Compra)
+            .where(Compra.id.in_(compra_ids), Compra.estado == estado_origen)
+            .values({Compra.estado: nuevo_estado, FECHA_POR_ESTADO[nuevo_estado]: ahora})
+            .returning(Compra.id, Compra.id_usuario)
+        ).all()
+        for compra_id, usuario_id in filas:
+            anteriores[compra_id] = estado_origen
+            usuarios[compra_id] = usuario_id
+
+    restantes = [compra_id for compra_id in compra_ids if compra_id not in anteriores]
+    rechazadas: Dict[int, EstadoCompra] = {}
+    if restantes:
+        rechazadas = dict(sesion.execute(select(Compra.id, Compra.estado).where(Compra.id.in_(restantes))).all())
+
+    a_publicar = [compra_id for compra_id, usuario_id in usuarios.items() if hay_suscriptores(usuario_id)]
+    serializadas = []
+    if a_publicar:
+        compras = sesion.scalars(
+            select(Compra).options(*CARGA_COMPRA_COMPLETA).where(Compra.id.in_(a_publicar))
+            .execution_options(populate_existing=True)
+        ).all()
+        serializadas = [(compra.id_usuario, serializar_compra(compra)) for compra in compras]
+    sesion.commit()
+    return anteriores, rechazadas, serializadas
+
+@router.put("/estado", response_model=CompraEstadoLoteResponse)
+async def actualizar_estado_compras(
+    estado_update: CompraEstadoLoteUpdate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    (Staff) Actualizar el estado de varias compras a la vez (p. ej. una bandeja lista).
+
+    Aplica las mismas transiciones que `PUT /compras/{compra_id}/estado`, con un
+    solo UPDATE por estado de origen en vez de una request por compra. Las compras
+    que no existen o no pueden pasar al estado pedido se informan en `resultados`
+    sin afectar a las demás.
+    """
+    compra_ids = list(dict.fromkeys(estado_update.compra_ids))
+    if not compra_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Debe indicar al menos una compra"
+        )
+    if len(compra_ids) > MAX_COMPRAS_POR_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Se pueden actualizar hasta {MAX_COMPRAS_POR_LOTE} compras por request"
+        )
+    
+    nuevo_estado = estado_update.estado
+    # UPDATEs y commit en un solo paso (ver ejecutar_escritura)
+    anteriores, rechazadas, serializadas = await ejecutar_escritura(db, _transicionar_lote, compra_ids, nuevo_estado)
+    
+    for usuario_id, data in serializadas:
+        publicar_serializada("compra_actualizada", usuario_id, data)
+    
+    resultados = []
+    for compra_id in compra_ids:
+        if compra_id in anteriores:
+            resultados.append(ResultadoTransicion(
+                compra_id=compra_id, actualizada=True, estado_anterior=anteriores[compra_id]
+            ))
+        elif compra_id in rechazadas:
+            estado_actual = rechazadas[compra_id]
+            resultados.append(ResultadoTransicion(
+                compra_id=compra_id, actualizada=False, estado_anterior=estado_actual,
+                detalle=f"No se puede cambiar de estado {estado_actual.value} a {nuevo_estado.value}"
+            ))
+        else:
+            resultados.append(ResultadoTransicion(
+                compra_id=compra_id, actualizada=False, detalle="Compra no encontrada"
+            ))
+    return CompraEstadoLoteResponse(estado=nuevo_estado, actualizadas=len(anteriores), resultados=resultados)
+
 @router.put("/{compra_id}/estado", response_model=CompraResponse)
-def actualizar_estado_compra(
+async def actualizar_estado_compra(
     compra_id: int,
     estado_update: CompraEstadoUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """(Staff) Actualizar el estado de una compra"""
-    from datetime import datetime
-    
-    compra = db.query(Compra).filter(Compra.id == compra_id).first()
+    compra = await cargar_compra(db, compra_id)
     if not compra:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -163,72 +574,108 @@ def actualizar_estado_compra(
     estado_actual = compra.estado
     nuevo_estado = estado_update.estado
     
-    transiciones_validas = {
-        EstadoCompra.PAGADO: [EstadoCompra.EN_PREPARACION],
-        EstadoCompra.EN_PREPARACION: [EstadoCompra.LISTO],
-        EstadoCompra.LISTO: [EstadoCompra.ENTREGADO]
-    }
-    
-    if estado_actual not in transiciones_validas or nuevo_estado not in transiciones_validas[estado_actual]:
+    if nuevo_estado not in TRANSICIONES_VALIDAS.get(estado_actual, []):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"No se puede cambiar de estado {estado_actual.value} a {nuevo_estado.value}"
         )
     
-    # Actualizar estado y registrar timestamp (usando UTC para consistencia)
+    # Actualizar estado y registrar el timestamp del nuevo estado (UTC para consistencia)
     compra.estado = nuevo_estado
+    setattr(compra, FECHA_POR_ESTADO[nuevo_estado], datetime.utcnow())
     
-    # Registrar el timestamp según el nuevo estado
-    if nuevo_estado == EstadoCompra.EN_PREPARACION:
-        compra.fecha_en_preparacion = datetime.utcnow()
-    elif nuevo_estado == EstadoCompra.LISTO:
-        compra.fecha_listo = datetime.utcnow()
-    elif nuevo_estado == EstadoCompra.ENTREGADO:
-        compra.fecha_entregado = datetime.utcnow()
+    await db.commit()
     
-    db.commit()
-    db.refresh(compra)
+    publicar_compra("compra_actualizada", compra)
     
     return compra
 
+def _canjear(sesion: Session, codigo: str):
+    """
+    Canjear el QR y entregar la orden, con commit. Retorna la fila de
+    `entregar_compra` y la compra serializada si hay pantallas escuchando, o None
+    (después del rollback) si el QR no se pudo canjear.
+    """
+    id_compra = sesion.scalar(canjear_qr(codigo))
+    if id_compra is None:
+        sesion.rollback()
+        return None
+    # Registrar timestamp de entrega (UTC)
+    fila = sesion.execute(entregar_compra(id_compra, datetime.utcnow())).first()
+    if fila is None:
+        sesion.rollback()
+        return None
+    data = None
+    if hay_suscriptores(fila.id_usuario):
+        # Se serializa antes del commit, dentro de la misma transacción; se publica después
+        compra = sesion.scalar(
+            select(Compra).options(*CARGA_COMPRA_COMPLETA).where(Compra.id == id_compra)
+            .execution_options(populate_existing=True)
+        )
+        data = serializar_compra(compra)
+    sesion.commit()
+    return fila, data
+
 @router.post("/qr/escanear", response_model=dict)
-def escanear_qr(
+async def escanear_qr(
     qr_data: QREscanear,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """(Staff) Recibir un codigo_qr_hash, verificarlo y procesar la entrega"""
-    from datetime import datetime
-    
-    qr = db.query(QR).filter(QR.codigo_qr_hash == qr_data.codigo_qr_hash).first()
-    if not qr:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Código QR no válido"
-        )
-    
-    if qr.estado != EstadoQR.ACTIVO:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"El código QR ya fue {qr.estado.value.lower()}"
-        )
-    
-    compra = qr.compra
-    if compra.estado != EstadoCompra.LISTO:
+    """
+    (Staff) Recibir un codigo_qr_hash, verificarlo y procesar la entrega.
+
+    El canje son dos UPDATE condicionales en la misma transacción (QR ACTIVO →
+    CANJEADO si la orden está LISTO, y la orden LISTO → ENTREGADO) que retornan
+    lo que muestra la puerta; solo si no aplican se consulta el estado para el
+    mensaje de error. Los códigos ya usados se rechazan con el índice en memoria
+    sin consultar la base; uno que el índice no conoce se busca por su hash.
+    """
+    codigo = qr_data.codigo_qr_hash
+    if QR_INDICE_MEMORIA:
+        estado_qr = qr_index.estado(codigo)
+        if estado_qr is None:
+            # Desconocido para el índice (p. ej. creado en otro worker): una consulta por código
+            estado_qr = await run_in_threadpool(qr_index.buscar, codigo)
+        if estado_qr is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Código QR no válido"
+            )
+        if estado_qr != EstadoQR.ACTIVO:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"El código QR ya fue {estado_qr.value.lower()}"
+            )
+
+    # Todo el canje, commit incluido, en un solo paso (ver ejecutar_escritura)
+    entregada = await ejecutar_escritura(db, _canjear, codigo)
+    if entregada is None:
+        diagnostico = (await db.execute(diagnosticar_qr(codigo))).first()
+        if diagnostico is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Código QR no válido"
+            )
+        estado_qr, estado_compra = diagnostico
+        if estado_qr != EstadoQR.ACTIVO:
+            qr_index.marcar(codigo, estado_qr)
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"El código QR ya fue {estado_qr.value.lower()}"
+            )
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"La orden no está lista para entregar. Estado actual: {compra.estado.value}"
+            detail=f"La orden no está lista para entregar. Estado actual: {estado_compra.value}"
         )
-    
-    # Marcar QR como canjeado y compra como entregada
-    qr.estado = EstadoQR.CANJEADO
-    compra.estado = EstadoCompra.ENTREGADO
-    compra.fecha_entregado = datetime.utcnow()  # Registrar timestamp de entrega (UTC)
-    
-    db.commit()
-    
+
+    qr_index.marcar(codigo, EstadoQR.CANJEADO)
+    (compra_id, id_usuario, total, cliente), data = entregada
+    if data is not None:
+        publicar_serializada("compra_actualizada", id_usuario, data)
+
     return {
         "mensaje": "Orden entregada exitosamente",
-        "compra_id": compra.id,
-        "cliente": compra.usuario.nombre,
-        "total": compra.total
+        "compra_id": compra_id,
+        "cliente": cliente,
+        "total": float(total)
     }
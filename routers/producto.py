@@ -1,9 +1,13 @@
+import os
 from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
-from database import get_db
-from models import Producto, TipoProducto, DetalleCompra, EventoBusquedaProducto
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select
+from database import engine, SessionLocal, get_db, get_async_db
+from auth import get_current_user
+from models import Producto, TipoProducto, PopularidadProducto, Usuario
 from schemas import (
     ProductoResponse, 
     ProductoCreate, 
@@ -11,111 +15,204 @@ from schemas import (
     TipoProductoResponse,
     TipoProductoCreate
 )
+from services.menu_index import MenuIndex
+from services.popularity import PopularityRanking
+from services.personal_recommendations import personal_recommender
+from services.recommendations import recommendation_engine
+from services.search_events import SearchEventWriter
 
 router = APIRouter(prefix="/productos", tags=["productos"])
 
+# Los eventos de búsqueda se guardan en lote desde un hilo de fondo (ver SearchEventWriter)
+search_event_writer = SearchEventWriter(
+    engine,
+    max_cola=int(os.getenv("SEARCH_EVENTS_MAX_QUEUE", "10000")),
+    tamano_lote=int(os.getenv("SEARCH_EVENTS_BATCH_SIZE", "500")),
+    intervalo=float(os.getenv("SEARCH_EVENTS_FLUSH_SECONDS", "1.0")),
+)
+
+# ProductoResponse incluye el tipo: se carga con JOIN para no depender de lazy loading
+# (que no está disponible con AsyncSession)
+CARGA_TIPO = joinedload(Producto.tipo_producto)
+
+async def _producto_con_tipo(db: AsyncSession, producto_id: int) -> Optional[Producto]:
+    """Obtener un producto junto con su tipo"""
+    return await db.scalar(
+        select(Producto).options(CARGA_TIPO).where(Producto.id == producto_id)
+    )
+
+def _cargar_menu():
+    """Leer productos y tipos completos para el índice del menú"""
+    with SessionLocal() as db:
+        productos = db.scalars(select(Producto).options(CARGA_TIPO)).all()
+        tipos = db.scalars(select(TipoProducto)).all()
+        return (
+            [ProductoResponse.model_validate(p) for p in productos],
+            [TipoProductoResponse.model_validate(t) for t in tipos],
+        )
+
+# Menú en memoria: las lecturas del menú no consultan la base (ver MenuIndex)
+menu_index = MenuIndex(_cargar_menu, ttl=float(os.getenv("MENU_CACHE_TTL_SECONDS", "300")))
+
+def _cargar_popularidad():
+    """Compras por producto, desde los contadores precalculados"""
+    with SessionLocal() as db:
+        return dict(db.execute(select(PopularidadProducto.id_producto, PopularidadProducto.ordenes)).all())
+
+# Ranking de más vendidos en memoria, recalculado desde los contadores cada pocos segundos
+popularity_ranking = PopularityRanking(
+    _cargar_popularidad, ttl=float(os.getenv("POPULARIDAD_TTL_SECONDS", "60"))
+)
+
+async def _menu() -> MenuIndex:
+    """Índice del menú, cargándolo si todavía no está o si venció"""
+    if not menu_index.vigente():
+        await run_in_threadpool(menu_index.asegurar_cargado)
+    return menu_index
+
+def _headers_menu(menu: MenuIndex) -> dict:
+    return {"X-Menu-Version": str(menu.version)}
+
+# Las lecturas del menú devuelven JSON pre-serializado (y comprimido) con ETag;
+# response_model queda solo para la documentación.
 @router.get("/", response_model=List[ProductoResponse])
-def listar_productos(
+async def listar_productos(
+    request: Request,
     id_tipo: Optional[int] = None,
-    disponible: bool = True,
-    db: Session = Depends(get_db)
+    disponible: bool = True
 ):
     """Listar todos los productos disponibles (el menú). Permitir filtrar por id_tipo"""
-    query = db.query(Producto).filter(Producto.disponible == disponible)
-    
-    if id_tipo:
-        query = query.filter(Producto.id_tipo == id_tipo)
-    
-    productos = query.all()
-    return productos
+    menu = await _menu()
+    return menu.json_listado(id_tipo or None, disponible).responder(request, _headers_menu(menu))
 
 @router.get("/tipos/", response_model=List[TipoProductoResponse])
-def listar_tipos_producto(db: Session = Depends(get_db)):
+async def listar_tipos_producto(request: Request):
     """Listar todos los tipos de producto (categorías del menú)"""
-    tipos = db.query(TipoProducto).all()
-    return tipos
+    menu = await _menu()
+    return menu.json_tipos().responder(request, _headers_menu(menu))
+
+@router.get("/version")
+async def obtener_version_menu(response: Response):
+    """
+    Versión actual del menú: hash de su contenido. Cambia cada vez que se crea o modifica
+    un producto o tipo, así la app puede volver a pedir el menú solo cuando cambió.
+    """
+    menu = await _menu()
+    response.headers.update(_headers_menu(menu))
+    return {"version": menu.version}
 
 @router.get("/recomendados", response_model=List[ProductoResponse])
-def obtener_productos_recomendados(
-    limit: int = 5,
-    categoria_id: Optional[int] = None,
-    db: Session = Depends(get_db)
+async def obtener_productos_recomendados(
+    limit: int = Query(5, ge=1, le=50),
+    categoria_id: Optional[int] = None
 ):
     """
     Obtener productos recomendados basados en popularidad (más vendidos).
     Sistema simple de recomendación que retorna los productos que más se han vendido.
+    El ranking sale de los contadores que actualiza cada compra (`popularidad_productos`),
+    sin recorrer el historial de ventas.
     """
-    # Query para obtener productos con conteo de ventas
-    query = db.query(
-        Producto,
-        func.count(DetalleCompra.id_producto).label('total_vendido')
-    ).outerjoin(
-        DetalleCompra, Producto.id == DetalleCompra.id_producto
-    ).filter(
-        Producto.disponible == True
-    )
-    
-    # Filtrar por categoría si se especifica
-    if categoria_id:
-        query = query.filter(Producto.id_tipo == categoria_id)
-    
-    # Agrupar por producto, ordenar por más vendidos y limitar resultados
-    productos = query.group_by(Producto.id)\
-                     .order_by(desc('total_vendido'), Producto.id)\
-                     .limit(limit)\
-                     .all()
-    
-    # Retornar solo los productos (sin el conteo)
-    return [producto for producto, count in productos]
+    menu = await _menu()
+    if not popularity_ranking.vigente():
+        await run_in_threadpool(popularity_ranking.asegurar_cargado)
+    snapshot = menu.productos()
+    return popularity_ranking.top(snapshot, menu.version, limit, categoria_id or None)
+
+@router.get("/recomendados/me", response_model=List[ProductoResponse])
+async def obtener_recomendaciones_personales(
+    limit: int = Query(5, ge=1, le=50),
+    categoria_id: Optional[int] = None,
+    current_user: Usuario = Depends(get_current_user)
+):
+    """
+    Recomendaciones para el usuario autenticado: lo que suele pedir y lo que otros
+    piden junto con eso. Se calculan en segundo plano para todos los usuarios
+    (ver PersonalRecommender); si el usuario no tiene compras, o todavía no hay
+    resultados, se completa con los populares del momento.
+    """
+    menu = await _menu()
+    categoria_id = categoria_id or None
+    recomendados = []
+    for producto_id in personal_recommender.para_usuario(current_user.id):
+        producto = menu.obtener(producto_id)
+        if producto and producto.disponible and categoria_id in (None, producto.id_tipo):
+            recomendados.append(producto)
+            if len(recomendados) == limit:
+                return recomendados
+
+    elegidos = {p.id for p in recomendados}
+    candidatos = [p for p in menu.listar(categoria_id, True) if p.id not in elegidos]
+    return recomendados + recommendation_engine.populares(candidatos, limit - len(recomendados))
+
+@router.get("/populares", response_model=List[ProductoResponse])
+async def obtener_productos_populares(
+    limit: int = Query(10, ge=1, le=50),
+    categoria_id: Optional[int] = None
+):
+    """
+    Productos populares ahora: unidades vendidas con decaimiento exponencial
+    (vida media `RECOMENDACIONES_VIDA_MEDIA_HORAS`), así lo que se vendió la temporada
+    pasada deja de aparecer arriba. Se responde desde memoria, con el motor que
+    reconstruye un hilo de fondo (en orden de menú hasta la primera construcción).
+    """
+    menu = await _menu()
+    return recommendation_engine.populares(menu.listar(categoria_id or None, True), limit)
 
 @router.get("/buscar", response_model=List[ProductoResponse])
-def buscar_productos_por_nombre(
-    nombre: str = Query(..., min_length=1, description="Texto a buscar en el nombre del producto"),
+async def buscar_productos_por_nombre(
+    nombre: str = Query(..., min_length=1, description="Texto a buscar en el nombre o la descripción del producto"),
     disponible: Optional[bool] = True,
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db)
+    fuzzy: bool = Query(True, description="Tolerar errores de tipeo en las palabras que no coinciden con nada")
 ):
     """
-    Buscar productos por coincidencia parcial en el nombre.
+    Buscar productos por nombre y descripción.
 
-    Permite a la app filtrar el menú desde el front usando texto libre.
+    Permite a la app filtrar el menú desde el front usando texto libre. Cada palabra se
+    busca como prefijo, sin distinguir tildes ni mayúsculas ("coctel" encuentra "Cócteles"),
+    y los resultados vienen ordenados por relevancia (coincidencias en el nombre primero).
+    Con `fuzzy` (por defecto), "corna" encuentra "Corona".
     Por defecto solo trae productos disponibles; pasa `disponible=null` para incluir todos.
     """
-    query = db.query(Producto)
+    menu = await _menu()
+    if menu.busqueda_lista():
+        indice = menu.indice_busqueda()
+    else:
+        indice = await run_in_threadpool(menu.indice_busqueda)
+    productos = indice.buscar(nombre, disponible, limit, fuzzy)
 
-    if disponible is not None:
-        query = query.filter(Producto.disponible == disponible)
-
-    patron = f"%{nombre.lower()}%"
-    productos = (
-        query.filter(func.lower(Producto.nombre).like(patron))
-        .order_by(Producto.nombre.asc())
-        .limit(limit)
-        .all()
-    )
-
-    # Registrar evento de búsqueda para analítica
-    evento = EventoBusquedaProducto(
+    # Registrar evento de búsqueda para analítica (se escribe en lote, fuera del request)
+    search_event_writer.registrar(
         termino=nombre,
         disponible=disponible,
         limite=limit,
         resultados=len(productos)
     )
-    db.add(evento)
-    db.commit()
 
     return productos
 
 @router.get("/{producto_id}", response_model=ProductoResponse)
-def obtener_producto(producto_id: int, db: Session = Depends(get_db)):
+async def obtener_producto(producto_id: int, request: Request):
     """Obtener detalles de un producto específico"""
-    producto = db.query(Producto).filter(Producto.id == producto_id).first()
-    if not producto:
+    menu = await _menu()
+    producto = menu.json_producto(producto_id)
+    if producto is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Producto no encontrado"
         )
-    return producto
+    return producto.responder(request, _headers_menu(menu))
+
+@router.get("/{producto_id}/comprados-juntos", response_model=List[ProductoResponse])
+async def obtener_comprados_juntos(producto_id: int, limit: int = Query(5, ge=1, le=20)):
+    """Productos disponibles que suelen pedirse en la misma orden que `producto_id`"""
+    menu = await _menu()
+    if menu.obtener(producto_id) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Producto no encontrado"
+        )
+    return recommendation_engine.comprados_juntos(producto_id, menu.listar(None, True), limit)
 
 @router.get("/{producto_id}/conversiones")
 def obtener_producto_con_conversiones(producto_id: int, db: Session = Depends(get_db)):
@@ -123,6 +220,7 @@ def obtener_producto_con_conversiones(producto_id: int, db: Session = Depends(ge
     Obtener el precio de un producto con sus conversiones a USD, EUR y MXN.
     
     Retorna el precio original en COP y las conversiones automáticas a las principales monedas.
+    (Sigue siendo síncrono: la consulta al servicio de tasas es bloqueante.)
     """
     from services.currency_service import convert_currency
     
@@ -163,10 +261,10 @@ def obtener_producto_con_conversiones(producto_id: int, db: Session = Depends(ge
 
 # Endpoints de administración (requieren autenticación de admin)
 @router.post("/tipos/", response_model=TipoProductoResponse, status_code=status.HTTP_201_CREATED)
-def crear_tipo_producto(tipo: TipoProductoCreate, db: Session = Depends(get_db)):
+async def crear_tipo_producto(tipo: TipoProductoCreate, db: AsyncSession = Depends(get_async_db)):
     """(Admin) Crear un nuevo tipo de producto"""
     # Verificar si el tipo ya existe
-    db_tipo = db.query(TipoProducto).filter(TipoProducto.nombre == tipo.nombre).first()
+    db_tipo = await db.scalar(select(TipoProducto).where(TipoProducto.nombre == tipo.nombre))
     if db_tipo:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -175,16 +273,18 @@ def crear_tipo_producto(tipo: TipoProductoCreate, db: Session = Depends(get_db))
     
     db_tipo = TipoProducto(nombre=tipo.nombre)
     db.add(db_tipo)
-    db.commit()
-    db.refresh(db_tipo)
+    await db.commit()
+    await db.refresh(db_tipo)
     
-    return db_tipo
+    tipo_response = TipoProductoResponse.model_validate(db_tipo)
+    menu_index.guardar_tipo(tipo_response)
+    return tipo_response
 
 @router.post("/", response_model=ProductoResponse, status_code=status.HTTP_201_CREATED)
-def crear_producto(producto: ProductoCreate, db: Session = Depends(get_db)):
+async def crear_producto(producto: ProductoCreate, db: AsyncSession = Depends(get_async_db)):
     """(Admin) Crear un nuevo producto"""
     # Verificar que el tipo de producto existe
-    tipo_producto = db.query(TipoProducto).filter(TipoProducto.id == producto.id_tipo).first()
+    tipo_producto = await db.get(TipoProducto, producto.id_tipo)
     if not tipo_producto:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -201,19 +301,20 @@ def crear_producto(producto: ProductoCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_producto)
-    db.commit()
-    db.refresh(db_producto)
+    await db.commit()
     
-    return db_producto
+    producto_response = ProductoResponse.model_validate(await _producto_con_tipo(db, db_producto.id))
+    menu_index.guardar_producto(producto_response)
+    return producto_response
 
 @router.put("/{producto_id}", response_model=ProductoResponse)
-def actualizar_producto(
+async def actualizar_producto(
     producto_id: int, 
     producto_update: ProductoUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """(Admin) Actualizar un producto"""
-    producto = db.query(Producto).filter(Producto.id == producto_id).first()
+    producto = await db.get(Producto, producto_id)
     if not producto:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -221,7 +322,7 @@ def actualizar_producto(
         )
     
     # Verificar que el tipo de producto existe
-    tipo_producto = db.query(TipoProducto).filter(TipoProducto.id == producto_update.id_tipo).first()
+    tipo_producto = await db.get(TipoProducto, producto_update.id_tipo)
     if not tipo_producto:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -236,7 +337,10 @@ def actualizar_producto(
     producto.disponible = producto_update.disponible
     producto.id_tipo = producto_update.id_tipo
     
-    db.commit()
-    db.refresh(producto)
+    await db.commit()
+    # El tipo ya está en la sesión; se refresca la relación por si cambió id_tipo
+    await db.refresh(producto, ["tipo_producto"])
     
-    return producto
+    producto_response = ProductoResponse.model_validate(producto)
+    menu_index.guardar_producto(producto_response)
+    return producto_response
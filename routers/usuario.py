@@ -1,40 +1,46 @@
-from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from database import get_db
-from models import Usuario, EncuestaSeatDelivery, RecargaSaldoEvento
+from database import ejecutar_escritura, get_async_db
+from models import Usuario, EncuestaSeatDelivery, RecargaSaldoEvento, TipoMovimientoSaldo
 from schemas import (
     UsuarioCreate,
     UsuarioResponse,
     UsuarioLogin,
     Token,
     RecargaSaldo,
+    SaldoResponse,
     EncuestaSeatDeliveryCreate,
     EncuestaSeatDeliveryResponse,
 )
 from auth import (
-    get_password_hash, 
-    authenticate_user, 
+    hash_password_async,
+    authenticate_user,
     create_access_token, 
     get_current_user,
     ACCESS_TOKEN_EXPIRE_MINUTES
 )
+from services.wallet import a_centavos, acreditar_saldo, consulta_saldo_en, registrar_movimiento
 
 router = APIRouter(prefix="/usuarios", tags=["usuarios"])
 
 @router.post("/", response_model=UsuarioResponse, status_code=status.HTTP_201_CREATED)
-def crear_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
+async def crear_usuario(usuario: UsuarioCreate, db: AsyncSession = Depends(get_async_db)):
     """Crear un nuevo usuario (registro)"""
     # Verificar si el email ya existe
-    db_usuario = db.query(Usuario).filter(Usuario.email == usuario.email).first()
+    db_usuario = await db.scalar(select(Usuario).where(Usuario.email == usuario.email))
     if db_usuario:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El email ya está registrado"
         )
     
-    # Crear el usuario con contraseña hasheada
-    hashed_password = get_password_hash(usuario.password)
+    # Crear el usuario con contraseña hasheada (en el pool dedicado de bcrypt)
+    hashed_password = await hash_password_async(usuario.password)
     db_usuario = Usuario(
         nombre=usuario.nombre,
         email=usuario.email,
@@ -43,15 +49,15 @@ def crear_usuario(usuario: UsuarioCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_usuario)
-    db.commit()
-    db.refresh(db_usuario)
+    await db.commit()
+    await db.refresh(db_usuario, ["encuesta"])
     
     return db_usuario
 
 @router.post("/token", response_model=Token)
-def login_usuario(usuario_login: UsuarioLogin, db: Session = Depends(get_db)):
+async def login_usuario(usuario_login: UsuarioLogin, db: AsyncSession = Depends(get_async_db)):
     """Login de usuario para obtener un token JWT"""
-    user = authenticate_user(db, usuario_login.email, usuario_login.password)
+    user = await authenticate_user(db, usuario_login.email, usuario_login.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -67,15 +73,41 @@ def login_usuario(usuario_login: UsuarioLogin, db: Session = Depends(get_db)):
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.get("/me", response_model=UsuarioResponse)
-def obtener_usuario_actual(current_user: Usuario = Depends(get_current_user)):
+async def obtener_usuario_actual(
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
     """Obtener detalles del usuario autenticado"""
+    # El saldo no viene del cache de identidad: se lee de la base
+    await db.refresh(current_user, ["saldo", "encuesta"])
     return current_user
 
+def _registrar_recarga(sesion: Session, usuario: Usuario, monto: float) -> None:
+    """
+    Sumar la recarga al saldo, registrarla en el libro y recargar `usuario` para la
+    respuesta, con commit. Se ejecuta con `ejecutar_escritura`: toda la transacción en
+    un solo paso, y la conexión se devuelve al pool con el commit.
+    """
+    try:
+        # Sumar sobre el saldo actual de la base y registrar el evento de recarga en la misma transacción
+        saldo_nuevo = sesion.execute(acreditar_saldo(usuario.id, monto)).scalar_one()
+        evento = RecargaSaldoEvento(id_usuario=usuario.id, monto=monto)
+        sesion.add(evento)
+        sesion.flush()
+        sesion.execute(registrar_movimiento(
+            usuario.id, TipoMovimientoSaldo.RECARGA, monto, saldo_nuevo, id_recarga=evento.id
+        ))
+        sesion.refresh(usuario, ["saldo", "encuesta"])
+        sesion.commit()
+    except Exception:
+        sesion.rollback()
+        raise
+
 @router.post("/me/recargar", response_model=UsuarioResponse)
-def recargar_saldo(
+async def recargar_saldo(
     recarga: RecargaSaldo,
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Añadir saldo al monedero del usuario"""
     if recarga.monto <= 0:
@@ -83,23 +115,44 @@ def recargar_saldo(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El monto debe ser mayor a 0"
         )
-    # Actualizar saldo y registrar evento de recarga en la misma transacción
-    current_user.saldo += recarga.monto
-    evento = RecargaSaldoEvento(id_usuario=current_user.id, monto=recarga.monto)
-    db.add(evento)
-    db.commit()
-    db.refresh(current_user)
+    # El libro guarda centavos: un monto con fracción de centavo se redondearía distinto
+    # en el saldo y en el movimiento, y la verificación lo vería como descuadre
+    if Decimal(str(recarga.monto)).as_tuple().exponent < -2:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El monto no puede tener más de dos decimales"
+        )
+    await ejecutar_escritura(db, _registrar_recarga, current_user, a_centavos(recarga.monto) / 100)
     
     return current_user
 
 
+@router.get("/me/saldo", response_model=SaldoResponse)
+async def obtener_saldo(
+    fecha: Optional[datetime] = Query(None, description="Saldo que tenía el usuario en esa fecha (UTC)"),
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Saldo actual, o a una fecha, según el libro de movimientos (una búsqueda en el índice)"""
+    movimiento = await db.scalar(consulta_saldo_en(current_user.id, fecha))
+    if movimiento is None:
+        return SaldoResponse(saldo=0.0, saldo_centavos=0)
+    return SaldoResponse(
+        saldo=movimiento.saldo_centavos / 100,
+        saldo_centavos=movimiento.saldo_centavos,
+        id_movimiento=movimiento.id,
+        fecha_hora=movimiento.fecha_hora,
+    )
+
+
 @router.post("/me/encuesta", response_model=EncuestaSeatDeliveryResponse, status_code=status.HTTP_201_CREATED)
-def crear_encuesta_usuario(
+async def crear_encuesta_usuario(
     encuesta_data: EncuestaSeatDeliveryCreate,
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Registrar la preferencia de seat delivery del usuario"""
+    await db.refresh(current_user, ["encuesta"])
     if current_user.encuesta:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -114,19 +167,20 @@ def crear_encuesta_usuario(
     )
 
     db.add(encuesta)
-    db.commit()
-    db.refresh(encuesta)
+    await db.commit()
+    await db.refresh(encuesta)
 
     return encuesta
 
 
 @router.put("/me/encuesta", response_model=EncuestaSeatDeliveryResponse)
-def actualizar_encuesta_usuario(
+async def actualizar_encuesta_usuario(
     encuesta_data: EncuestaSeatDeliveryCreate,
     current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Actualizar la encuesta registrada del usuario"""
+    await db.refresh(current_user, ["encuesta"])
     encuesta = current_user.encuesta
     if not encuesta:
         raise HTTPException(
@@ -138,17 +192,19 @@ def actualizar_encuesta_usuario(
     encuesta.minutos_extra = encuesta_data.minutos_extra
     encuesta.comentarios = encuesta_data.comentarios
 
-    db.commit()
-    db.refresh(encuesta)
+    await db.commit()
+    await db.refresh(encuesta)
 
     return encuesta
 
 
 @router.get("/me/encuesta", response_model=EncuestaSeatDeliveryResponse)
-def obtener_encuesta_usuario(
-    current_user: Usuario = Depends(get_current_user)
+async def obtener_encuesta_usuario(
+    current_user: Usuario = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Obtener la encuesta guardada del usuario autenticado"""
+    await db.refresh(current_user, ["encuesta"])
     encuesta = current_user.encuesta
     if not encuesta:
         raise HTTPException(
@@ -26,6 +26,13 @@ class UsuarioLogin(BaseModel):
 class RecargaSaldo(BaseModel):
     monto: float
 
+class SaldoResponse(BaseModel):
+    saldo: float
+    saldo_centavos: int
+    # Movimiento del libro que dejó ese saldo (None si el usuario no tiene movimientos)
+    id_movimiento: Optional[int] = None
+    fecha_hora: Optional[datetime] = None
+
 # Esquemas de TipoProducto
 class TipoProductoBase(BaseModel):
     nombre: str
@@ -132,6 +139,21 @@ class CompraResponse(BaseModel):
 class CompraEstadoUpdate(BaseModel):
     estado: EstadoCompra
 
+class CompraEstadoLoteUpdate(BaseModel):
+    compra_ids: List[int]
+    estado: EstadoCompra
+
+class ResultadoTransicion(BaseModel):
+    compra_id: int
+    actualizada: bool
+    estado_anterior: Optional[EstadoCompra] = None
+    detalle: Optional[str] = None
+
+class CompraEstadoLoteResponse(BaseModel):
+    estado: EstadoCompra
+    actualizadas: int
+    resultados: List[ResultadoTransicion]
+
 # Esquemas de QR
 class QRResponse(BaseModel):
     codigo_qr_hash: str
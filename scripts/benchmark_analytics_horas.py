@@ -0,0 +1,133 @@
+"""
+Horas pico de /analytics: agrupar por hora local en Python vs en la base.
+
+Uso:
+    python scripts/benchmark_analytics_horas.py [--ordenes 1000000] [--busquedas 500000] [--repeticiones 3]
+
+Reparte `--ordenes` compras y `--busquedas` eventos de búsqueda en los últimos
+90 días y, para varios offsets de zona horaria, calcula la distribución por hora
+local de tres formas:
+- "python": lo que hacían `order_peak_hours` y `product_search_peak_hours` antes
+  (traer cada fila de la ventana y llamar `to_local_hour` por fila);
+- "sql crudo": el endpoint con `ANALYTICS_RESUMENES=false` (GROUP BY de la hora
+  local sobre las filas crudas, a lo sumo 24 filas de resultado);
+- "sql + resúmenes": el endpoint por defecto (GROUP BY sobre los resúmenes por
+  hora; un offset de media hora cae en "sql crudo").
+Verifica que las tres distribuciones coincidan.
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import insert
+
+from benchmark_utils import crear_base_temporal, crear_usuario, medir
+
+import routers.analytics as analytics
+from database import configurar_sqlite
+from models import Compra, EstadoCompra, EventoBusquedaProducto
+from services.analytics_rollups import ESTADOS_VALIDOS, reconstruir_resumenes
+
+DIAS = 90
+LOTE_INSERT = 50_000
+OFFSETS = [0, -300, 330]
+
+
+def to_local_hour(dt: datetime, offset_min: int) -> int:
+    return ((dt + timedelta(minutes=offset_min)).hour) % 24
+
+
+def ordenes_en_python(db, start: datetime, end: datetime, offset: int) -> Dict[int, List]:
+    """Órdenes e ingresos por hora local como lo hacía `order_peak_hours` antes."""
+    compras = (
+        db.query(Compra.id, Compra.fecha_hora, Compra.total)
+        .filter(Compra.fecha_hora >= start, Compra.fecha_hora < end)
+        .filter(Compra.estado.in_(ESTADOS_VALIDOS))
+        .all()
+    )
+    por_hora: Dict[int, List] = {h: [0, 0.0] for h in range(24)}
+    for compra in compras:
+        hora = por_hora[to_local_hour(compra.fecha_hora, offset)]
+        hora[0] += 1
+        hora[1] += compra.total
+    return por_hora
+
+
+def busquedas_en_python(db, start: datetime, end: datetime, offset: int) -> Dict[int, int]:
+    """Búsquedas por hora local como lo hacía `product_search_peak_hours` antes."""
+    eventos = (
+        db.query(EventoBusquedaProducto.creado_en)
+        .filter(EventoBusquedaProducto.creado_en >= start, EventoBusquedaProducto.creado_en < end)
+        .all()
+    )
+    por_hora = {h: 0 for h in range(24)}
+    for (fecha,) in eventos:
+        por_hora[to_local_hour(fecha, offset)] += 1
+    return por_hora
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Horas pico: agrupar en Python vs en la base.")
+    parser.add_argument("--ordenes", type=int, default=1_000_000, help="Compras sintéticas en 90 días.")
+    parser.add_argument("--busquedas", type=int, default=500_000, help="Eventos de búsqueda en 90 días.")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Llamadas por variante.")
+    args = parser.parse_args()
+
+    engine, SessionLocal = crear_base_temporal("analytics_horas")
+    configurar_sqlite(engine)
+    engine.dispose()
+    ahora = datetime.utcnow()
+    azar = random.Random(25)
+    segundos = DIAS * 24 * 3600
+
+    with SessionLocal() as db:
+        id_usuario = crear_usuario(db).id
+        for inicio in range(0, args.ordenes, LOTE_INSERT):
+            db.execute(insert(Compra), [
+                {"id_usuario": id_usuario, "total": azar.randrange(2, 40) * 500.0, "estado": EstadoCompra.ENTREGADO,
+                 "fecha_hora": ahora - timedelta(seconds=azar.randrange(segundos))}
+                for _ in range(min(LOTE_INSERT, args.ordenes - inicio))
+            ])
+        for inicio in range(0, args.busquedas, LOTE_INSERT):
+            db.execute(insert(EventoBusquedaProducto), [
+                {"termino": "cerveza", "resultados": 3,
+                 "creado_en": ahora - timedelta(seconds=azar.randrange(segundos), microseconds=azar.randrange(10**6))}
+                for _ in range(min(LOTE_INSERT, args.busquedas - inicio))
+            ])
+        db.commit()
+        reconstruir_resumenes(db)
+
+    start, end = ahora - timedelta(days=DIAS) + timedelta(minutes=7), ahora
+    print(f"{args.ordenes} compras y {args.busquedas} búsquedas en {DIAS} días\n")
+    print(f"{'endpoint':<26} {'offset':>7} {'python ms':>10} {'sql crudo ms':>13} {'sql + resúmenes ms':>19}")
+    for offset in OFFSETS:
+        with SessionLocal() as db:
+            esperado = ordenes_en_python(db, start, end, offset)
+            fila = [medir(lambda: ordenes_en_python(db, start, end, offset), args.repeticiones)["p50_ms"]]
+            for resumenes in (False, True):
+                analytics.ANALYTICS_RESUMENES = resumenes
+                llamar = lambda: analytics.order_peak_hours(start=start, end=end, timezone_offset_minutes=offset, db=db)
+                obtenido = {h.hour: [h.order_count, h.total_revenue] for h in llamar().hourly_distribution}
+                assert obtenido == esperado, f"order_peak_hours (offset {offset}) no coincide"
+                fila.append(medir(llamar, args.repeticiones)["p50_ms"])
+        print(f"{'order_peak_hours':<26} {offset:>7} {fila[0]:>10.0f} {fila[1]:>13.0f} {fila[2]:>19.1f}")
+
+    for offset in OFFSETS:
+        with SessionLocal() as db:
+            esperado = busquedas_en_python(db, start, end, offset)
+            fila = [medir(lambda: busquedas_en_python(db, start, end, offset), args.repeticiones)["p50_ms"]]
+            for resumenes in (False, True):
+                analytics.ANALYTICS_RESUMENES = resumenes
+                llamar = lambda: analytics.product_search_peak_hours(
+                    start=start, end=end, timezone_offset_minutes=offset, db=db
+                )
+                obtenido = {h.hour: h.search_count for h in llamar().hourly_distribution}
+                assert obtenido == esperado, f"product_search_peak_hours (offset {offset}) no coincide"
+                fila.append(medir(llamar, args.repeticiones)["p50_ms"])
+        print(f"{'product_search_peak_hours':<26} {offset:>7} {fila[0]:>10.0f} {fila[1]:>13.0f} {fila[2]:>19.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Dashboard de /analytics sobre 90 días: filas crudas vs resúmenes por hora.
+
+Uso:
+    python scripts/benchmark_analytics_resumenes.py [--ordenes 300000] [--busquedas 300000] [--repeticiones 5]
+
+Reparte `--ordenes` compras (dos productos cada una) y `--busquedas` eventos de
+búsqueda en los últimos 90 días, reconstruye los resúmenes y llama
+`order_peak_hours`, `product_search_peak_hours` y `most_requested_categories`
+con una ventana de 90 días leyendo las filas crudas (`ANALYTICS_RESUMENES=false`)
+y leyendo los resúmenes. Verifica que ambas respuestas coincidan e imprime
+también el costo de mantenerlos: la reconstrucción completa y lo que agrega cada compra.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from benchmark_utils import crear_base_temporal, crear_usuario, medir, poblar_catalogo
+
+import routers.analytics as analytics
+from database import configurar_sqlite
+from models import (
+    Compra,
+    DetalleCompra,
+    EstadoCompra,
+    EventoBusquedaProducto,
+    ResumenHoraBusquedas,
+    ResumenHoraCategoria,
+    ResumenHoraCompras,
+)
+from services.analytics_rollups import reconstruir_resumenes, sumar_compra
+
+DIAS = 90
+LOTE_INSERT = 50_000
+COMPRAS_ESCRITURA = 200
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Endpoints de /analytics: filas crudas vs resúmenes por hora.")
+    parser.add_argument("--ordenes", type=int, default=300_000, help="Compras en la ventana de 90 días.")
+    parser.add_argument("--busquedas", type=int, default=300_000, help="Eventos de búsqueda en la ventana.")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Llamadas por endpoint y variante.")
+    args = parser.parse_args()
+
+    engine, SessionLocal = crear_base_temporal("analytics_resumenes")
+    configurar_sqlite(engine)
+    engine.dispose()
+    ahora = datetime.utcnow()
+    azar = random.Random(11)
+    segundos = DIAS * 24 * 3600
+
+    with SessionLocal() as db:
+        ids = poblar_catalogo(db, total_productos=40)
+        id_usuario = crear_usuario(db).id
+        for inicio in range(1, args.ordenes + 1, LOTE_INSERT):
+            rango = range(inicio, min(inicio + LOTE_INSERT, args.ordenes + 1))
+            db.execute(insert(Compra), [
+                {"id": i, "id_usuario": id_usuario, "total": 3000.0, "estado": EstadoCompra.ENTREGADO,
+                 "fecha_hora": ahora - timedelta(seconds=azar.randrange(segundos))}
+                for i in rango
+            ])
+            db.execute(insert(DetalleCompra), [
+                {"id_compra": i, "id_producto": ids[(i + k) % len(ids)], "cantidad": 1 + k, "precio_unitario_compra": 1000.0}
+                for i in rango for k in range(2)
+            ])
+        for inicio in range(0, args.busquedas, LOTE_INSERT):
+            db.execute(insert(EventoBusquedaProducto), [
+                {"termino": "cerveza", "resultados": 3,
+                 "creado_en": ahora - timedelta(seconds=azar.randrange(segundos), microseconds=azar.randrange(10**6))}
+                for _ in range(min(LOTE_INSERT, args.busquedas - inicio))
+            ])
+        db.commit()
+
+        inicio_reconstruccion = time.perf_counter()
+        filas = reconstruir_resumenes(db)
+        reconstruccion_ms = (time.perf_counter() - inicio_reconstruccion) * 1000
+
+    print(f"{args.ordenes} compras y {args.busquedas} búsquedas en {DIAS} días")
+    print(f"Resúmenes: {filas['compras']} horas de compras, {filas['categorias']} hora-categoría, "
+          f"{filas['busquedas']} horas de búsquedas (reconstrucción: {reconstruccion_ms:.0f} ms)\n")
+
+    # Ventana de 90 días que no empieza ni termina en hora exacta: los bordes se leen crudos
+    ventana = {"start": ahora - timedelta(days=DIAS) + timedelta(minutes=7), "end": ahora}
+    endpoints = [
+        ("order_peak_hours", lambda db: analytics.order_peak_hours(timezone_offset_minutes=-180, db=db, **ventana)),
+        ("product_search_peak_hours",
+         lambda db: analytics.product_search_peak_hours(timezone_offset_minutes=-180, db=db, **ventana)),
+        ("most_requested_categories", lambda db: analytics.most_requested_categories(limit=5, db=db, **ventana)),
+    ]
+
+    print(f"{'endpoint':<28} {'crudo p50 ms':>13} {'resumen p50 ms':>15} {'x':>7}")
+    for nombre, llamar in endpoints:
+        respuestas, stats = [], []
+        for resumenes in (False, True):
+            analytics.ANALYTICS_RESUMENES = resumenes
+            with SessionLocal() as db:
+                respuestas.append(llamar(db).model_dump())
+                stats.append(medir(lambda: llamar(db), args.repeticiones))
+        assert respuestas[0] == respuestas[1], f"{nombre}: las respuestas no coinciden"
+        print(f"{nombre:<28} {stats[0]['p50_ms']:>13.1f} {stats[1]['p50_ms']:>15.2f} "
+              f"{stats[0]['p50_ms'] / stats[1]['p50_ms']:>7.0f}")
+
+    # Lo que agrega cada compra: las dos sentencias de sumar_compra en la transacción
+    with SessionLocal() as db:
+        siguiente = iter(range(args.ordenes + 1, args.ordenes + 1 + 2 * COMPRAS_ESCRITURA))
+
+        def comprar(con_resumen: bool):
+            id_compra, fecha = next(siguiente), datetime.utcnow()
+            db.execute(insert(Compra).values(
+                id=id_compra, id_usuario=id_usuario, total=2000.0, estado=EstadoCompra.PAGADO, fecha_hora=fecha
+            ))
+            db.execute(insert(DetalleCompra), [
+                {"id_compra": id_compra, "id_producto": ids[k], "cantidad": 1, "precio_unitario_compra": 1000.0}
+                for k in range(2)
+            ])
+            if con_resumen:
+                lineas = [(1 + k % 4, 1, 1000.0) for k in range(2)]
+                for sentencia, parametros in sumar_compra(engine.dialect.name, fecha, 2000.0, lineas):
+                    db.execute(sentencia, parametros)
+            db.commit()
+
+        sin = medir(lambda: comprar(False), COMPRAS_ESCRITURA)
+        con = medir(lambda: comprar(True), COMPRAS_ESCRITURA)
+        horas = db.scalar(select(func.count()).select_from(ResumenHoraCompras))
+        categorias = db.scalar(select(func.count()).select_from(ResumenHoraCategoria))
+        busquedas = db.scalar(select(func.count()).select_from(ResumenHoraBusquedas))
+    print(f"\nEscribir una compra (INSERT + detalles + commit): p50 {sin['p50_ms']:.2f} ms sin resúmenes, "
+          f"{con['p50_ms']:.2f} ms con los dos upserts")
+    print(f"Filas de resumen: {horas} horas de compras / {categorias} hora-categoría / {busquedas} horas de búsquedas")
+
+
+if __name__ == "__main__":
+    main()
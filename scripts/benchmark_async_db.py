@@ -0,0 +1,119 @@
+"""
+Prueba de carga: capa de base de datos síncrona vs async.
+
+Uso:
+    python scripts/benchmark_async_db.py [--concurrencia 32] [--requests 2000]
+
+Levanta la app con uvicorn dos veces sobre la misma base temporal, una con
+DATABASE_ASYNC=false (sesión síncrona en el threadpool) y otra con
+DATABASE_ASYNC=true (AsyncSession + aiosqlite/asyncpg), y dispara requests
+concurrentes contra `/productos/` y `/compras/me`. Imprime req/s, p50 y p99.
+
+Para probar contra PostgreSQL, exporta DATABASE_URL antes de correrlo; el
+script entonces no crea la base temporal y usa la que indiques.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict
+
+import requests
+
+from benchmark_utils import crear_base_temporal, crear_usuario, poblar_catalogo, resumir_latencias
+
+from auth import create_access_token
+from models import Compra, DetalleCompra, EstadoCompra
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PUERTO = 8799
+ENDPOINTS = ["/productos/", "/compras/me?limit=20"]
+
+
+def preparar_base() -> str:
+    """Crea la base temporal con catálogo, un usuario y su historial; devuelve la URL."""
+    engine, SessionLocal = crear_base_temporal("async_db")
+    db = SessionLocal()
+    try:
+        ids = poblar_catalogo(db, total_productos=60)
+        usuario = crear_usuario(db)
+        for i in range(50):
+            compra = Compra(id_usuario=usuario.id, total=2000.0, estado=EstadoCompra.ENTREGADO)
+            compra.detalles = [
+                DetalleCompra(id_producto=ids[(i + j) % len(ids)], cantidad=1, precio_unitario_compra=1000.0)
+                for j in range(2)
+            ]
+            db.add(compra)
+        db.commit()
+    finally:
+        db.close()
+    return engine.url.render_as_string(hide_password=False)
+
+
+def levantar_servidor(url: str, modo_async: bool) -> subprocess.Popen:
+    entorno = {**os.environ, "DATABASE_URL": url, "DATABASE_ASYNC": "true" if modo_async else "false"}
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PUERTO), "--log-level", "warning"],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{PUERTO}/health", timeout=1)
+            return proceso
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def cargar(endpoint: str, headers: Dict[str, str], concurrencia: int, total: int) -> Dict[str, float]:
+    sesion = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_connections=concurrencia, pool_maxsize=concurrencia)
+    sesion.mount("http://", adaptador)
+
+    def una_request(_):
+        inicio = time.perf_counter()
+        respuesta = sesion.get(f"http://127.0.0.1:{PUERTO}{endpoint}", headers=headers)
+        respuesta.raise_for_status()
+        return (time.perf_counter() - inicio) * 1000
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        tiempos = list(pool.map(una_request, range(total)))
+    duracion = time.perf_counter() - inicio
+    return {"rps": total / duracion, **resumir_latencias(tiempos)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Carga concurrente con la capa de BD síncrona vs async.")
+    parser.add_argument("--concurrencia", type=int, default=32, help="Requests simultáneas.")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests por endpoint y modo.")
+    args = parser.parse_args()
+
+    url = os.getenv("DATABASE_URL") or preparar_base()
+    token = create_access_token({"sub": "bench@test.com"}, expires_delta=timedelta(hours=1))
+    headers = {"Authorization": f"Bearer {token}"}
+
+    print(f"{'modo':>6} {'endpoint':<22} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for modo_async in (False, True):
+        servidor = levantar_servidor(url, modo_async)
+        try:
+            for endpoint in ENDPOINTS:
+                cargar(endpoint, headers, args.concurrencia, args.concurrencia)  # calentamiento
+                stats = cargar(endpoint, headers, args.concurrencia, args.requests)
+                modo = "async" if modo_async else "sync"
+                print(
+                    f"{modo:>6} {endpoint:<22} {stats['rps']:>8.0f} "
+                    f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}"
+                )
+        finally:
+            servidor.terminate()
+            servidor.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""
+Búsqueda de productos: `LIKE '%term%'` en SQL vs el índice invertido en memoria.
+
+Uso:
+    python scripts/benchmark_busqueda.py [--productos 50000] [--repeticiones 50]
+
+Genera un catálogo sintético con nombres y descripciones en español (con tildes),
+construye `ProductSearchIndex` y compara, para varias búsquedas tipo "mientras
+se escribe", la latencia de la consulta LIKE que usaba el endpoint contra la del
+índice, sin su cache de resultados ("frío") y con ella. El LIKE no encuentra
+"coctel" en "Cóctel"; el índice sí. Después mide la búsqueda tolerante a errores
+de tipeo (`fuzzy=True`) sobre un menú de `--productos-fuzzy` productos.
+"""
+
+import argparse
+import random
+import time
+
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import joinedload
+
+from benchmark_utils import crear_base_temporal, medir
+
+from models import Producto, TipoProducto
+from schemas import ProductoResponse
+from services.product_search import ProductSearchIndex
+
+BASES = ["Cóctel", "Cerveza", "Mojito", "Piña Colada", "Limonada", "Café", "Té", "Nachos",
+         "Hamburguesa", "Empanada", "Margarita", "Michelada", "Sangría", "Jugo", "Aguardiente"]
+SABORES = ["maracuyá", "limón", "mandarina", "coco", "fresa", "mango", "lulo", "corozo",
+           "café", "menta", "jengibre", "frutos rojos", "guanábana", "tamarindo"]
+ESTILOS = ["de la casa", "artesanal", "clásica", "especial", "doble", "picante", "helado",
+           "sin azúcar", "premium", "tropical"]
+BUSQUEDAS = ["c", "coc", "coctel", "limon", "pina col", "cerveza artesanal", "guanabana", "zzz"]
+# Errores de tipeo típicos: letra faltante, sobrante, cambiada o transpuesta
+CON_ERRORES = ["coctl", "mojtio", "pina colda", "cervesa artesanl", "hamburgesa", "michelda", "aguardeinte", "qwerty"]
+
+
+def poblar(db, total: int) -> None:
+    azar = random.Random(42)
+    tipo = TipoProducto(nombre="Categoria")
+    db.add(tipo)
+    db.flush()
+    filas = [
+        {
+            "nombre": f"{azar.choice(BASES)} {azar.choice(SABORES)} {azar.choice(ESTILOS)} {i}",
+            "descripcion": f"Preparado con {azar.choice(SABORES)} y {azar.choice(SABORES)}",
+            "precio": 1000.0 + i % 50,
+            "disponible": i % 10 != 0,
+            "id_tipo": tipo.id,
+        }
+        for i in range(total)
+    ]
+    db.execute(insert(Producto), filas)
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="LIKE vs índice invertido para /productos/buscar.")
+    parser.add_argument("--productos", type=int, default=50000, help="Tamaño del catálogo sintético.")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Búsquedas por término y método.")
+    parser.add_argument("--productos-fuzzy", type=int, default=5000, help="Catálogo para la búsqueda tolerante.")
+    args = parser.parse_args()
+
+    _, SessionLocal = crear_base_temporal("busqueda")
+    db = SessionLocal()
+    poblar(db, args.productos)
+
+    inicio = time.perf_counter()
+    productos = db.scalars(select(Producto).options(joinedload(Producto.tipo_producto))).all()
+    indice = ProductSearchIndex(ProductoResponse.model_validate(p) for p in productos)
+    print(f"Índice construido en {(time.perf_counter() - inicio) * 1000:.0f} ms "
+          f"({args.productos} productos, carga incluida)\n")
+
+    def like(termino: str):
+        return db.scalars(
+            select(Producto).where(Producto.disponible == True)
+            .where(func.lower(Producto.nombre).like(f"%{termino.lower()}%"))
+            .order_by(Producto.nombre.asc()).limit(20)
+        ).all()
+
+    def buscar_en_frio(termino: str):
+        indice.cache.clear()
+        return indice.buscar(termino, True, 20)
+
+    print(f"{'búsqueda':<20} {'LIKE p50 ms':>12} {'LIKE hits':>10} {'frío p50 ms':>12} "
+          f"{'frío p99 ms':>12} {'cache p50 ms':>13} {'hits':>5}")
+    for termino in BUSQUEDAS:
+        stats_like = medir(lambda: like(termino), args.repeticiones)
+        stats_frio = medir(lambda: buscar_en_frio(termino), args.repeticiones)
+        stats_cache = medir(lambda: indice.buscar(termino, True, 20), args.repeticiones)
+        print(
+            f"{termino:<20} {stats_like['p50_ms']:>12.2f} {len(like(termino)):>10} "
+            f"{stats_frio['p50_ms']:>12.3f} {stats_frio['p99_ms']:>12.3f} "
+            f"{stats_cache['p50_ms']:>13.4f} {len(indice.buscar(termino, True, 20)):>5}"
+        )
+
+    # Búsqueda tolerante a errores sobre un menú de tamaño realista
+    modelos = [ProductoResponse.model_validate(p) for p in productos[:args.productos_fuzzy]]
+    indice = ProductSearchIndex(modelos)
+    inicio = time.perf_counter()
+    indice.construir_difuso()
+    print(f"\nÍndice de bigramas construido en {(time.perf_counter() - inicio) * 1000:.0f} ms "
+          f"({args.productos_fuzzy} productos)\n")
+
+    def buscar_difuso_en_frio(termino: str):
+        indice.cache.clear()
+        return indice.buscar(termino, True, 20, fuzzy=True)
+
+    print(f"{'con errores':<20} {'sin fuzzy hits':>15} {'fuzzy p50 ms':>13} {'fuzzy p99 ms':>13} {'hits':>5}  primer resultado")
+    for termino in CON_ERRORES:
+        stats = medir(lambda: buscar_difuso_en_frio(termino), args.repeticiones)
+        resultados = buscar_difuso_en_frio(termino)
+        print(
+            f"{termino:<20} {len(indice.buscar(termino, True, 20)):>15} {stats['p50_ms']:>13.3f} "
+            f"{stats['p99_ms']:>13.3f} {len(resultados):>5}  {resultados[0].nombre if resultados else '-'}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark de latencia de `crear_compra` según el tamaño del carrito.
+
+Uso:
+    python scripts/benchmark_checkout.py [--repeticiones N]
+
+Imprime, para cada tamaño de carrito, la latencia media/p50/p99 y el número
+de sentencias SQL emitidas por compra. Con la búsqueda de productos en bloque
+el número de sentencias es constante y la latencia se mantiene plana.
+"""
+
+import argparse
+import asyncio
+
+from benchmark_utils import contar_consultas, crear_base_temporal, crear_usuario, medir_async, poblar_catalogo
+
+from database import SyncSessionAdapter
+from routers.compra import crear_compra
+from schemas import CompraCreate, DetalleCompraCreate
+
+TAMANOS_CARRITO = [1, 3, 6, 12, 24, 48]
+
+
+async def benchmark(repeticiones: int) -> None:
+    engine, SessionLocal = crear_base_temporal("checkout")
+    sync_db = SessionLocal(expire_on_commit=False)
+    db = SyncSessionAdapter(sync_db)
+    try:
+        ids = poblar_catalogo(sync_db, total_productos=max(TAMANOS_CARRITO))
+        usuario = crear_usuario(sync_db)
+
+        print(f"{'items':>6} {'sql/compra':>11} {'media ms':>10} {'p50 ms':>9} {'p99 ms':>9}")
+        for tamano in TAMANOS_CARRITO:
+            compra = CompraCreate(
+                productos=[DetalleCompraCreate(id_producto=i, cantidad=2) for i in ids[:tamano]]
+            )
+
+            async def comprar():
+                return await crear_compra(compra, current_user=usuario, db=db)
+
+            with contar_consultas(engine) as consultas:
+                await comprar()
+            stats = await medir_async(comprar, repeticiones)
+            print(
+                f"{tamano:>6} {consultas['total']:>11} {stats['media_ms']:>10.2f} "
+                f"{stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+            )
+    finally:
+        sync_db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de checkout vs tamaño del carrito.")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Compras por tamaño de carrito.")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.repeticiones))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+"Comprados juntos" y "populares ahora": consulta SQL por request vs `RecommendationEngine` en memoria.
+
+Uso:
+    python scripts/benchmark_comprados_juntos.py [--repeticiones 20]
+
+Para historiales crecientes de órdenes (de 1 a 4 productos cada una, con fechas
+repartidas en los últimos 90 días) compara:
+- el self-join sobre `detalles_compra` que haría falta para saber qué se compra
+  junto a un producto, contra `comprados_juntos` del motor;
+- el ranking por unidades vendidas en los últimos 7 días (GROUP BY con filtro de
+  fecha, la aproximación SQL más cercana al decaimiento), contra `populares`.
+También mide lo que tarda construir el motor y sumar una compra nueva.
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.orm import aliased, joinedload
+
+from benchmark_utils import crear_base_temporal, crear_usuario, medir, poblar_catalogo
+
+from models import Compra, DetalleCompra, EstadoCompra, Producto
+from schemas import ProductoResponse
+from services.recommendations import RecommendationEngine
+
+HISTORIALES = [1_000, 10_000, 50_000]
+PRODUCTOS = 200
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recomendaciones: SQL por request vs motor en memoria.")
+    parser.add_argument("--repeticiones", type=int, default=20, help="Requests por tamaño de historial.")
+    args = parser.parse_args()
+
+    _, SessionLocal = crear_base_temporal("comprados_juntos")
+    db = SessionLocal()
+    ids = poblar_catalogo(db, total_productos=PRODUCTOS)
+    usuario = crear_usuario(db)
+    azar = random.Random(11)
+    ahora = datetime.utcnow()
+    productos = [
+        ProductoResponse.model_validate(p)
+        for p in db.scalars(select(Producto).options(joinedload(Producto.tipo_producto))).all()
+    ]
+    disponibles = [p for p in productos if p.disponible]
+    # Un producto con muchas ventas, para que el self-join tenga trabajo
+    producto_x = ids[0]
+
+    otro = aliased(DetalleCompra)
+
+    def juntos_sql():
+        return db.execute(
+            select(otro.id_producto, func.count().label("veces"))
+            .join(DetalleCompra, DetalleCompra.id_compra == otro.id_compra)
+            .where(DetalleCompra.id_producto == producto_x, otro.id_producto != producto_x)
+            .group_by(otro.id_producto)
+            .order_by(desc("veces"))
+            .limit(5)
+        ).all()
+
+    def populares_sql():
+        return db.execute(
+            select(DetalleCompra.id_producto, func.sum(DetalleCompra.cantidad).label("unidades"))
+            .join(Compra, Compra.id == DetalleCompra.id_compra)
+            .where(Compra.fecha_hora >= ahora - timedelta(days=7))
+            .group_by(DetalleCompra.id_producto)
+            .order_by(desc("unidades"))
+            .limit(10)
+        ).all()
+
+    def cargar(desde):
+        ultima = db.scalar(select(func.max(Compra.id))) or 0
+        filas = db.execute(
+            select(DetalleCompra.id_compra, DetalleCompra.id_producto, DetalleCompra.cantidad, Compra.fecha_hora)
+            .join(Compra, Compra.id == DetalleCompra.id_compra)
+            .where(Compra.fecha_hora >= desde)
+            .order_by(DetalleCompra.id_compra)
+        ).all()
+        return ultima, filas
+
+    print(f"{'órdenes':>8} {'construir ms':>13} {'registrar ms':>13} {'juntos SQL ms':>14} "
+          f"{'juntos mem ms':>14} {'populares SQL ms':>17} {'populares mem ms':>17}")
+    creadas = 0
+    for total in HISTORIALES:
+        nuevas = total - creadas
+        db.execute(insert(Compra), [
+            {"id_usuario": usuario.id, "total": 1000.0, "estado": EstadoCompra.ENTREGADO,
+             "fecha_hora": ahora - timedelta(minutes=azar.randrange(90 * 24 * 60))}
+            for _ in range(nuevas)
+        ])
+        ids_compras = db.scalars(select(Compra.id).order_by(Compra.id.desc()).limit(nuevas)).all()
+        detalles = []
+        for id_compra in ids_compras:
+            en_orden = {producto_x} if azar.random() < 0.2 else set()
+            while len(en_orden) < azar.randint(1, 4):
+                en_orden.add(azar.choice(ids))
+            detalles.extend(
+                {"id_compra": id_compra, "id_producto": id_producto,
+                 "cantidad": azar.randint(1, 3), "precio_unitario_compra": 1000.0}
+                for id_producto in en_orden
+            )
+        db.execute(insert(DetalleCompra), detalles)
+        db.commit()
+        creadas = total
+
+        # Ventana de 90 días: el motor cuenta las mismas órdenes que el self-join
+        motor = RecommendationEngine(cargar, vida_media_horas=24, ttl=3600, ventana_horas=90 * 24)
+        inicio = time.perf_counter()
+        motor.construir()
+        construir_ms = (time.perf_counter() - inicio) * 1000
+
+        siguiente = [total + 1_000_000]
+
+        def registrar():
+            siguiente[0] += 1
+            motor.registrar_compra(siguiente[0], {azar.choice(ids): 1, azar.choice(ids): 2})
+
+        stats_registrar = medir(registrar, args.repeticiones)
+        stats_juntos_sql = medir(juntos_sql, args.repeticiones)
+        stats_juntos = medir(lambda: motor.comprados_juntos(producto_x, disponibles, 5), args.repeticiones)
+        stats_populares_sql = medir(populares_sql, args.repeticiones)
+        stats_populares = medir(lambda: motor.populares(disponibles, 10), args.repeticiones)
+        print(
+            f"{total:>8} {construir_ms:>13.0f} {stats_registrar['p50_ms']:>13.4f} "
+            f"{stats_juntos_sql['p50_ms']:>14.2f} {stats_juntos['p50_ms']:>14.4f} "
+            f"{stats_populares_sql['p50_ms']:>17.2f} {stats_populares['p50_ms']:>17.4f}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
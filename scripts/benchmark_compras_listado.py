@@ -0,0 +1,102 @@
+"""
+Verifica que `/compras/me` y `/compras/pendientes` serializan sin N+1.
+
+Uso:
+    python scripts/benchmark_compras_listado.py
+
+Crea lotes crecientes de órdenes, serializa la respuesta con `CompraResponse`
+(igual que FastAPI) y cuenta las sentencias SQL. Termina con código de salida
+1 si el número de consultas cambia con el número de órdenes.
+"""
+
+import asyncio
+import sys
+from typing import List, Tuple
+
+from fastapi import Request, Response
+
+from benchmark_utils import contar_consultas, crear_base_temporal, crear_usuario, medir_async, poblar_catalogo
+
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+import routers.compra as compras
+from database import SyncSessionAdapter
+from models import Producto, TipoProducto
+from routers.compra import crear_compra, listar_compras_pendientes, obtener_historial_compras
+from schemas import CompraCreate, CompraResponse, DetalleCompraCreate, ProductoResponse, TipoProductoResponse
+from services.menu_index import MenuIndex
+
+LOTES = [10, 100, 300]
+
+
+def request_historial() -> Request:
+    """Request mínima para `obtener_historial_compras` (solo se usa para armar el header Link)."""
+    return Request({
+        "type": "http", "method": "GET", "scheme": "http", "server": ("bench", 80),
+        "path": "/compras/me", "query_string": b"limit=100", "headers": [],
+    })
+
+
+async def verificar() -> Tuple[List[int], List[int]]:
+    engine, SessionLocal = crear_base_temporal("compras_listado")
+    sync_db = SessionLocal(expire_on_commit=False)
+    db = SyncSessionAdapter(sync_db)
+    consultas_me: List[int] = []
+    consultas_pendientes: List[int] = []
+    try:
+        ids = poblar_catalogo(sync_db, total_productos=20)
+        productos = sync_db.scalars(select(Producto).options(joinedload(Producto.tipo_producto))).all()
+        tipos = sync_db.scalars(select(TipoProducto)).all()
+        menu = (
+            [ProductoResponse.model_validate(p) for p in productos],
+            [TipoProductoResponse.model_validate(t) for t in tipos],
+        )
+        # El ETag de /compras/me usa la versión del menú: cargarlo de la base temporal, no de tapandtoast.db
+        compras.menu_index = MenuIndex(lambda: menu, ttl=3600)
+        compras.menu_index.recargar()
+        usuario = crear_usuario(sync_db)
+        compra = CompraCreate(
+            productos=[DetalleCompraCreate(id_producto=i, cantidad=1) for i in ids[:3]]
+        )
+
+        creadas = 0
+        print(f"{'ordenes':>8} {'sql /me':>8} {'sql /pendientes':>16} {'p50 /pendientes ms':>19}")
+        for lote in LOTES:
+            while creadas < lote:
+                await crear_compra(compra, current_user=usuario, db=db)
+                creadas += 1
+
+            async def serializar_pendientes():
+                sync_db.expire_all()
+                return [CompraResponse.model_validate(c) for c in await listar_compras_pendientes(db=db)]
+
+            sync_db.expire_all()
+            with contar_consultas(engine) as me:
+                historial = await obtener_historial_compras(
+                    request=request_historial(), response=Response(), cursor=None, limit=100,
+                    since=None, until=None, count=False, if_none_match=None, current_user=usuario, db=db,
+                )
+                [CompraResponse.model_validate(c) for c in historial]
+            with contar_consultas(engine) as pendientes:
+                await serializar_pendientes()
+            stats = await medir_async(serializar_pendientes, repeticiones=10)
+
+            consultas_me.append(me["total"])
+            consultas_pendientes.append(pendientes["total"])
+            print(f"{lote:>8} {me['total']:>8} {pendientes['total']:>16} {stats['p50_ms']:>19.2f}")
+    finally:
+        sync_db.close()
+    return consultas_me, consultas_pendientes
+
+
+def main() -> None:
+    consultas_me, consultas_pendientes = asyncio.run(verificar())
+    if len(set(consultas_me)) != 1 or len(set(consultas_pendientes)) != 1:
+        print("❌ El número de consultas crece con el número de órdenes (N+1).")
+        sys.exit(1)
+    print("✅ Número de consultas constante.")
+
+
+if __name__ == "__main__":
+    main()
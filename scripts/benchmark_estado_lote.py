@@ -0,0 +1,87 @@
+"""
+Cambiar de estado una bandeja de órdenes: una request por orden vs `PUT /compras/estado`.
+
+Uso:
+    python scripts/benchmark_estado_lote.py [--repeticiones 20]
+
+Para bandejas de distintos tamaños pasa órdenes de PAGADO a EN_PREPARACION
+llamando `actualizar_estado_compra` una vez por orden (lo que hacía la consola del
+staff) y llamando `actualizar_estado_compras` una sola vez con todos los ids.
+Imprime el tiempo por bandeja y las sentencias SQL de cada variante.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy import insert, select
+
+from benchmark_utils import contar_consultas, crear_base_temporal, crear_usuario, medir_async, poblar_catalogo
+
+from database import SyncSessionAdapter, configurar_sqlite
+from models import Compra, DetalleCompra, EstadoCompra
+from routers.compra import actualizar_estado_compra, actualizar_estado_compras
+from schemas import CompraEstadoLoteUpdate, CompraEstadoUpdate
+
+TAMANOS_BANDEJA = [1, 5, 20, 50]
+
+
+async def benchmark(repeticiones: int) -> None:
+    engine, SessionLocal = crear_base_temporal("estado_lote")
+    configurar_sqlite(engine)
+    engine.dispose()
+    sync_db = SessionLocal(expire_on_commit=False)
+    db = SyncSessionAdapter(sync_db)
+    ids_productos = poblar_catalogo(sync_db, total_productos=20)
+    id_usuario = crear_usuario(sync_db).id
+
+    def crear_bandeja(tamano: int):
+        inicio = (sync_db.scalar(select(Compra.id).order_by(Compra.id.desc()).limit(1)) or 0) + 1
+        rango = list(range(inicio, inicio + tamano))
+        sync_db.execute(insert(Compra), [
+            {"id": i, "id_usuario": id_usuario, "total": 2000.0, "estado": EstadoCompra.PAGADO} for i in rango
+        ])
+        sync_db.execute(insert(DetalleCompra), [
+            {"id_compra": i, "id_producto": ids_productos[(i + k) % len(ids_productos)],
+             "cantidad": 1, "precio_unitario_compra": 1000.0}
+            for i in rango for k in range(2)
+        ])
+        sync_db.commit()
+        return rango
+
+    en_preparacion = CompraEstadoUpdate(estado=EstadoCompra.EN_PREPARACION)
+
+    async def una_por_una(ids):
+        for compra_id in ids:
+            await actualizar_estado_compra(compra_id, en_preparacion, db=db)
+
+    async def en_lote(ids):
+        resultado = await actualizar_estado_compras(
+            CompraEstadoLoteUpdate(compra_ids=ids, estado=EstadoCompra.EN_PREPARACION), db=db
+        )
+        assert resultado.actualizadas == len(ids)
+
+    print(f"{'bandeja':>8} {'sql 1x1':>8} {'sql lote':>9} {'1x1 p50 ms':>11} {'lote p50 ms':>12}")
+    for tamano in TAMANOS_BANDEJA:
+        fila = []
+        for variante in (una_por_una, en_lote):
+            with contar_consultas(engine) as consultas:
+                await variante(crear_bandeja(tamano))
+            fila.append(consultas["total"])
+
+        stats = []
+        for variante in (una_por_una, en_lote):
+            bandejas = iter([crear_bandeja(tamano) for _ in range(repeticiones)])
+            stats.append(await medir_async(lambda: variante(next(bandejas)), repeticiones))
+        print(f"{tamano:>8} {fila[0]:>8} {fila[1]:>9} {stats[0]['p50_ms']:>11.2f} {stats[1]['p50_ms']:>12.2f}")
+    sync_db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Transiciones de estado: una por una vs en lote.")
+    parser.add_argument("--repeticiones", type=int, default=20, help="Bandejas por tamaño y variante.")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.repeticiones))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Barrido de QR vencidos: duración total vs tamaño de lote (transacción más larga).
+
+Uso:
+    python scripts/benchmark_expiracion_qr.py [--ordenes 100000]
+
+Crea `--ordenes` órdenes con QR ACTIVO (la mitad vencidas, repartidas entre los
+estados) y las expira con `QRExpirySweeper.barrer` usando distintos tamaños de
+lote. Un lote grande termina antes, pero retiene el lock de escritura de SQLite
+más tiempo: mientras dura, ninguna compra ni canje puede escribir. La columna
+"lote más largo" es esa espera máxima.
+"""
+
+import argparse
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select, update
+
+from benchmark_utils import crear_base_temporal, crear_usuario
+
+from database import configurar_sqlite
+from models import QR, Compra, EstadoCompra, EstadoQR
+from services.qr_expiry import QRExpirySweeper
+
+TAMANOS_LOTE = [100, 500, 5_000, 50_000]
+TTL_HORAS = {
+    EstadoCompra.PAGADO: 24,
+    EstadoCompra.EN_PREPARACION: 24,
+    EstadoCompra.LISTO: 12,
+    EstadoCompra.ENTREGADO: 0,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Barrido de expiración de QR según el tamaño de lote.")
+    parser.add_argument("--ordenes", type=int, default=100_000, help="Órdenes con QR activo.")
+    args = parser.parse_args()
+
+    engine, SessionLocal = crear_base_temporal("expiracion_qr")
+    configurar_sqlite(engine)
+    engine.dispose()
+    ahora = datetime.utcnow()
+    azar = random.Random(5)
+    with SessionLocal() as db:
+        id_usuario = crear_usuario(db).id
+        compras, qrs = [], []
+        for i in range(1, args.ordenes + 1):
+            estado = azar.choice(list(TTL_HORAS))
+            vencida = i % 2 == 0
+            horas = TTL_HORAS[estado] + 1 if vencida else max(TTL_HORAS[estado] - 1, 0)
+            fecha = ahora - timedelta(hours=horas)
+            compras.append({
+                "id": i, "id_usuario": id_usuario, "total": 1000.0, "estado": estado,
+                "fecha_hora": fecha, "fecha_en_preparacion": fecha, "fecha_listo": fecha,
+                # Las ENTREGADO recientes (sin vencer) todavía no tienen fecha de entrega
+                "fecha_entregado": fecha if vencida else None,
+            })
+            qrs.append({"id_compra": i, "codigo_qr_hash": f"{i:064x}", "estado": EstadoQR.ACTIVO})
+        db.execute(insert(Compra), compras)
+        db.execute(insert(QR), qrs)
+        db.commit()
+
+    print(f"{args.ordenes} órdenes con QR activo\n")
+    print(f"{'lote':>7} {'expirados':>10} {'lotes':>6} {'total ms':>9} {'QR/s':>9} {'lote más largo ms':>18}")
+    for tamano in TAMANOS_LOTE:
+        with SessionLocal() as db:
+            db.execute(update(QR).values(estado=EstadoQR.ACTIVO))
+            db.commit()
+        # ENTREGADO con TTL 0 expira todo lo que tenga fecha_entregado; las demás, solo las vencidas
+        barrido = QRExpirySweeper(engine, TTL_HORAS, intervalo=0, tamano_lote=tamano)
+        expirados = barrido.barrer(ahora)
+        stats = barrido.stats()
+        with SessionLocal() as db:
+            activos = db.scalar(select(func.count()).select_from(QR).where(QR.estado == EstadoQR.ACTIVO))
+        assert expirados + activos == args.ordenes
+        print(f"{tamano:>7} {expirados:>10} {stats['lotes']:>6} {stats['ultimo_barrido_ms']:>9.0f} "
+              f"{expirados / (stats['ultimo_barrido_ms'] / 1000):>9.0f} {stats['max_lote_ms']:>18.1f}")
+
+    with SessionLocal() as db:
+        db.execute(update(QR).values(estado=EstadoQR.ACTIVO))
+        db.commit()
+    barrido = QRExpirySweeper(engine, TTL_HORAS, intervalo=0, tamano_lote=500)
+    barrido.barrer(ahora)
+    barrido.barrer(ahora)
+    print(f"\nBarrido sin nada que expirar: {barrido.stats()['ultimo_barrido_ms']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Microbenchmark de verificación de JWT con y sin el cache de tokens verificados.
+
+Uso:
+    python scripts/benchmark_jwt_decode.py [--iteraciones N]
+
+Compara `jwt.decode` directo (lo que se hacía en cada request) con
+`auth.decode_access_token` con el cache activado (TOKEN_CACHE_ENABLED).
+"""
+
+import argparse
+import time
+from datetime import timedelta
+
+import benchmark_utils  # noqa: F401  (agrega la raíz del proyecto al path)
+
+import auth
+
+
+def _medir_us(funcion, iteraciones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(iteraciones):
+        funcion()
+    return (time.perf_counter() - inicio) / iteraciones * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de decodificación de JWT.")
+    parser.add_argument("--iteraciones", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = auth.create_access_token({"sub": "bench@test.com"}, expires_delta=timedelta(minutes=30))
+
+    auth.TOKEN_CACHE_ENABLED = False
+    sin_cache = _medir_us(lambda: auth.decode_access_token(token), args.iteraciones)
+
+    auth.TOKEN_CACHE_ENABLED = True
+    auth.token_cache.clear()
+    con_cache = _medir_us(lambda: auth.decode_access_token(token), args.iteraciones)
+
+    print(f"Sin cache: {sin_cache:8.2f} µs/token")
+    print(f"Con cache: {con_cache:8.2f} µs/token  ({sin_cache / con_cache:.1f}x)")
+    print(f"Cache: {auth.token_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Costo de armar la respuesta de `GET /productos/`: serializar en cada request vs JSON pre-serializado.
+
+Uso:
+    python scripts/benchmark_menu.py [--productos 200] [--repeticiones 500]
+
+"serializar" repite lo que hacía FastAPI en cada request (validar la lista con
+`ProductoResponse`, `jsonable_encoder` y `JSONResponse`). "prerender" sirve la
+respuesta de `MenuIndex`, que se genera una sola vez por versión del catálogo.
+También imprime el tamaño del cuerpo en cada codificación.
+"""
+
+import argparse
+from typing import List
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+
+from benchmark_utils import crear_base_temporal, medir, poblar_catalogo
+
+from models import Producto, TipoProducto
+from schemas import ProductoResponse, TipoProductoResponse
+from services.menu_index import MenuIndex
+
+
+def request_con(accept_encoding: str) -> Request:
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    return Request({"type": "http", "method": "GET", "path": "/productos/", "headers": headers, "query_string": b""})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serialización del menú por request vs pre-serializada.")
+    parser.add_argument("--productos", type=int, default=200, help="Productos en el catálogo.")
+    parser.add_argument("--repeticiones", type=int, default=500, help="Respuestas a generar por variante.")
+    args = parser.parse_args()
+
+    _, SessionLocal = crear_base_temporal("menu")
+    db = SessionLocal()
+    poblar_catalogo(db, total_productos=args.productos)
+    productos = db.scalars(select(Producto).options(joinedload(Producto.tipo_producto))).all()
+    tipos = db.scalars(select(TipoProducto)).all()
+
+    def cargar():
+        return (
+            [ProductoResponse.model_validate(p) for p in productos],
+            [TipoProductoResponse.model_validate(t) for t in tipos],
+        )
+
+    menu = MenuIndex(cargar, ttl=3600)
+    menu.recargar()
+    adaptador = TypeAdapter(List[ProductoResponse])
+
+    def serializar():
+        return JSONResponse(jsonable_encoder(adaptador.validate_python(productos, from_attributes=True)))
+
+    print(f"{'variante':>20} {'media ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'bytes':>8}")
+    stats = medir(serializar, args.repeticiones)
+    print(
+        f"{'serializar':>20} {stats['media_ms']:>10.3f} {stats['p50_ms']:>9.3f} "
+        f"{stats['p99_ms']:>9.3f} {len(serializar().body):>8}"
+    )
+    render = menu.json_listado()
+    for accept_encoding in ("", "gzip", "br, gzip"):
+        request = request_con(accept_encoding)
+        stats = medir(lambda: render.responder(request), args.repeticiones)
+        respuesta = render.responder(request)
+        nombre = f"prerender {respuesta.headers.get('content-encoding', 'identity')}"
+        print(
+            f"{nombre:>20} {stats['media_ms']:>10.3f} {stats['p50_ms']:>9.3f} "
+            f"{stats['p99_ms']:>9.3f} {len(respuesta.body):>8}"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
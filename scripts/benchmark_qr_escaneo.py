@@ -0,0 +1,148 @@
+"""
+Escaneos de QR por segundo: el canje anterior (SELECT + carga de la compra + commit)
+vs el canje con UPDATE condicionales y el índice de códigos en memoria.
+
+Uso:
+    python scripts/benchmark_qr_escaneo.py [--historial 50000] [--escaneos 1000]
+
+Sobre una base con `--historial` órdenes ya entregadas, prepara órdenes en estado
+LISTO y las canjea una por una, secuencialmente como en la fila de la puerta:
+- "anterior": lo que hacía `escanear_qr` antes (buscar el QR, cargar la compra con
+  detalles, productos y usuario, modificar y commit, publicar el evento SSE);
+  como el endpoint, sobre `SyncSessionAdapter` (cada sentencia pasa por el threadpool);
+- "nuevo": el endpoint actual sin pantallas escuchando y con una pantalla del
+  staff suscrita (ahí sí carga la compra para publicarla).
+También mide el rechazo de códigos ya canjeados: SELECT por código vs el índice.
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload
+
+from benchmark_utils import contar_consultas, crear_base_temporal, crear_usuario, poblar_catalogo
+
+import routers.compra as compra_router
+from database import SyncSessionAdapter, configurar_sqlite
+from models import QR, Compra, DetalleCompra, EstadoCompra, EstadoQR
+from routers.compra import CARGA_COMPRA_COMPLETA, escanear_qr, generar_codigo_qr, publicar_compra
+from schemas import QREscanear
+from services.order_events import CANAL_STAFF, hub
+from services.qr_redemption import QRIndex, leer_codigos
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Escaneos de QR por segundo: canje anterior vs nuevo.")
+    parser.add_argument("--historial", type=int, default=50_000, help="Órdenes entregadas previas en la base.")
+    parser.add_argument("--escaneos", type=int, default=1_000, help="Canjes por variante.")
+    args = parser.parse_args()
+    asyncio.run(benchmark(args.historial, args.escaneos))
+
+
+async def benchmark(historial: int, escaneos: int) -> None:
+    engine, SessionLocal = crear_base_temporal("qr_escaneo")
+    # Mismos PRAGMAs que la app (WAL): si no, el fsync de cada commit tapa todo lo demás
+    configurar_sqlite(engine)
+    engine.dispose()
+    sync_db = SessionLocal(expire_on_commit=False)
+    db = SyncSessionAdapter(sync_db)
+    ids = poblar_catalogo(sync_db, total_productos=20)
+    id_usuario = crear_usuario(sync_db).id
+
+    def crear_ordenes(cantidad: int, estado: EstadoCompra, estado_qr: EstadoQR):
+        inicio = (sync_db.scalar(select(Compra.id).order_by(Compra.id.desc()).limit(1)) or 0) + 1
+        rango = range(inicio, inicio + cantidad)
+        codigos = [generar_codigo_qr() for _ in rango]
+        sync_db.execute(insert(Compra), [
+            {"id": i, "id_usuario": id_usuario, "total": 3000.0, "estado": estado} for i in rango
+        ])
+        sync_db.execute(insert(DetalleCompra), [
+            {"id_compra": i, "id_producto": ids[(i + k) % len(ids)], "cantidad": 1, "precio_unitario_compra": 1000.0}
+            for i in rango for k in range(3)
+        ])
+        sync_db.execute(insert(QR), [
+            {"id_compra": i, "codigo_qr_hash": codigo, "estado": estado_qr} for i, codigo in zip(rango, codigos)
+        ])
+        sync_db.commit()
+        return codigos
+
+    canjeados = crear_ordenes(historial, EstadoCompra.ENTREGADO, EstadoQR.CANJEADO)
+
+    def indice() -> QRIndex:
+        def cargar():
+            with SessionLocal() as sesion:
+                return leer_codigos(sesion)
+
+        def consultar(codigo: str):
+            with SessionLocal() as sesion:
+                return sesion.scalar(select(QR.estado).where(QR.codigo_qr_hash == codigo))
+        return QRIndex(cargar, consultar, ttl=3600)
+
+    async def escanear_anterior(codigo: str) -> dict:
+        qr = await db.scalar(select(QR).where(QR.codigo_qr_hash == codigo))
+        compra = await db.scalar(
+            select(Compra)
+            .options(*CARGA_COMPRA_COMPLETA, joinedload(Compra.usuario))
+            .where(Compra.id == qr.id_compra)
+        )
+        qr.estado = EstadoQR.CANJEADO
+        compra.estado = EstadoCompra.ENTREGADO
+        compra.fecha_entregado = datetime.utcnow()
+        await db.commit()
+        publicar_compra("compra_actualizada", compra)
+        return {"compra_id": compra.id, "cliente": compra.usuario.nombre, "total": compra.total}
+
+    async def escanear_nuevo(codigo: str) -> dict:
+        return await escanear_qr(QREscanear(codigo_qr_hash=codigo), db=db)
+
+    async def correr(nombre: str, escanear) -> None:
+        codigos = crear_ordenes(escaneos, EstadoCompra.LISTO, EstadoQR.ACTIVO)
+        compra_router.qr_index = indice()
+        compra_router.qr_index.recargar()
+        sync_db.expunge_all()
+        with contar_consultas(engine) as consultas:
+            await escanear(codigos[0])
+        inicio = time.perf_counter()
+        for codigo in codigos[1:]:
+            await escanear(codigo)
+        duracion = time.perf_counter() - inicio
+        sync_db.expunge_all()
+        print(f"{nombre:<32} {consultas['total']:>8} {(len(codigos) - 1) / duracion:>12.0f} "
+              f"{duracion * 1000 / (len(codigos) - 1):>12.3f}")
+
+    print(f"Historial: {historial} órdenes entregadas, {escaneos} canjes por variante\n")
+    print(f"{'canje':<32} {'sql/esc.':>8} {'escaneos/s':>12} {'ms/escaneo':>12}")
+    await correr("anterior", escanear_anterior)
+    await correr("nuevo (sin pantallas)", escanear_nuevo)
+    suscripcion = hub.suscribir(CANAL_STAFF)
+    await correr("anterior (pantalla del staff)", escanear_anterior)
+    await correr("nuevo (pantalla del staff)", escanear_nuevo)
+    hub.cancelar(suscripcion)
+
+    usados = canjeados[:escaneos]
+    print(f"\n{'código ya canjeado':<32} {'sql/esc.':>8} {'escaneos/s':>12}")
+    with contar_consultas(engine) as consultas:
+        inicio = time.perf_counter()
+        for codigo in usados:
+            assert sync_db.scalar(select(QR.estado).where(QR.codigo_qr_hash == codigo)) == EstadoQR.CANJEADO
+        duracion = time.perf_counter() - inicio
+    print(f"{'SELECT por código':<32} {consultas['total'] / len(usados):>8.0f} {len(usados) / duracion:>12.0f}")
+    indice_codigos = indice()
+    inicio = time.perf_counter()
+    indice_codigos.recargar()
+    carga_ms = (time.perf_counter() - inicio) * 1000
+    with contar_consultas(engine) as consultas:
+        inicio = time.perf_counter()
+        for codigo in usados:
+            assert indice_codigos.estado(codigo) == EstadoQR.CANJEADO
+        duracion = time.perf_counter() - inicio
+    print(f"{'índice en memoria':<32} {consultas['total'] / len(usados):>8.0f} {len(usados) / duracion:>12.0f}")
+    print(f"\nCarga completa del índice ({indice_codigos.stats()['codigos']} códigos): {carga_ms:.0f} ms")
+    sync_db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+`/productos/recomendados/me`: agregación en vivo por request vs matrices precalculadas.
+
+Uso:
+    python scripts/benchmark_recomendaciones_personales.py [--usuarios 2000] [--repeticiones 50]
+
+Genera un historial sintético (cada usuario con unas pocas órdenes de 1 a 4
+productos, con gustos sesgados hacia una parte del catálogo) y compara:
+- "en vivo": la consulta que haría falta por request, que cruza las compras del
+  usuario con todas las órdenes que contienen esos productos;
+- "precalculado": buscar la lista del usuario en `PersonalRecommender`.
+También mide cuánto tarda el recálculo completo de las matrices (en segundo plano).
+Requiere numpy y scipy.
+"""
+
+import argparse
+import random
+
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.orm import aliased
+
+from benchmark_utils import crear_base_temporal, medir, poblar_catalogo
+
+from models import Compra, DetalleCompra, EstadoCompra, Usuario
+from services.personal_recommendations import PersonalRecommender, matrices_disponibles
+
+PRODUCTOS = 200
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recomendaciones personales: en vivo vs precalculadas.")
+    parser.add_argument("--usuarios", type=int, default=2000, help="Usuarios con historial.")
+    parser.add_argument("--ordenes-por-usuario", type=int, default=10, help="Órdenes promedio por usuario.")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Requests a medir por método.")
+    args = parser.parse_args()
+    if not matrices_disponibles():
+        raise SystemExit("Instalar numpy y scipy para correr este benchmark.")
+
+    _, SessionLocal = crear_base_temporal("recomendaciones_personales")
+    db = SessionLocal()
+    ids = poblar_catalogo(db, total_productos=PRODUCTOS)
+    azar = random.Random(5)
+
+    db.execute(insert(Usuario), [
+        {"nombre": f"U{i}", "email": f"u{i}@bench.com", "password": "x", "saldo": 0.0}
+        for i in range(args.usuarios)
+    ])
+    ids_usuarios = db.scalars(select(Usuario.id)).all()
+    compras = [
+        {"id_usuario": id_usuario, "total": 1000.0, "estado": EstadoCompra.ENTREGADO}
+        for id_usuario in ids_usuarios
+        for _ in range(azar.randint(1, 2 * args.ordenes_por_usuario))
+    ]
+    db.execute(insert(Compra), compras)
+    detalles = []
+    for id_compra, id_usuario in db.execute(select(Compra.id, Compra.id_usuario)).all():
+        # Cada usuario prefiere una "franja" del catálogo
+        favoritos = ids[(id_usuario * 7) % (PRODUCTOS - 20):][:20]
+        en_orden = {azar.choice(favoritos if azar.random() < 0.7 else ids) for _ in range(azar.randint(1, 4))}
+        detalles.extend(
+            {"id_compra": id_compra, "id_producto": id_producto,
+             "cantidad": azar.randint(1, 3), "precio_unitario_compra": 1000.0}
+            for id_producto in en_orden
+        )
+    db.execute(insert(DetalleCompra), detalles)
+    db.commit()
+    print(f"{len(ids_usuarios)} usuarios, {len(compras)} órdenes, {len(detalles)} líneas\n")
+
+    mias = aliased(DetalleCompra)
+    misma_orden = aliased(DetalleCompra)
+
+    def en_vivo(id_usuario: int):
+        # Productos que aparecen en órdenes que contienen algo que el usuario compró
+        return db.execute(
+            select(misma_orden.id_producto, func.count().label("puntaje"))
+            .select_from(Compra)
+            .join(mias, mias.id_compra == Compra.id)
+            .join(DetalleCompra, DetalleCompra.id_producto == mias.id_producto)
+            .join(misma_orden, misma_orden.id_compra == DetalleCompra.id_compra)
+            .where(Compra.id_usuario == id_usuario)
+            .group_by(misma_orden.id_producto)
+            .order_by(desc("puntaje"))
+            .limit(5)
+        ).all()
+
+    def cargar(desde):
+        # Todo el historial sintético, sin ventana
+        return db.execute(
+            select(DetalleCompra.id_compra, Compra.id_usuario, DetalleCompra.id_producto, DetalleCompra.cantidad)
+            .join(Compra, Compra.id == DetalleCompra.id_compra)
+        ).all()
+
+    recomendador = PersonalRecommender(cargar, ttl=3600, top=50)
+    recalculo = medir(recomendador.recalcular, 3)
+    print(f"Recálculo completo (lectura + matrices): p50 {recalculo['p50_ms']:.0f} ms\n")
+
+    print(f"{'método':>14} {'media ms':>10} {'p50 ms':>9} {'p99 ms':>9}")
+    for nombre, funcion in (
+        ("en vivo", lambda: en_vivo(azar.choice(ids_usuarios))),
+        ("precalculado", lambda: recomendador.para_usuario(azar.choice(ids_usuarios))[:5]),
+    ):
+        stats = medir(funcion, args.repeticiones)
+        print(f"{nombre:>14} {stats['media_ms']:>10.3f} {stats['p50_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+`/productos/recomendados`: GROUP BY sobre todo el historial vs ranking precalculado.
+
+Uso:
+    python scripts/benchmark_recomendados.py [--repeticiones 20]
+
+Para historiales de ventas crecientes compara la consulta que agregaba
+`detalles_compra` en cada request con `PopularityRanking`, que responde desde
+los contadores de `popularidad_productos` ya ordenados en memoria.
+"""
+
+import argparse
+import random
+
+from sqlalchemy import desc, func, insert, select
+from sqlalchemy.orm import joinedload, selectinload
+
+from benchmark_utils import crear_base_temporal, crear_usuario, medir, poblar_catalogo
+
+from models import Compra, DetalleCompra, EstadoCompra, PopularidadProducto, Producto
+from schemas import ProductoResponse
+from services.popularity import PopularityRanking, reconstruir_popularidad
+
+HISTORIALES = [1_000, 10_000, 100_000]
+PRODUCTOS = 200
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recomendados: agregación por request vs ranking precalculado.")
+    parser.add_argument("--repeticiones", type=int, default=20, help="Requests por tamaño de historial.")
+    args = parser.parse_args()
+
+    _, SessionLocal = crear_base_temporal("recomendados")
+    db = SessionLocal()
+    ids = poblar_catalogo(db, total_productos=PRODUCTOS)
+    usuario = crear_usuario(db)
+    azar = random.Random(7)
+
+    def consulta_agrupada():
+        return db.execute(
+            select(Producto, func.count(DetalleCompra.id_producto).label("total_vendido"))
+            .options(selectinload(Producto.tipo_producto))
+            .outerjoin(DetalleCompra, Producto.id == DetalleCompra.id_producto)
+            .where(Producto.disponible == True)
+            .group_by(Producto.id)
+            .order_by(desc("total_vendido"), Producto.id)
+            .limit(5)
+        ).all()
+
+    productos = [
+        ProductoResponse.model_validate(p)
+        for p in db.scalars(select(Producto).options(joinedload(Producto.tipo_producto))).all()
+    ]
+
+    print(f"{'detalles':>9} {'GROUP BY p50 ms':>16} {'ranking p50 ms':>15} {'ranking p99 ms':>15}")
+    creados = 0
+    for total in HISTORIALES:
+        compras = [{"id_usuario": usuario.id, "total": 1000.0, "estado": EstadoCompra.ENTREGADO}
+                   for _ in range(total - creados)]
+        db.execute(insert(Compra), compras)
+        ids_compras = db.scalars(select(Compra.id).order_by(Compra.id.desc()).limit(total - creados)).all()
+        db.execute(insert(DetalleCompra), [
+            {"id_compra": id_compra, "id_producto": azar.choice(ids), "cantidad": 1, "precio_unitario_compra": 1000.0}
+            for id_compra in ids_compras
+        ])
+        db.commit()
+        creados = total
+        reconstruir_popularidad(db)
+
+        ranking = PopularityRanking(
+            lambda: dict(db.execute(select(PopularidadProducto.id_producto, PopularidadProducto.ordenes)).all()),
+            ttl=3600,
+        )
+        ranking.recargar()
+        version = 0
+
+        def desde_ranking():
+            return ranking.top(productos, version, 5)
+
+        stats_sql = medir(consulta_agrupada, args.repeticiones)
+        stats_ranking = medir(desde_ranking, args.repeticiones)
+        print(f"{total:>9} {stats_sql['p50_ms']:>16.2f} {stats_ranking['p50_ms']:>15.4f} {stats_ranking['p99_ms']:>15.4f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
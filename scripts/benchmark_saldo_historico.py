@@ -0,0 +1,103 @@
+"""
+Saldo a una fecha: sumar recargas y compras vs el libro de movimientos.
+
+Uso:
+    python scripts/benchmark_saldo_historico.py [--repeticiones 50]
+
+Para un usuario con historiales crecientes compara reconstruir el saldo a una
+fecha sumando `recargas_saldo` y `compras` (lo único posible antes del libro)
+contra leer el último movimiento de `movimientos_saldo` hasta esa fecha. También
+mide la verificación del libro completa y la incremental (desde los snapshots).
+"""
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from benchmark_utils import crear_base_temporal, crear_usuario, medir
+
+from models import Compra, EstadoCompra, MovimientoSaldo, RecargaSaldoEvento, SnapshotSaldo, TipoMovimientoSaldo
+from services.wallet import a_centavos, consulta_saldo_en, verificar_libro
+
+HISTORIALES = [1_000, 10_000, 100_000]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Saldo histórico: agregación vs libro de movimientos.")
+    parser.add_argument("--repeticiones", type=int, default=50, help="Consultas por tamaño de historial.")
+    args = parser.parse_args()
+
+    _, SessionLocal = crear_base_temporal("saldo_historico")
+    db = SessionLocal()
+    usuario = crear_usuario(db, saldo=0.0)
+    id_usuario = usuario.id
+    azar = random.Random(9)
+    inicio_historial = datetime(2024, 1, 1)
+    saldo, instante, creados = 0.0, inicio_historial, 0
+
+    def por_agregacion(fecha: datetime) -> float:
+        recargas = db.scalar(
+            select(func.coalesce(func.sum(RecargaSaldoEvento.monto), 0))
+            .where(RecargaSaldoEvento.id_usuario == id_usuario, RecargaSaldoEvento.fecha_hora <= fecha)
+        )
+        compras = db.scalar(
+            select(func.coalesce(func.sum(Compra.total), 0))
+            .where(Compra.id_usuario == id_usuario, Compra.fecha_hora <= fecha)
+        )
+        return recargas - compras
+
+    print(f"{'movimientos':>11} {'agregación p50 ms':>18} {'libro p50 ms':>13} "
+          f"{'verificar todo ms':>18} {'verificar incr. ms':>19}")
+    for total in HISTORIALES:
+        recargas, compras, movimientos = [], [], []
+        for _ in range(total - creados):
+            instante += timedelta(minutes=azar.randint(1, 30))
+            if saldo < 5000 or azar.random() < 0.3:
+                monto = float(azar.randint(1, 20) * 1000)
+                saldo += monto
+                recargas.append({"id_usuario": id_usuario, "monto": monto, "fecha_hora": instante})
+                tipo = TipoMovimientoSaldo.RECARGA
+            else:
+                monto = -float(azar.randint(1, 5) * 1000)
+                saldo += monto
+                compras.append({"id_usuario": id_usuario, "total": -monto, "fecha_hora": instante,
+                                "estado": EstadoCompra.ENTREGADO})
+                tipo = TipoMovimientoSaldo.COMPRA
+            movimientos.append({"id_usuario": id_usuario, "tipo": tipo, "monto_centavos": a_centavos(monto),
+                                "saldo_centavos": a_centavos(saldo), "fecha_hora": instante})
+        for tabla, filas in ((RecargaSaldoEvento, recargas), (Compra, compras), (MovimientoSaldo, movimientos)):
+            if filas:
+                db.execute(insert(tabla), filas)
+        db.commit()
+        db.get(type(usuario), id_usuario).saldo = saldo
+        db.commit()
+        creados = total
+
+        rango = (instante - inicio_historial).total_seconds()
+
+        def fecha_al_azar() -> datetime:
+            return inicio_historial + timedelta(seconds=azar.uniform(0, rango))
+
+        stats_agregacion = medir(lambda: por_agregacion(fecha_al_azar()), args.repeticiones)
+        stats_libro = medir(lambda: db.scalar(consulta_saldo_en(id_usuario, fecha_al_azar())), args.repeticiones)
+
+        db.query(SnapshotSaldo).delete()
+        db.commit()
+        inicio = time.perf_counter()
+        resultado = verificar_libro(db)
+        completa_ms = (time.perf_counter() - inicio) * 1000
+        assert not resultado["descuadres"], resultado["descuadres"][:3]
+        inicio = time.perf_counter()
+        verificar_libro(db)
+        incremental_ms = (time.perf_counter() - inicio) * 1000
+
+        print(f"{total:>11} {stats_agregacion['p50_ms']:>18.2f} {stats_libro['p50_ms']:>13.3f} "
+              f"{completa_ms:>18.0f} {incremental_ms:>19.2f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Throughput de escritura concurrente en SQLite, antes y después de los PRAGMAs.
+
+Uso:
+    python scripts/benchmark_sqlite_escritura.py [--hilos 16] [--transacciones 200]
+
+Varios hilos repiten la transacción de `recargar_saldo` (UPDATE del saldo +
+INSERT del evento) mientras otros leen el menú, primero con el engine por
+defecto (journal DELETE, synchronous FULL) y luego con la configuración de
+`database.py` (WAL, synchronous=NORMAL, busy_timeout, mmap). Imprime commits
+por segundo, latencias y cuántas transacciones fallaron con "database is locked".
+"""
+
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.exc import OperationalError
+
+from benchmark_utils import crear_base_temporal, crear_usuario, poblar_catalogo, resumir_latencias
+
+from database import configurar_sqlite, opciones_pool
+from models import Producto, RecargaSaldoEvento, Usuario
+
+
+def correr(configurado: bool, hilos: int, transacciones: int) -> Dict[str, float]:
+    engine_base, SessionLocal = crear_base_temporal("sqlite_escritura")
+    url = engine_base.url.render_as_string(hide_password=False)
+    db = SessionLocal()
+    poblar_catalogo(db, total_productos=200)
+    ids_usuarios = [crear_usuario(db, email=f"bench{i}@test.com").id for i in range(hilos)]
+    db.close()
+    engine_base.dispose()
+
+    if configurado:
+        engine = create_engine(url, connect_args={"check_same_thread": False}, **opciones_pool(url))
+        configurar_sqlite(engine)
+    else:
+        engine = create_engine(url, connect_args={"check_same_thread": False})
+
+    latencias: List[float] = []
+    errores = {"locked": 0}
+    lock = threading.Lock()
+    detener_lectores = threading.Event()
+
+    def escritor(id_usuario: int) -> None:
+        for _ in range(transacciones):
+            inicio = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(update(Usuario).where(Usuario.id == id_usuario).values(saldo=Usuario.saldo + 1))
+                    conn.execute(RecargaSaldoEvento.__table__.insert().values(id_usuario=id_usuario, monto=1))
+            except OperationalError:
+                with lock:
+                    errores["locked"] += 1
+                continue
+            with lock:
+                latencias.append((time.perf_counter() - inicio) * 1000)
+
+    def lector() -> None:
+        while not detener_lectores.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(select(Producto).where(Producto.disponible == True)).all()
+            except OperationalError:
+                pass
+
+    lectores = [threading.Thread(target=lector) for _ in range(max(1, hilos // 4))]
+    for hilo in lectores:
+        hilo.start()
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=hilos) as pool:
+        list(pool.map(escritor, ids_usuarios))
+    duracion = time.perf_counter() - inicio
+    detener_lectores.set()
+    for hilo in lectores:
+        hilo.join()
+    engine.dispose()
+
+    return {"commits_s": len(latencias) / duracion, "locked": errores["locked"], **resumir_latencias(latencias)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Escrituras concurrentes en SQLite con y sin PRAGMAs.")
+    parser.add_argument("--hilos", type=int, default=16, help="Hilos escritores.")
+    parser.add_argument("--transacciones", type=int, default=200, help="Transacciones por hilo.")
+    args = parser.parse_args()
+
+    print(f"{'config':>10} {'commits/s':>10} {'locked':>7} {'p50 ms':>8} {'p99 ms':>8}")
+    for configurado in (False, True):
+        stats = correr(configurado, args.hilos, args.transacciones)
+        nombre = "pragmas" if configurado else "default"
+        print(
+            f"{nombre:>10} {stats['commits_s']:>10.0f} {stats['locked']:>7} "
+            f"{stats['p50_ms']:>8.2f} {stats['p99_ms']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
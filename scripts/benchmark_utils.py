@@ -0,0 +1,107 @@
+"""
+Utilidades compartidas por los scripts de benchmark.
+
+Cada benchmark trabaja sobre una base SQLite temporal (nunca sobre
+`tapandtoast.db`) para que las mediciones sean repetibles.
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+# Agregar el directorio raíz al path para importar módulos internos
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import Base
+from models import Producto, TipoProducto, Usuario
+
+
+def crear_base_temporal(prefijo: str = "bench") -> Tuple[Engine, sessionmaker]:
+    """Crea una base SQLite temporal con el esquema completo y devuelve (engine, SessionLocal)."""
+    directorio = tempfile.mkdtemp(prefix=f"{prefijo}_")
+    url = f"sqlite:///{os.path.join(directorio, 'bench.db')}"
+    engine = create_engine(url, connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def poblar_catalogo(db: Session, total_productos: int, total_tipos: int = 4) -> List[int]:
+    """Inserta un catálogo sintético y devuelve los IDs de producto."""
+    tipos = [TipoProducto(nombre=f"Categoria {i}") for i in range(total_tipos)]
+    db.add_all(tipos)
+    db.flush()
+    productos = [
+        Producto(
+            nombre=f"Producto {i}",
+            descripcion=f"Descripción del producto {i}",
+            precio=1000.0 + (i % 50) * 100,
+            disponible=True,
+            id_tipo=tipos[i % total_tipos].id,
+        )
+        for i in range(total_productos)
+    ]
+    db.add_all(productos)
+    db.commit()
+    return [p.id for p in productos]
+
+
+def crear_usuario(db: Session, email: str = "bench@test.com", saldo: float = 1e12) -> Usuario:
+    """Crea un usuario de prueba (sin bcrypt, la contraseña no se usa)."""
+    usuario = Usuario(nombre="Bench", email=email, password="x", saldo=saldo)
+    db.add(usuario)
+    db.commit()
+    db.refresh(usuario)
+    return usuario
+
+
+@contextmanager
+def contar_consultas(engine: Engine):
+    """Cuenta las sentencias SQL ejecutadas dentro del bloque: `with contar_consultas(e) as c: ...; c["total"]`."""
+    contador = {"total": 0}
+
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        contador["total"] += 1
+
+    event.listen(engine, "before_cursor_execute", _antes)
+    try:
+        yield contador
+    finally:
+        event.remove(engine, "before_cursor_execute", _antes)
+
+
+def medir(funcion: Callable[[], object], repeticiones: int = 50) -> Dict[str, float]:
+    """Ejecuta `funcion` varias veces y devuelve latencias en milisegundos."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resumir_latencias(tiempos)
+
+
+async def medir_async(funcion: Callable[[], Awaitable[object]], repeticiones: int = 50) -> Dict[str, float]:
+    """Como `medir`, para corrutinas (p. ej. los endpoints async)."""
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        await funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resumir_latencias(tiempos)
+
+
+def resumir_latencias(tiempos: List[float]) -> Dict[str, float]:
+    """Media, p50 y p99 de una lista de latencias en milisegundos."""
+    tiempos = sorted(tiempos)
+    return {
+        "media_ms": statistics.mean(tiempos),
+        "p50_ms": tiempos[len(tiempos) // 2],
+        "p99_ms": tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.99))],
+    }
@@ -0,0 +1,34 @@
+"""
+Reconstruye los contadores de popularidad (`popularidad_productos`) desde el historial.
+
+Uso:
+    python scripts/rebuild_popularidad.py
+
+Los contadores se actualizan en cada compra; este script los recalcula desde
+`detalles_compra` para reconciliarlos (p. ej. después de cargar datos a mano o
+de borrar compras). Los servidores en ejecución toman los valores nuevos al
+recargar su ranking (`POPULARIDAD_TTL_SECONDS`).
+"""
+
+import os
+import sys
+
+# Agregar el directorio raíz al path para importar módulos internos
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database import Base, SessionLocal, engine
+from services.popularity import reconstruir_popularidad
+
+
+def main() -> None:
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        productos = reconstruir_popularidad(session)
+    finally:
+        session.close()
+    print(f"✅ Popularidad reconstruida: {productos} productos con ventas.")
+
+
+if __name__ == "__main__":
+    main()
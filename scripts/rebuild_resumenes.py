@@ -0,0 +1,39 @@
+"""
+Reconstruye los resúmenes por hora de /analytics desde el historial.
+
+Uso:
+    python scripts/rebuild_resumenes.py
+
+Los resúmenes (`resumen_hora_compras`, `resumen_hora_categorias` y
+`resumen_hora_busquedas`) se actualizan en cada compra y en cada lote de
+eventos de búsqueda; este script los recalcula desde `compras`,
+`detalles_compra` y `eventos_busqueda_producto` para reconciliarlos (p. ej.
+después de cargar o borrar datos a mano, o de mover productos de categoría).
+Los endpoints leen los valores nuevos en la siguiente consulta.
+"""
+
+import os
+import sys
+
+# Agregar el directorio raíz al path para importar módulos internos
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database import Base, SessionLocal, engine
+from services.analytics_rollups import reconstruir_resumenes
+
+
+def main() -> None:
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        filas = reconstruir_resumenes(session)
+    finally:
+        session.close()
+    print(
+        f"✅ Resúmenes reconstruidos: {filas['compras']} horas de compras, "
+        f"{filas['categorias']} filas hora-categoría, {filas['busquedas']} horas de búsquedas."
+    )
+
+
+if __name__ == "__main__":
+    main()
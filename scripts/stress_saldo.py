@@ -0,0 +1,151 @@
+"""
+Prueba de concurrencia sobre el saldo: compras y recargas en paralelo de un mismo usuario.
+
+Uso:
+    python scripts/stress_saldo.py [--compras 300] [--recargas 200] [--concurrencia 64] [--workers 2] [--async]
+
+Levanta la app con uvicorn sobre una base temporal, le da al usuario un saldo
+inicial que no alcanza para todas las compras y dispara compras y recargas
+mezcladas al mismo tiempo. Al final verifica, contra la base, que no se creó
+ni se perdió plata:
+
+    saldo final = saldo inicial + recargas registradas - total de compras registradas
+
+que ninguna compra dejó el saldo negativo y que el libro de movimientos
+(`movimientos_saldo`) cuadra con el saldo. Con varios `--workers` cada
+proceso tiene su propio cache de usuarios, que es el caso más exigente.
+Termina con código 1 si alguna verificación falla o si alguna request
+terminó en 5xx o sin respuesta: bajo esta carga el servidor debe atenderlas todas.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+from sqlalchemy import func, select
+
+from benchmark_utils import crear_base_temporal, crear_usuario, poblar_catalogo
+
+from auth import create_access_token
+from models import Compra, Producto, RecargaSaldoEvento, Usuario
+from services.wallet import verificar_libro
+
+RAIZ = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PUERTO = 8798
+
+
+def levantar_servidor(url: str, workers: int, modo_async: bool) -> subprocess.Popen:
+    entorno = {**os.environ, "DATABASE_URL": url, "DATABASE_ASYNC": "true" if modo_async else "false"}
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PUERTO),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=RAIZ, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    for _ in range(100):
+        try:
+            requests.get(f"http://127.0.0.1:{PUERTO}/health", timeout=1)
+            return proceso
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proceso.kill()
+    raise RuntimeError("El servidor no arrancó")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compras y recargas concurrentes: verificar que el saldo cuadra.")
+    parser.add_argument("--compras", type=int, default=300, help="Intentos de compra.")
+    parser.add_argument("--recargas", type=int, default=200, help="Recargas.")
+    parser.add_argument("--concurrencia", type=int, default=64, help="Requests simultáneas.")
+    parser.add_argument("--workers", type=int, default=2, help="Procesos de uvicorn.")
+    parser.add_argument("--async", dest="modo_async", action="store_true", help="Correr con DATABASE_ASYNC=true.")
+    args = parser.parse_args()
+
+    engine, SessionLocal = crear_base_temporal("stress_saldo")
+    with SessionLocal() as db:
+        ids = poblar_catalogo(db, total_productos=10)
+        precios = dict(db.execute(select(Producto.id, Producto.precio)).all())
+        # Con las recargas no alcanza para todas las compras: así también se prueba el rechazo
+        saldo_inicial = float(sum(precios.values()) / len(precios) * args.compras / 2)
+        usuario = crear_usuario(db, saldo=saldo_inicial)
+        id_usuario, email = usuario.id, usuario.email
+    url = engine.url.render_as_string(hide_password=False)
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': email}, timedelta(hours=1))}"}
+
+    azar = random.Random(3)
+    operaciones = (
+        [("compra", {"productos": [{"id_producto": azar.choice(ids), "cantidad": 1}]}) for _ in range(args.compras)]
+        + [("recarga", {"monto": float(azar.randint(1, 3) * 500)}) for _ in range(args.recargas)]
+    )
+    azar.shuffle(operaciones)
+
+    sesion = requests.Session()
+    adaptador = requests.adapters.HTTPAdapter(pool_connections=args.concurrencia, pool_maxsize=args.concurrencia)
+    sesion.mount("http://", adaptador)
+
+    def ejecutar(operacion):
+        tipo, cuerpo = operacion
+        ruta = "/compras/" if tipo == "compra" else "/usuarios/me/recargar"
+        try:
+            return tipo, sesion.post(f"http://127.0.0.1:{PUERTO}{ruta}", json=cuerpo, headers=headers).status_code
+        except requests.ConnectionError:
+            return tipo, 0  # sin respuesta: el cliente no sabe si se aplicó
+
+    servidor = levantar_servidor(url, args.workers, args.modo_async)
+    try:
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrencia) as pool:
+            resultados = list(pool.map(ejecutar, operaciones))
+        duracion = time.perf_counter() - inicio
+    finally:
+        servidor.terminate()
+        servidor.wait()
+
+    respuestas = {}
+    for tipo, codigo in resultados:
+        respuestas[(tipo, codigo)] = respuestas.get((tipo, codigo), 0) + 1
+    print(f"{len(operaciones)} operaciones en {duracion:.1f} s")
+    for (tipo, codigo), cantidad in sorted(respuestas.items()):
+        print(f"  {tipo:<8} {f'HTTP {codigo}' if codigo else 'sin respuesta'}: {cantidad}")
+
+    with SessionLocal() as db:
+        saldo_final = db.scalar(select(Usuario.saldo).where(Usuario.id == id_usuario))
+        compras = db.scalar(select(func.count(Compra.id)).where(Compra.id_usuario == id_usuario))
+        gastado = db.scalar(select(func.coalesce(func.sum(Compra.total), 0)).where(Compra.id_usuario == id_usuario))
+        recargado = db.scalar(
+            select(func.coalesce(func.sum(RecargaSaldoEvento.monto), 0)).where(RecargaSaldoEvento.id_usuario == id_usuario)
+        )
+        libro = verificar_libro(db)
+    esperado = saldo_inicial + recargado - gastado
+    errores = []
+    if abs(saldo_final - esperado) > 0.005:
+        errores.append(f"el saldo no cuadra: final {saldo_final:.2f}, esperado {esperado:.2f} "
+                       f"(diferencia {saldo_final - esperado:+.2f})")
+    if saldo_final < 0:
+        errores.append(f"saldo negativo: {saldo_final:.2f}")
+    if libro["descuadres"]:
+        errores.append(f"el libro de movimientos tiene {len(libro['descuadres'])} descuadres")
+    fallidas = sum(1 for _, codigo in resultados if codigo == 0 or codigo >= 500)
+    if fallidas:
+        errores.append(f"{fallidas} requests terminaron en 5xx o sin respuesta")
+    # Una compra sin respuesta o con 5xx puede haberse confirmado o no; una con 201, sí o sí
+    confirmadas = respuestas.get(("compra", 201), 0)
+    inciertas = sum(1 for tipo, codigo in resultados if tipo == "compra" and (codigo == 0 or codigo >= 500))
+    if not confirmadas <= compras <= confirmadas + inciertas:
+        errores.append(f"{compras} compras en la base pero {confirmadas} respuestas 201 (y {inciertas} inciertas)")
+
+    print(f"\nSaldo inicial {saldo_inicial:.2f} + recargas {recargado:.2f} - compras {gastado:.2f} "
+          f"= {esperado:.2f}; saldo final {saldo_final:.2f}")
+    if errores:
+        print("FALLÓ:\n  " + "\n  ".join(errores))
+        sys.exit(1)
+    print("OK: no se creó ni se perdió saldo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Verifica el libro de movimientos de saldo (`movimientos_saldo`) contra `usuarios.saldo`.
+
+Uso:
+    python scripts/verificar_saldos.py [--lote 1000]
+
+Recorre el libro en streaming, usuario por usuario, desde el último snapshot
+verificado (`snapshots_saldo`), y reporta:
+- movimientos cuyo saldo resultante no es el anterior más el monto;
+- usuarios cuyo saldo no coincide con el último saldo del libro.
+
+Los usuarios que cuadran avanzan su snapshot, así la siguiente corrida solo lee
+los movimientos nuevos. Pensado para correr periódicamente (p. ej. con cron);
+termina con código 1 si encuentra descuadres.
+"""
+
+import argparse
+import os
+import sys
+
+# Agregar el directorio raíz al path para importar módulos internos
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from database import Base, SessionLocal, engine
+from services.wallet import TAMANO_LOTE_VERIFICACION, abrir_libro, verificar_libro
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Verificar el libro de saldos.")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE_VERIFICACION, help="Filas por lote al leer el libro.")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        abrir_libro(session)
+        resultado = verificar_libro(session, tamano_lote=args.lote)
+    finally:
+        session.close()
+
+    print(
+        f"Usuarios: {resultado['usuarios']} | movimientos revisados: {resultado['movimientos_revisados']} | "
+        f"snapshots actualizados: {resultado['snapshots_actualizados']}"
+    )
+    if resultado["descuadres"]:
+        print(f"❌ {len(resultado['descuadres'])} descuadres:")
+        for descuadre in resultado["descuadres"]:
+            print(
+                f"  usuario {descuadre['id_usuario']}, movimiento {descuadre['id_movimiento']}: "
+                f"{descuadre['motivo']} (esperado {descuadre['esperado_centavos']}, "
+                f"registrado {descuadre['registrado_centavos']} centavos)"
+            )
+        sys.exit(1)
+    print("✅ El libro cuadra con los saldos.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, cast, delete, func, insert, literal_column, select
+from sqlalchemy.orm import Session
+
+from models import (
+    Compra,
+    DetalleCompra,
+    EstadoCompra,
+    EventoBusquedaProducto,
+    Producto,
+    ResumenHoraBusquedas,
+    ResumenHoraCategoria,
+    ResumenHoraCompras,
+)
+from services.popularity import INSERTS_CON_CONFLICTO
+
+# Leer /analytics de los resúmenes por hora (false = siempre desde las filas crudas)
+ANALYTICS_RESUMENES = os.getenv("ANALYTICS_RESUMENES", "true").lower() in ("1", "true", "yes")
+
+# Estados que cuentan como venta en /analytics (todo menos CARRITO)
+ESTADOS_VALIDOS = [
+    EstadoCompra.PAGADO,
+    EstadoCompra.EN_PREPARACION,
+    EstadoCompra.LISTO,
+    EstadoCompra.ENTREGADO,
+]
+
+# Inicio de la hora de una columna de fecha (mismo valor que `inicio_hora`), con el formato
+# en que se guarda `hora`. Sin parámetros enlazados: PostgreSQL exige que el GROUP BY
+# repita la expresión tal cual.
+_TRUNCAR_HORA = {
+    "sqlite": lambda columna: func.strftime(literal_column("'%Y-%m-%d %H:00:00'"), columna),
+    "postgresql": lambda columna: func.date_trunc(literal_column("'hour'"), columna),
+}
+
+# Hora del día de una columna de fecha UTC corrida `offset` minutos
+_HORA_DEL_DIA = {
+    "sqlite": lambda columna, offset: func.strftime("%H", columna, f"{offset:+d} minutes"),
+    "postgresql": lambda columna, offset: func.extract("hour", columna + timedelta(minutes=offset)),
+}
+
+UNA_HORA = timedelta(hours=1)
+
+
+def inicio_hora(fecha: datetime) -> datetime:
+    return fecha.replace(minute=0, second=0, microsecond=0)
+
+
+def hora_local(dialecto: str, columna, timezone_offset_minutes: int):
+    """
+    Hora local (0-23) de una fecha UTC, calculada en la base y etiquetada
+    `hora_local`. Con `GROUP BY hora_local` la consulta devuelve a lo sumo 24 filas.
+    """
+    return cast(_HORA_DEL_DIA[dialecto](columna, timezone_offset_minutes), Integer).label("hora_local")
+
+
+def _upsert_sumando(dialecto: str, tabla, sumas: List[str]):
+    """INSERT ... ON CONFLICT que suma las columnas `sumas` a la fila existente. Los valores van como parámetros."""
+    stmt = INSERTS_CON_CONFLICTO[dialecto](tabla)
+    return stmt.on_conflict_do_update(
+        index_elements=[columna for columna in tabla.primary_key],
+        set_={columna: tabla.c[columna] + stmt.excluded[columna] for columna in sumas},
+    )
+
+
+# Armadas una sola vez: construir un upsert del dialecto cuesta más que ejecutarlo
+_UPSERTS = {
+    dialecto: {
+        "compras": _upsert_sumando(dialecto, ResumenHoraCompras.__table__, ["ordenes", "ingresos"]),
+        "categorias": _upsert_sumando(dialecto, ResumenHoraCategoria.__table__, ["ordenes", "unidades", "ingresos"]),
+        "busquedas": _upsert_sumando(dialecto, ResumenHoraBusquedas.__table__, ["busquedas"]),
+    }
+    for dialecto in INSERTS_CON_CONFLICTO
+}
+
+
+def sumar_compra(
+    dialecto: str, fecha_hora: datetime, total: float, lineas: Iterable[Tuple[int, int, float]]
+) -> List[Tuple[object, object]]:
+    """
+    Sentencias (con sus parámetros) que suman una compra a los resúmenes de su
+    hora. `lineas` son (id_tipo, cantidad, precio unitario) de cada producto: la
+    venta queda en la categoría que tenía el producto al comprarse (la consulta sobre
+    filas crudas usa la actual; difieren si después se recategoriza el producto).
+    """
+    hora = inicio_hora(fecha_hora)
+    por_tipo: Dict[int, List] = {}
+    for id_tipo, cantidad, precio in lineas:
+        acumulado = por_tipo.setdefault(id_tipo, [0, 0.0])
+        acumulado[0] += cantidad
+        acumulado[1] += cantidad * precio
+    upserts = _UPSERTS[dialecto]
+    return [
+        (upserts["compras"], {"hora": hora, "ordenes": 1, "ingresos": total}),
+        (upserts["categorias"], [
+            {"hora": hora, "id_tipo": id_tipo, "ordenes": 1, "unidades": unidades, "ingresos": ingresos}
+            for id_tipo, (unidades, ingresos) in por_tipo.items()
+        ]),
+    ]
+
+
+def sumar_busquedas(dialecto: str, fechas: Iterable[datetime]) -> Tuple[object, List[Dict]]:
+    """Sentencia (con sus parámetros) que suma un lote de búsquedas al resumen de cada hora."""
+    por_hora = Counter(inicio_hora(fecha) for fecha in fechas)
+    return _UPSERTS[dialecto]["busquedas"], [
+        {"hora": hora, "busquedas": cantidad} for hora, cantidad in por_hora.items()
+    ]
+
+
+def reconstruir_resumenes(db: Session) -> Dict[str, int]:
+    """Recalcular los tres resúmenes desde compras y eventos. Retorna cuántas filas tiene cada uno."""
+    hora = _TRUNCAR_HORA[db.get_bind().dialect.name]
+    for tabla in (ResumenHoraCompras, ResumenHoraCategoria, ResumenHoraBusquedas):
+        db.execute(delete(tabla))
+
+    hora_compra = hora(Compra.fecha_hora)
+    compras = db.execute(
+        insert(ResumenHoraCompras).from_select(
+            ["hora", "ordenes", "ingresos"],
+            select(hora_compra, func.count(), func.coalesce(func.sum(Compra.total), 0.0))
+            .where(Compra.estado.in_(ESTADOS_VALIDOS))
+            .group_by(hora_compra),
+        )
+    )
+    categorias = db.execute(
+        insert(ResumenHoraCategoria).from_select(
+            ["hora", "id_tipo", "ordenes", "unidades", "ingresos"],
+            select(
+                hora_compra,
+                Producto.id_tipo,
+                func.count(func.distinct(Compra.id)),
+                func.sum(DetalleCompra.cantidad),
+                func.sum(DetalleCompra.cantidad * DetalleCompra.precio_unitario_compra),
+            )
+            .join(DetalleCompra, DetalleCompra.id_compra == Compra.id)
+            .join(Producto, Producto.id == DetalleCompra.id_producto)
+            .where(Compra.estado.in_(ESTADOS_VALIDOS))
+            .group_by(hora_compra, Producto.id_tipo),
+        )
+    )
+    hora_busqueda = hora(EventoBusquedaProducto.creado_en)
+    busquedas = db.execute(
+        insert(ResumenHoraBusquedas).from_select(
+            ["hora", "busquedas"],
+            select(hora_busqueda, func.count()).group_by(hora_busqueda),
+        )
+    )
+    db.commit()
+    return {"compras": compras.rowcount, "categorias": categorias.rowcount, "busquedas": busquedas.rowcount}
+
+
+def resumenes_desincronizados(db: Session) -> bool:
+    """True si hay compras o búsquedas registradas pero su resumen está vacío (p. ej. base existente)."""
+    for resumen, origen in (
+        (ResumenHoraCompras.hora, select(Compra.id).where(Compra.estado.in_(ESTADOS_VALIDOS))),
+        (ResumenHoraBusquedas.hora, select(EventoBusquedaProducto.id)),
+    ):
+        if db.scalar(select(resumen).limit(1)) is None and db.scalar(origen.limit(1)) is not None:
+            return True
+    return False
+
+
+def partir_ventana(
+    start: datetime, end: datetime, timezone_offset_minutes: int = 0
+) -> Tuple[Optional[Tuple[datetime, datetime]], List[Tuple[datetime, datetime]]]:
+    """
+    Parte [start, end) en un tramo de horas completas, que se lee de los resúmenes,
+    y los bordes sueltos del principio y del final, que se leen de las filas crudas.
+
+    Con un offset que no es múltiplo de una hora (p. ej. UTC+5:30) cada hora UTC se
+    reparte entre dos horas locales: no hay tramo de resúmenes y se lee todo crudo.
+    """
+    if start >= end:
+        return None, []
+    desde = inicio_hora(start)
+    if desde < start:
+        desde += UNA_HORA
+    hasta = inicio_hora(end)
+    if timezone_offset_minutes % 60 or desde >= hasta:
+        return None, [(start, end)]
+    bordes = [(a, b) for a, b in ((start, desde), (hasta, end)) if a < b]
+    return (desde, hasta), bordes
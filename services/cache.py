@@ -0,0 +1,65 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class TTLCache:
+    """
+    Cache en memoria acotado (LRU) con expiración por entrada.
+
+    Seguro para usar desde varios hilos del threadpool. Cada entrada expira a los
+    `ttl` segundos o en el instante `expira_en` (epoch) indicado al guardarla.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, clave: Hashable) -> Optional[Any]:
+        """Retorna el valor guardado o None si no existe o ya expiró."""
+        ahora = time.time()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[1] <= ahora:
+                if entrada is not None:
+                    del self._datos[clave]
+                self.misses += 1
+                return None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return entrada[0]
+
+    def set(self, clave: Hashable, valor: Any, expira_en: Optional[float] = None) -> None:
+        """Guarda un valor; expira en `expira_en` (epoch) o tras el TTL, lo que ocurra antes."""
+        limite = time.time() + self.ttl
+        if expira_en is not None:
+            limite = min(limite, expira_en)
+        with self._lock:
+            self._datos[clave] = (valor, limite)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+
+    def invalidate(self, clave: Hashable) -> None:
+        """Elimina una entrada si existe."""
+        with self._lock:
+            self._datos.pop(clave, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._datos.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de uso del cache."""
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
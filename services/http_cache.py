@@ -0,0 +1,88 @@
+import gzip
+import hashlib
+import json
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from fastapi import Request, Response, status
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él solo se ofrece gzip
+    brotli = None
+
+# Orden de preferencia cuando el cliente acepta varias codificaciones
+PREFERENCIA_CODIFICACION = ("br", "gzip")
+
+
+def calcular_etag(*partes: object) -> str:
+    """ETag fuerte a partir de los valores que determinan el contenido de la respuesta."""
+    crudo = "|".join(str(parte) for parte in partes)
+    return '"' + hashlib.sha1(crudo.encode()).hexdigest() + '"'
+
+
+def etag_coincide(if_none_match: Optional[str], etag: str) -> bool:
+    """Indica si el header If-None-Match del cliente incluye el ETag actual."""
+    if not if_none_match:
+        return False
+    candidatos: Iterable[str] = (valor.strip() for valor in if_none_match.split(","))
+    # Para GET la comparación es débil: W/"x" equivale a "x"
+    return any(c == "*" or c.removeprefix("W/") == etag for c in candidatos)
+
+
+def respuesta_no_modificada(etag: str) -> Response:
+    """Respuesta 304 sin cuerpo."""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+
+def codificaciones_aceptadas(accept_encoding: Optional[str]) -> Set[str]:
+    """Codificaciones del header Accept-Encoding, sin las que vienen con q=0."""
+    aceptadas = set()
+    for valor in (accept_encoding or "").split(","):
+        nombre, _, parametros = valor.strip().partition(";")
+        if not nombre:
+            continue
+        if parametros.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        aceptadas.add(nombre.strip().lower())
+    return aceptadas
+
+
+class RespuestaPrerenderizada:
+    """
+    Cuerpo JSON ya serializado, con sus variantes comprimidas y un ETag fuerte por variante.
+
+    Se construye una vez por contenido y se reutiliza en cada request: servirla no
+    valida ni serializa nada. brotli se usa solo si el paquete está instalado.
+    """
+
+    def __init__(self, contenido: object):
+        self.cuerpo = json.dumps(
+            contenido, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+        base = hashlib.sha1(self.cuerpo).hexdigest()
+        self.variantes: Dict[str, Tuple[bytes, str]] = {"identity": (self.cuerpo, f'"{base}"')}
+        comprimidos = {"gzip": gzip.compress(self.cuerpo, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            comprimidos["br"] = brotli.compress(self.cuerpo, quality=11)
+        for codificacion, datos in comprimidos.items():
+            # En respuestas muy chicas comprimir agranda el cuerpo
+            if len(datos) < len(self.cuerpo):
+                self.variantes[codificacion] = (datos, f'"{base}-{codificacion}"')
+
+    def responder(self, request: Request, headers: Optional[Dict[str, str]] = None) -> Response:
+        """Respuesta 200 con la mejor variante que acepte el cliente, o 304 si ya la tiene."""
+        aceptadas = codificaciones_aceptadas(request.headers.get("accept-encoding"))
+        codificacion = next(
+            (c for c in PREFERENCIA_CODIFICACION if c in self.variantes and c in aceptadas), "identity"
+        )
+        cuerpo, etag = self.variantes[codificacion]
+        encabezados = {"ETag": etag, "Vary": "Accept-Encoding", **(headers or {})}
+
+        # Todas las variantes tienen el mismo contenido: cualquiera de sus ETags sirve para el 304
+        if_none_match = request.headers.get("if-none-match")
+        if any(etag_coincide(if_none_match, e) for _, e in self.variantes.values()):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=encabezados)
+
+        if codificacion != "identity":
+            encabezados["Content-Encoding"] = codificacion
+        return Response(content=cuerpo, media_type="application/json", headers=encabezados)
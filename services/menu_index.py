@@ -0,0 +1,159 @@
+import hashlib
+import json
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+from schemas import ProductoResponse, TipoProductoResponse
+from services.http_cache import RespuestaPrerenderizada
+from services.product_search import ProductSearchIndex
+
+
+class _Snapshot:
+    """Vista inmutable del menú; se reemplaza completa en cada cambio."""
+
+    def __init__(self, productos: Iterable[ProductoResponse], tipos: Iterable[TipoProductoResponse]):
+        self.productos: Dict[int, ProductoResponse] = {p.id: p for p in sorted(productos, key=lambda p: p.id)}
+        self.tipos: Tuple[TipoProductoResponse, ...] = tuple(sorted(tipos, key=lambda t: t.id))
+        # (id_tipo o None, disponible) -> productos en orden de id
+        self.listados: Dict[Tuple[Optional[int], bool], Tuple[ProductoResponse, ...]] = {}
+        for producto in self.productos.values():
+            for clave in ((None, producto.disponible), (producto.id_tipo, producto.disponible)):
+                self.listados[clave] = self.listados.get(clave, ()) + (producto,)
+        # Hash del contenido: igual en todos los procesos que tengan el mismo menú
+        contenido = {
+            "productos": [p.model_dump(mode="json") for p in self.productos.values()],
+            "tipos": [t.model_dump(mode="json") for t in self.tipos],
+        }
+        self.version = hashlib.sha1(
+            json.dumps(contenido, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        ).hexdigest()[:16]
+        # JSON ya serializado de cada respuesta, generado la primera vez que se pide
+        self.renders: Dict[Hashable, RespuestaPrerenderizada] = {}
+        # Índice de búsqueda de esta copia, construido la primera vez que se busca
+        self.busqueda: Optional[ProductSearchIndex] = None
+
+    def prerenderizar(self, clave: Hashable, modelos) -> RespuestaPrerenderizada:
+        render = self.renders.get(clave)
+        if render is None:
+            if isinstance(modelos, tuple):
+                contenido = [m.model_dump(mode="json") for m in modelos]
+            else:
+                contenido = modelos.model_dump(mode="json")
+            render = self.renders.setdefault(clave, RespuestaPrerenderizada(contenido))
+        return render
+
+
+class MenuIndex:
+    """
+    Copia en memoria del menú (productos y tipos) indexada por id, tipo y disponibilidad.
+
+    Los endpoints de lectura la consultan sin tocar la base. Las escrituras de
+    administración la actualizan con `guardar_producto` / `guardar_tipo` después del
+    commit; cada cambio descarta el JSON pre-serializado. `version` es un hash del
+    contenido, así que dos workers con el mismo menú reportan la misma versión.
+    Como la copia es local a cada proceso, se recarga completa cada `ttl` segundos
+    para recoger cambios hechos por otros workers o scripts (p. ej. `seed_data.py`).
+    """
+
+    def __init__(self, cargar: Callable[[], Tuple[List[ProductoResponse], List[TipoProductoResponse]]], ttl: float):
+        self._cargar = cargar
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot: Optional[_Snapshot] = None
+        self._cargado_en = 0.0
+        self.recargas = 0
+
+    @property
+    def version(self) -> str:
+        """Hash del contenido de la copia actual (vacío si todavía no se cargó)."""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot else ""
+
+    def vigente(self) -> bool:
+        """True si hay una copia cargada que todavía no venció."""
+        return self._snapshot is not None and time.monotonic() - self._cargado_en < self.ttl
+
+    def recargar(self) -> None:
+        """Leer el menú completo de la base (bloqueante: llamar desde el threadpool)."""
+        with self._lock:
+            productos, tipos = self._cargar()
+            nuevo = _Snapshot(productos, tipos)
+            actual = self._snapshot
+            if actual is None or actual.version != nuevo.version:
+                self._snapshot = nuevo
+            self._cargado_en = time.monotonic()
+            self.recargas += 1
+
+    def asegurar_cargado(self) -> None:
+        if not self.vigente():
+            self.recargar()
+
+    def guardar_producto(self, producto: ProductoResponse) -> None:
+        """Insertar o reemplazar un producto en la copia."""
+        with self._lock:
+            if self._snapshot is None:
+                return
+            productos = dict(self._snapshot.productos)
+            productos[producto.id] = producto
+            self._snapshot = _Snapshot(productos.values(), self._snapshot.tipos)
+
+    def guardar_tipo(self, tipo: TipoProductoResponse) -> None:
+        """Insertar o reemplazar un tipo de producto en la copia."""
+        with self._lock:
+            if self._snapshot is None:
+                return
+            tipos = {t.id: t for t in self._snapshot.tipos}
+            tipos[tipo.id] = tipo
+            self._snapshot = _Snapshot(self._snapshot.productos.values(), tipos.values())
+
+    def listar(self, id_tipo: Optional[int] = None, disponible: bool = True) -> List[ProductoResponse]:
+        return list(self._snapshot.listados.get((id_tipo, disponible), ()))
+
+    def productos(self) -> List[ProductoResponse]:
+        return list(self._snapshot.productos.values())
+
+    def obtener(self, producto_id: int) -> Optional[ProductoResponse]:
+        return self._snapshot.productos.get(producto_id)
+
+    def tipos(self) -> List[TipoProductoResponse]:
+        return list(self._snapshot.tipos)
+
+    def json_listado(self, id_tipo: Optional[int] = None, disponible: bool = True) -> RespuestaPrerenderizada:
+        """Como `listar`, ya serializado. Los filtros sin resultados comparten la lista vacía."""
+        snapshot = self._snapshot
+        clave = (id_tipo, disponible)
+        if clave not in snapshot.listados:
+            return snapshot.prerenderizar("vacio", ())
+        return snapshot.prerenderizar(("listado",) + clave, snapshot.listados[clave])
+
+    def json_producto(self, producto_id: int) -> Optional[RespuestaPrerenderizada]:
+        snapshot = self._snapshot
+        producto = snapshot.productos.get(producto_id)
+        if producto is None:
+            return None
+        return snapshot.prerenderizar(("producto", producto_id), producto)
+
+    def json_tipos(self) -> RespuestaPrerenderizada:
+        snapshot = self._snapshot
+        return snapshot.prerenderizar("tipos", snapshot.tipos)
+
+    def busqueda_lista(self) -> bool:
+        return self._snapshot.busqueda is not None
+
+    def indice_busqueda(self) -> ProductSearchIndex:
+        """Índice de búsqueda de la copia actual (construirlo es bloqueante: usar el threadpool)."""
+        snapshot = self._snapshot
+        if snapshot.busqueda is None:
+            snapshot.busqueda = ProductSearchIndex(snapshot.productos.values())
+        return snapshot.busqueda
+
+    def stats(self) -> Dict[str, object]:
+        """Versión actual, tamaño de la copia y número de recargas completas."""
+        snapshot = self._snapshot
+        return {
+            "version": self.version,
+            "productos": len(snapshot.productos) if snapshot else 0,
+            "tipos": len(snapshot.tipos) if snapshot else 0,
+            "recargas": self.recargas,
+        }
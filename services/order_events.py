@@ -0,0 +1,109 @@
+import asyncio
+import json
+import threading
+from typing import Any, Dict, Optional, Set
+
+# Tamaño máximo de la cola de cada suscriptor antes de considerarlo rezagado
+MAX_EVENTOS_EN_COLA = 256
+
+# Marcador que indica al suscriptor que perdió eventos y debe pedir un snapshot nuevo
+RESYNC = object()
+
+
+def formatear_evento_sse(tipo: str, data: Any, evento_id: Optional[int] = None) -> str:
+    """Serializa un evento en formato Server-Sent Events."""
+    lineas = [f"event: {tipo}"]
+    if evento_id is not None:
+        lineas.append(f"id: {evento_id}")
+    lineas.append(f"data: {json.dumps(data, separators=(',', ':'), ensure_ascii=False)}")
+    return "\n".join(lineas) + "\n\n"
+
+
+class Suscripcion:
+    """Cola de eventos de un cliente conectado, ligada al event loop que la consume."""
+
+    def __init__(self, canal: str, loop: asyncio.AbstractEventLoop):
+        self.canal = canal
+        self.loop = loop
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=MAX_EVENTOS_EN_COLA)
+
+    def _encolar(self, evento: Any) -> None:
+        # Se ejecuta siempre en el loop del suscriptor
+        if self.cola.full():
+            # Cliente lento: se descartan los eventos pendientes y se le pide resincronizar
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            evento = RESYNC
+        self.cola.put_nowait(evento)
+
+    async def siguiente(self, timeout: float) -> Any:
+        """Espera el siguiente evento; retorna None si vence el timeout."""
+        try:
+            return await asyncio.wait_for(self.cola.get(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class OrderEventHub:
+    """
+    Pub/sub en memoria del proceso para eventos de compras.
+
+    Los eventos se serializan una sola vez al publicarse y se reparten a todas las
+    suscripciones del canal, sin consultar la base de datos por suscriptor.
+    `publicar` es seguro de llamar desde los endpoints síncronos (threadpool).
+    """
+
+    def __init__(self):
+        self._suscripciones: Dict[str, Set[Suscripcion]] = {}
+        self._lock = threading.Lock()
+        self._secuencia = 0
+
+    def suscribir(self, canal: str) -> Suscripcion:
+        """Registrar una suscripción nueva (llamar desde el event loop que la consumirá)."""
+        suscripcion = Suscripcion(canal, asyncio.get_running_loop())
+        with self._lock:
+            self._suscripciones.setdefault(canal, set()).add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion) -> None:
+        """Eliminar una suscripción (al desconectarse el cliente)."""
+        with self._lock:
+            suscripciones = self._suscripciones.get(suscripcion.canal)
+            if suscripciones is not None:
+                suscripciones.discard(suscripcion)
+                if not suscripciones:
+                    del self._suscripciones[suscripcion.canal]
+
+    def publicar(self, canal: str, tipo: str, data: Any) -> int:
+        """Publicar un evento en un canal. Retorna el número de suscriptores notificados."""
+        with self._lock:
+            self._secuencia += 1
+            frame = formatear_evento_sse(tipo, data, self._secuencia)
+            suscripciones = list(self._suscripciones.get(canal, ()))
+
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion._encolar, frame)
+            except RuntimeError:
+                # El loop del suscriptor ya se cerró
+                self.cancelar(suscripcion)
+        return len(suscripciones)
+
+    def total_suscriptores(self, canal: Optional[str] = None) -> int:
+        """Número de suscripciones activas (en un canal o en total)."""
+        with self._lock:
+            if canal is not None:
+                return len(self._suscripciones.get(canal, ()))
+            return sum(len(s) for s in self._suscripciones.values())
+
+
+# Instancia compartida por toda la aplicación
+hub = OrderEventHub()
+
+# Canales
+CANAL_STAFF = "staff"
+
+
+def canal_usuario(usuario_id: int) -> str:
+    """Canal con los cambios de las compras de un usuario."""
+    return f"usuario:{usuario_id}"
@@ -0,0 +1,86 @@
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+from passlib.context import CryptContext
+
+
+class PasswordPoolSaturated(Exception):
+    """Señala que hay demasiadas operaciones de contraseña en espera."""
+
+
+class PasswordHasher:
+    """
+    Ejecuta bcrypt en un pool de hilos dedicado y acotado.
+
+    Así una ráfaga de logins no ocupa el threadpool compartido de FastAPI (que atiende
+    todos los endpoints síncronos). bcrypt libera el GIL, por lo que los hilos sí
+    trabajan en paralelo. Si la cola supera `max_cola`, se rechaza la operación.
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int, max_cola: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_cola = max_cola
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._lock = threading.Lock()
+        self._en_cola = 0
+        self._en_proceso = 0
+        self.completadas = 0
+        self.rechazadas = 0
+
+    def _ejecutar(self, funcion: Callable, *args):
+        with self._lock:
+            self._en_cola -= 1
+            self._en_proceso += 1
+        try:
+            return funcion(*args)
+        finally:
+            with self._lock:
+                self._en_proceso -= 1
+                self.completadas += 1
+
+    async def _enviar(self, funcion: Callable, *args):
+        with self._lock:
+            if self._en_cola >= self.max_cola:
+                self.rechazadas += 1
+                raise PasswordPoolSaturated()
+            self._en_cola += 1
+        try:
+            futuro = self._executor.submit(self._ejecutar, funcion, *args)
+        except BaseException:
+            with self._lock:
+                self._en_cola -= 1
+            raise
+        futuro.add_done_callback(self._liberar_si_cancelada)
+        return await asyncio.wrap_future(futuro)
+
+    def _liberar_si_cancelada(self, futuro: Future) -> None:
+        # Si la request se cancela (desconexión, timeout) con la operación todavía en
+        # cola, el futuro se cancela y `_ejecutar` nunca corre: liberar su lugar acá
+        if futuro.cancelled():
+            with self._lock:
+                self._en_cola -= 1
+
+    async def hash(self, password: str) -> str:
+        """Hashear una contraseña con el costo configurado."""
+        return await self._enviar(self.context.hash, password)
+
+    async def verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verificar una contraseña. Si es válida pero el hash usa otro costo,
+        retorna también el hash recalculado para guardarlo.
+        """
+        return await self._enviar(self.context.verify_and_update, password, hashed)
+
+    def stats(self) -> Dict[str, int]:
+        """Profundidad de la cola y contadores del pool."""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "en_cola": self._en_cola,
+                "en_proceso": self._en_proceso,
+                "completadas": self.completadas,
+                "rechazadas": self.rechazadas,
+            }
@@ -0,0 +1,190 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+
+from database import SessionLocal
+from models import Compra, DetalleCompra
+from services.recommendations import RECOMENDACIONES_VENTANA_HORAS
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # sin numpy/scipy /recomendados/me responde con los populares (ver `iniciar`)
+    np = None
+    sparse = None
+
+logger = logging.getLogger(__name__)
+
+# Cada cuánto se recalculan las matrices (en un hilo de fondo)
+RECOMENDACIONES_PERSONALES_TTL_SECONDS = float(os.getenv("RECOMENDACIONES_PERSONALES_TTL_SECONDS", "900"))
+# Productos guardados por usuario; alcanza para filtrar por categoría y disponibilidad
+RECOMENDACIONES_PERSONALES_TOP = int(os.getenv("RECOMENDACIONES_PERSONALES_TOP", "50"))
+
+# (id_compra, id_usuario, id_producto, cantidad)
+FilaCompra = Tuple[int, int, int, int]
+
+
+def cargar_compras(desde: datetime) -> Sequence[FilaCompra]:
+    """Las líneas de compra desde `desde`, con su usuario."""
+    with SessionLocal() as db:
+        return db.execute(
+            select(DetalleCompra.id_compra, Compra.id_usuario, DetalleCompra.id_producto, DetalleCompra.cantidad)
+            .join(Compra, Compra.id == DetalleCompra.id_compra)
+            .where(Compra.fecha_hora >= desde)
+        ).all()
+
+
+def matrices_disponibles() -> bool:
+    return np is not None
+
+
+class PersonalRecommender:
+    """
+    Recomendaciones por usuario a partir de su historial y de lo que se compra junto.
+
+    Con matrices dispersas:
+    - O (órdenes × productos, 1 si el producto está en la orden) da la co-ocurrencia
+      C = Oᵀ·O, que se normaliza a similitud coseno S (diagonal = 1).
+    - R (usuarios × productos) tiene log(1 + unidades compradas), para que pedir
+      20 cervezas no tape todo lo demás.
+    - Puntajes P = R·S: lo que el usuario ya pide más lo que se suele pedir con eso.
+
+    De cada fila de P se guardan los mejores `top` productos, así responder es
+    buscar una lista en un dict. Solo entran las compras de las últimas
+    `ventana_horas`. El recálculo corre en un hilo de fondo (ver `iniciar`) cada
+    `ttl` segundos; mientras tanto se sirve el resultado anterior.
+    """
+
+    def __init__(
+        self,
+        cargar: Callable[[datetime], Sequence[FilaCompra]],
+        ttl: float,
+        top: int,
+        ventana_horas: float = RECOMENDACIONES_VENTANA_HORAS,
+    ):
+        self._cargar = cargar
+        self.ttl = ttl
+        self.top = top
+        self.ventana = timedelta(hours=ventana_horas)
+        self._lock = threading.Lock()
+        self._por_usuario: Optional[Dict[int, List[int]]] = None
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.recalculos = 0
+        self.errores = 0
+        self.ultimo_recalculo_ms = 0.0
+
+    def listo(self) -> bool:
+        return self._por_usuario is not None
+
+    def iniciar(self) -> None:
+        """Arrancar el hilo que recalcula las recomendaciones cada `ttl` segundos (idempotente)."""
+        if not matrices_disponibles():
+            logger.warning(
+                "numpy/scipy no están instalados: /productos/recomendados/me responde solo con los populares"
+            )
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="personal-recs", daemon=True)
+            self._hilo.start()
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Detener el hilo de recálculo (llamar al apagar la app)."""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is None:
+            return
+        self._detener.set()
+        hilo.join(timeout)
+
+    def _bucle(self) -> None:
+        espera = 0.0
+        while not self._detener.wait(espera):
+            try:
+                self.recalcular()
+            except Exception:
+                logger.exception("Falló el recálculo de las recomendaciones personales")
+                with self._lock:
+                    self.errores += 1
+            # Tras un error se sigue sirviendo el resultado anterior hasta el próximo intento
+            espera = self.ttl
+
+    def recalcular(self) -> None:
+        """Leer el historial de la ventana y recalcular todas las recomendaciones (bloqueante)."""
+        inicio = time.perf_counter()
+        por_usuario = calcular_recomendaciones(self._cargar(datetime.utcnow() - self.ventana), self.top)
+        with self._lock:
+            self._por_usuario = por_usuario
+            self.recalculos += 1
+            self.ultimo_recalculo_ms = (time.perf_counter() - inicio) * 1000
+
+    def para_usuario(self, id_usuario: int) -> List[int]:
+        """IDs de producto recomendados para el usuario, mejor primero (vacío si no hay datos)."""
+        return (self._por_usuario or {}).get(id_usuario, [])
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "disponible": matrices_disponibles(),
+            "activo": self._hilo is not None and self._hilo.is_alive(),
+            "usuarios": len(self._por_usuario or {}),
+            "recalculos": self.recalculos,
+            "errores": self.errores,
+            "ultimo_recalculo_ms": round(self.ultimo_recalculo_ms, 1),
+        }
+
+
+def calcular_recomendaciones(filas: Sequence[FilaCompra], top: int) -> Dict[int, List[int]]:
+    """Mejores `top` productos por usuario (ver PersonalRecommender)."""
+    if not filas:
+        return {}
+    compras, usuarios, productos, cantidades = (np.asarray(columna) for columna in zip(*filas))
+    ids_productos, col = np.unique(productos, return_inverse=True)
+    ids_usuarios, fila_usuario = np.unique(usuarios, return_inverse=True)
+    _, fila_orden = np.unique(compras, return_inverse=True)
+    n_productos = len(ids_productos)
+
+    ordenes = sparse.csr_matrix(
+        (np.ones(len(col), dtype=np.float32), (fila_orden, col)),
+        shape=(fila_orden.max() + 1, n_productos),
+    )
+    co = (ordenes.T @ ordenes).tocoo()
+    # La diagonal de la co-ocurrencia es la cantidad de órdenes de cada producto
+    por_producto = co.diagonal()
+    similitud = sparse.csr_matrix(
+        (co.data / np.sqrt(por_producto[co.row] * por_producto[co.col]), (co.row, co.col)),
+        shape=(n_productos, n_productos),
+    )
+
+    # Líneas repetidas de un mismo usuario y producto se suman al armar la matriz
+    afinidad = sparse.csr_matrix(
+        (cantidades.astype(np.float32), (fila_usuario, col)), shape=(len(ids_usuarios), n_productos)
+    )
+    afinidad.data = np.log1p(afinidad.data)
+    puntajes = (afinidad @ similitud).tocsr()
+
+    resultado: Dict[int, List[int]] = {}
+    indptr, indices, datos = puntajes.indptr, puntajes.indices, puntajes.data
+    for fila, id_usuario in enumerate(ids_usuarios.tolist()):
+        inicio, fin = indptr[fila], indptr[fila + 1]
+        valores, columnas = datos[inicio:fin], indices[inicio:fin]
+        if fin - inicio > top:
+            mejores = np.argpartition(-valores, top)[:top]
+            valores, columnas = valores[mejores], columnas[mejores]
+        # Mayor puntaje primero; desempate por id de producto
+        orden = np.lexsort((ids_productos[columnas], -valores))
+        resultado[id_usuario] = ids_productos[columnas[orden]].tolist()
+    return resultado
+
+
+personal_recommender = PersonalRecommender(
+    cargar_compras, RECOMENDACIONES_PERSONALES_TTL_SECONDS, RECOMENDACIONES_PERSONALES_TOP
+)
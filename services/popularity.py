@@ -0,0 +1,112 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from models import DetalleCompra, PopularidadProducto
+from schemas import ProductoResponse
+
+# INSERT ... ON CONFLICT según el motor (ambos exponen la misma API); también lo usa analytics_rollups
+INSERTS_CON_CONFLICTO = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+
+def upsert_popularidad(dialecto: str, cantidades: Dict[int, int]):
+    """
+    Sentencia que suma una orden y sus unidades a los contadores de cada producto,
+    creando la fila si el producto nunca se había vendido.
+    """
+    stmt = INSERTS_CON_CONFLICTO[dialecto](PopularidadProducto).values(
+        [{"id_producto": id_producto, "ordenes": 1, "unidades": cantidad} for id_producto, cantidad in cantidades.items()]
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[PopularidadProducto.id_producto],
+        set_={
+            "ordenes": PopularidadProducto.ordenes + stmt.excluded.ordenes,
+            "unidades": PopularidadProducto.unidades + stmt.excluded.unidades,
+        },
+    )
+
+
+def reconstruir_popularidad(db: Session) -> int:
+    """Recalcular todos los contadores desde detalles_compra. Retorna cuántos productos tienen ventas."""
+    db.execute(delete(PopularidadProducto))
+    resultado = db.execute(
+        insert(PopularidadProducto).from_select(
+            ["id_producto", "ordenes", "unidades"],
+            select(
+                DetalleCompra.id_producto,
+                func.count(),
+                func.coalesce(func.sum(DetalleCompra.cantidad), 0),
+            ).group_by(DetalleCompra.id_producto),
+        )
+    )
+    db.commit()
+    return resultado.rowcount
+
+
+def popularidad_desincronizada(db: Session) -> bool:
+    """True si hay ventas registradas pero la tabla de contadores está vacía (p. ej. base existente)."""
+    if db.scalar(select(PopularidadProducto.id_producto).limit(1)) is not None:
+        return False
+    return db.scalar(select(DetalleCompra.id_compra).limit(1)) is not None
+
+
+class PopularityRanking:
+    """
+    Ranking de productos más vendidos, precalculado en memoria.
+
+    Combina los contadores de `popularidad_productos` (una consulta cada `ttl`
+    segundos) con los productos del menú, y guarda listas ya ordenadas para el
+    menú completo y para cada categoría. Responder es tomar los primeros `limit`.
+    """
+
+    def __init__(self, cargar: Callable[[], Dict[int, int]], ttl: float):
+        self._cargar = cargar
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._ordenes: Optional[Dict[int, int]] = None
+        self._cargado_en = 0.0
+        # (versión del menú) -> {id_tipo o None: productos disponibles ordenados}
+        self._rankings: Tuple[Optional[str], Dict[Optional[int], List[ProductoResponse]]] = (None, {})
+        self.recargas = 0
+
+    def vigente(self) -> bool:
+        return self._ordenes is not None and time.monotonic() - self._cargado_en < self.ttl
+
+    def recargar(self) -> None:
+        """Leer los contadores de la base (bloqueante: llamar desde el threadpool)."""
+        with self._lock:
+            self._ordenes = self._cargar()
+            self._cargado_en = time.monotonic()
+            self._rankings = (None, {})
+            self.recargas += 1
+
+    def asegurar_cargado(self) -> None:
+        if not self.vigente():
+            self.recargar()
+
+    def top(
+        self, productos: Iterable[ProductoResponse], version_menu: str, limit: int, id_tipo: Optional[int] = None
+    ) -> List[ProductoResponse]:
+        """Los `limit` productos disponibles más vendidos (desempate por id), opcionalmente de una categoría."""
+        version, rankings = self._rankings
+        if version != version_menu:
+            rankings = self._ordenar(productos)
+            self._rankings = (version_menu, rankings)
+        return rankings.get(id_tipo, [])[:limit]
+
+    def _ordenar(self, productos: Iterable[ProductoResponse]) -> Dict[Optional[int], List[ProductoResponse]]:
+        ordenes = self._ordenes or {}
+        disponibles = sorted(
+            (p for p in productos if p.disponible), key=lambda p: (-ordenes.get(p.id, 0), p.id)
+        )
+        rankings: Dict[Optional[int], List[ProductoResponse]] = {None: disponibles}
+        for producto in disponibles:
+            rankings.setdefault(producto.id_tipo, []).append(producto)
+        return rankings
+
+    def stats(self) -> Dict[str, int]:
+        return {"productos_con_ventas": len(self._ordenes or {}), "recargas": self.recargas}
@@ -0,0 +1,250 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from schemas import ProductoResponse
+from services.cache import TTLCache
+
+# Peso de cada campo en el ranking: una coincidencia en el nombre vale más que en la descripción
+PESO_NOMBRE = 2.0
+PESO_DESCRIPCION = 1.0
+# Multiplicador cuando el término buscado es la palabra completa y no solo un prefijo
+BONO_EXACTO = 1.5
+# Bono cuando el nombre empieza con la primera palabra buscada
+BONO_INICIO_NOMBRE = 1.0
+
+# Búsqueda tolerante a errores: puntaje de un término a distancia d = PESO_NOMBRE * FACTOR_DIFUSO ** d
+FACTOR_DIFUSO = 0.6
+
+# Resultados recientes por índice: en la búsqueda mientras se escribe los mismos prefijos
+# ("c", "co", "coc"...) se repiten entre usuarios. El índice no cambia, así que no vencen.
+MAX_RESULTADOS_CACHEADOS = 2048
+
+_PALABRA = re.compile(r"\w+")
+
+
+def normalizar(texto: Optional[str]) -> str:
+    """Minúsculas y sin tildes: "Cócteles" -> "cocteles", "Piña" -> "pina"."""
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    return _PALABRA.findall(normalizar(texto))
+
+
+def distancia_maxima(token: str) -> int:
+    """Errores de tipeo tolerados según el largo: ninguno hasta 3 letras, 1 hasta 5, luego 2."""
+    if len(token) <= 3:
+        return 0
+    return 1 if len(token) <= 5 else 2
+
+
+def distancia_a_prefijo(token: str, termino: str, maximo: int) -> int:
+    """
+    Distancia de edición (con transposiciones) entre `token` y el prefijo de `termino`
+    que más se le parece; `maximo + 1` si supera `maximo`. Así "corna" queda a 1 de
+    "corona" y "colombi" a 0 de "colombia".
+    """
+    anterior_previa: List[int] = []
+    anterior = list(range(len(termino) + 1))
+    for i in range(1, len(token) + 1):
+        actual = [i] + [0] * len(termino)
+        for j in range(1, len(termino) + 1):
+            costo = 0 if token[i - 1] == termino[j - 1] else 1
+            actual[j] = min(anterior[j] + 1, actual[j - 1] + 1, anterior[j - 1] + costo)
+            if i > 1 and j > 1 and token[i - 1] == termino[j - 2] and token[i - 2] == termino[j - 1]:
+                actual[j] = min(actual[j], anterior_previa[j - 2] + 1)
+        if min(actual) > maximo:
+            return maximo + 1
+        anterior_previa, anterior = anterior, actual
+    return min(anterior)
+
+
+def _bigramas(texto: str) -> List[str]:
+    marcado = "^" + texto
+    return [marcado[i:i + 2] for i in range(len(marcado) - 1)]
+
+
+class FuzzyTermIndex:
+    """
+    Índice de bigramas sobre el vocabulario de nombres de productos.
+
+    Para una palabra mal escrita, los bigramas descartan casi todo el vocabulario y
+    la distancia de edición se calcula solo sobre los pocos términos candidatos.
+    """
+
+    def __init__(self, terminos: Iterable[str]):
+        self.terminos: List[str] = list(terminos)
+        self._por_bigrama: Dict[str, List[int]] = {}
+        for posicion, termino in enumerate(self.terminos):
+            for bigrama in set(_bigramas(termino)):
+                self._por_bigrama.setdefault(bigrama, []).append(posicion)
+
+    def parecidos(self, token: str) -> List[Tuple[str, int]]:
+        """Términos cuyo prefijo está a distancia <= `distancia_maxima(token)`, con su distancia."""
+        maximo = distancia_maxima(token)
+        if maximo == 0:
+            return []
+        bigramas = set(_bigramas(token))
+        # Cada edición rompe a lo sumo tres bigramas distintos (una transposición
+        # "ab" -> "ba" cambia el bigrama de adentro y los dos de los costados)
+        minimo_compartido = max(1, len(bigramas) - 3 * maximo)
+        compartidos = Counter()
+        for bigrama in bigramas:
+            compartidos.update(self._por_bigrama.get(bigrama, ()))
+        resultado = []
+        for posicion, cantidad in compartidos.items():
+            if cantidad < minimo_compartido:
+                continue
+            termino = self.terminos[posicion]
+            distancia = distancia_a_prefijo(token, termino, maximo)
+            if distancia <= maximo:
+                resultado.append((termino, distancia))
+        return resultado
+
+
+class ProductSearchIndex:
+    """
+    Índice invertido en memoria sobre `nombre` y `descripcion` de los productos.
+
+    Cada palabra buscada se trata como prefijo (búsqueda mientras se escribe) sin
+    tildes ni mayúsculas, y todas deben aparecer en el producto. Los términos se
+    guardan ordenados, así que cada prefijo se resuelve con una búsqueda binaria
+    en vez de recorrer toda la tabla. El resultado se ordena por relevancia.
+
+    Con `fuzzy`, una palabra que no coincide con nada se compara contra los nombres
+    tolerando errores de tipeo ("corna" -> "Corona"). El índice de bigramas para eso
+    se construye en segundo plano la primera vez; mientras tanto se busca sin tolerancia.
+    """
+
+    def __init__(self, productos: Iterable[ProductoResponse]):
+        self.productos: Dict[int, ProductoResponse] = {}
+        self._nombres: Dict[int, str] = {}
+        self._disponibles: Set[int] = set()
+        # término -> productos que lo tienen en el nombre / en la descripción
+        self._en_nombre: Dict[str, Set[int]] = {}
+        self._en_descripcion: Dict[str, Set[int]] = {}
+        # primera palabra del nombre -> productos (para el bono de inicio)
+        self._primera_palabra: Dict[str, Set[int]] = {}
+        for producto in productos:
+            self.productos[producto.id] = producto
+            self._nombres[producto.id] = normalizar(producto.nombre)
+            if producto.disponible:
+                self._disponibles.add(producto.id)
+            terminos_nombre = tokenizar(producto.nombre)
+            for termino in terminos_nombre:
+                self._en_nombre.setdefault(termino, set()).add(producto.id)
+            for termino in tokenizar(producto.descripcion):
+                self._en_descripcion.setdefault(termino, set()).add(producto.id)
+            if terminos_nombre:
+                self._primera_palabra.setdefault(terminos_nombre[0], set()).add(producto.id)
+        self._terminos_nombre: List[str] = sorted(self._en_nombre)
+        self._terminos_descripcion: List[str] = sorted(self._en_descripcion)
+        self._terminos_primera: List[str] = sorted(self._primera_palabra)
+        self.cache = TTLCache(maxsize=MAX_RESULTADOS_CACHEADOS, ttl=float("inf"))
+        self._difuso: Optional[FuzzyTermIndex] = None
+        self._construyendo_difuso = False
+        self._lock = threading.Lock()
+
+    def difuso_listo(self) -> bool:
+        return self._difuso is not None
+
+    def construir_difuso(self) -> None:
+        """Construir el índice de bigramas (bloqueante)."""
+        if self._difuso is None:
+            self._difuso = FuzzyTermIndex(self._terminos_nombre)
+
+    def _preparar_difuso(self) -> None:
+        with self._lock:
+            if self._construyendo_difuso:
+                return
+            self._construyendo_difuso = True
+        threading.Thread(target=self.construir_difuso, name="fuzzy-index", daemon=True).start()
+
+    @staticmethod
+    def _con_prefijo(terminos: List[str], postings: Dict[str, Set[int]], token: str) -> Set[int]:
+        """Productos con algún término que empieza con `token` (búsqueda binaria sobre los términos)."""
+        inicio = bisect_left(terminos, token)
+        fin = bisect_left(terminos, token + "\uffff", inicio)
+        if fin - inicio == 1:
+            return postings[terminos[inicio]]
+        return set().union(*(postings[t] for t in terminos[inicio:fin]))
+
+    def _puntajes(self, token: str, difuso: Optional[FuzzyTermIndex]) -> Dict[int, float]:
+        """Puntaje por producto para un token: el del mejor campo y tipo de coincidencia."""
+        vacio: Set[int] = set()
+        # De menor a mayor puntaje: cada nivel pisa al anterior
+        niveles = (
+            (PESO_DESCRIPCION, self._con_prefijo(self._terminos_descripcion, self._en_descripcion, token)),
+            (PESO_DESCRIPCION * BONO_EXACTO, self._en_descripcion.get(token, vacio)),
+            (PESO_NOMBRE, self._con_prefijo(self._terminos_nombre, self._en_nombre, token)),
+            (PESO_NOMBRE * BONO_EXACTO, self._en_nombre.get(token, vacio)),
+        )
+        puntajes: Dict[int, float] = {}
+        for puntaje, ids in niveles:
+            puntajes.update(dict.fromkeys(ids, puntaje))
+
+        if not puntajes and difuso is not None:
+            # Sin coincidencias: probablemente un error de tipeo en el nombre
+            for termino, distancia in sorted(difuso.parecidos(token), key=lambda par: -par[1]):
+                puntajes.update(dict.fromkeys(self._en_nombre[termino], PESO_NOMBRE * FACTOR_DIFUSO ** distancia))
+        return puntajes
+
+    def buscar(
+        self, texto: str, disponible: Optional[bool] = True, limit: int = 20, fuzzy: bool = False
+    ) -> List[ProductoResponse]:
+        """Productos que contienen todas las palabras de `texto`, los más relevantes primero."""
+        tokens = list(dict.fromkeys(tokenizar(texto)))
+        if not tokens:
+            return []
+        difuso = None
+        if fuzzy:
+            difuso = self._difuso
+            if difuso is None:
+                self._preparar_difuso()
+        clave = (tuple(tokens), disponible, limit, difuso is not None)
+        resultado = self.cache.get(clave)
+        if resultado is None:
+            resultado = self._buscar(tokens, disponible, limit, difuso)
+            self.cache.set(clave, resultado)
+        return list(resultado)
+
+    def _buscar(
+        self, tokens: List[str], disponible: Optional[bool], limit: int, difuso: Optional[FuzzyTermIndex]
+    ) -> Tuple[ProductoResponse, ...]:
+        # Empezar por el token más selectivo reduce los candidatos a intersectar
+        por_token = sorted((self._puntajes(t, difuso) for t in tokens), key=len)
+        candidatos = por_token[0]
+        for puntajes in por_token[1:]:
+            candidatos = {
+                producto_id: total + puntajes[producto_id]
+                for producto_id, total in candidatos.items()
+                if producto_id in puntajes
+            }
+            if not candidatos:
+                return ()
+
+        if disponible is not None:
+            ids = candidatos.keys() & self._disponibles
+            if not disponible:
+                ids = candidatos.keys() - self._disponibles
+        else:
+            ids = candidatos.keys()
+        al_inicio = self._con_prefijo(self._terminos_primera, self._primera_palabra, tokens[0])
+
+        nombres = self._nombres
+        ranking = heapq.nsmallest(
+            limit,
+            (
+                (-(candidatos[i] + (BONO_INICIO_NOMBRE if i in al_inicio else 0.0)), nombres[i], i)
+                for i in ids
+            ),
+        )
+        return tuple(self.productos[producto_id] for _, _, producto_id in ranking)
@@ -0,0 +1,213 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+from sqlalchemy.engine import Engine
+
+from database import engine
+from models import QR, Compra, EstadoCompra, EstadoQR
+from services.qr_redemption import qr_index
+
+logger = logging.getLogger(__name__)
+
+
+def _horas(variable: str, por_defecto: str) -> Optional[float]:
+    horas = float(os.getenv(variable, por_defecto))
+    return horas if horas >= 0 else None
+
+
+# Horas que un QR sigue ACTIVO según el estado de su orden, contadas desde que la
+# orden llegó a ese estado. Un valor negativo desactiva la expiración para ese estado.
+# Por defecto solo expira ENTREGADO: las órdenes entregadas con `PUT /compras/{id}/estado`
+# sin escanear el QR, que si no quedaría activo para siempre. Una orden PAGADO,
+# EN_PREPARACION o LISTO ya se cobró y no tiene reembolso: expirar su QR dejaría al
+# cliente sin poder retirarla, así que esos TTL hay que activarlos a propósito.
+QR_TTL_HORAS_POR_ESTADO = {
+    EstadoCompra.PAGADO: _horas("QR_TTL_PAGADO_HORAS", "-1"),
+    EstadoCompra.EN_PREPARACION: _horas("QR_TTL_EN_PREPARACION_HORAS", "-1"),
+    EstadoCompra.LISTO: _horas("QR_TTL_LISTO_HORAS", "-1"),
+    EstadoCompra.ENTREGADO: _horas("QR_TTL_ENTREGADO_HORAS", "0"),
+}
+# Segundos entre barridos (0 = no barrer desde la app)
+QR_EXPIRACION_INTERVALO_SECONDS = float(os.getenv("QR_EXPIRACION_INTERVALO_SECONDS", "60"))
+# QR expirados por transacción: acota cuánto tiempo un barrido tiene el lock de escritura
+QR_EXPIRACION_LOTE = int(os.getenv("QR_EXPIRACION_LOTE", "500"))
+
+# Desde cuándo cuenta el TTL de cada estado (las órdenes viejas pueden no tener fecha_*)
+_INICIO_ESTADO = {
+    EstadoCompra.PAGADO: Compra.fecha_hora,
+    EstadoCompra.EN_PREPARACION: func.coalesce(Compra.fecha_en_preparacion, Compra.fecha_hora),
+    EstadoCompra.LISTO: func.coalesce(Compra.fecha_listo, Compra.fecha_hora),
+    EstadoCompra.ENTREGADO: func.coalesce(Compra.fecha_entregado, Compra.fecha_hora),
+}
+
+
+def consulta_vencidos(ttl_horas: Dict[EstadoCompra, Optional[float]], ahora: datetime, desde_compra: int, tamano_lote: int):
+    """
+    Hasta `tamano_lote` QR activos vencidos según el TTL del estado de su orden,
+    con id_compra mayor a `desde_compra`. Recorre el índice (estado, id_compra) en
+    orden, así cada lote sigue donde terminó el anterior en vez de volver a leer
+    los activos que no vencen.
+    """
+    vencida = or_(*(
+        and_(Compra.estado == estado, _INICIO_ESTADO[estado] < ahora - timedelta(hours=horas))
+        for estado, horas in ttl_horas.items()
+        if horas is not None
+    ))
+    return (
+        select(QR.id_compra)
+        .join(Compra, Compra.id == QR.id_compra)
+        .where(QR.estado == EstadoQR.ACTIVO, QR.id_compra > desde_compra, vencida)
+        .order_by(QR.id_compra)
+        .limit(tamano_lote)
+    )
+
+
+def expirar_qrs(ids_compra: List[int]):
+    """
+    UPDATE de un lote a EXPIRADO; solo toca los que siguen ACTIVO (un canje simultáneo
+    gana). Retorna (id_compra, código) de cada QR expirado.
+    """
+    return (
+        update(QR)
+        .where(QR.id_compra.in_(ids_compra), QR.estado == EstadoQR.ACTIVO)
+        .values(estado=EstadoQR.EXPIRADO)
+        .returning(QR.id_compra, QR.codigo_qr_hash)
+    )
+
+
+class QRExpirySweeper:
+    """
+    Expira en segundo plano los QR que quedaron ACTIVO más de lo configurado.
+
+    Un hilo corre `barrer` cada `intervalo` segundos. Cada lote (a lo sumo
+    `tamano_lote` QR) es una transacción corta aparte: busca los vencidos
+    siguientes con el índice (estado, id_compra) y los pasa a EXPIRADO con un
+    UPDATE condicional,
+    así el barrido nunca retiene el lock de escritura mucho tiempo ni compite con
+    las compras por una transacción grande. Los códigos expirados se informan a
+    `al_expirar` (p. ej. el índice de QR en memoria) y sus compras, ya confirmado
+    el lote, a `al_expirar_compras` (p. ej. para avisar por SSE).
+
+    Con varios workers cada uno barre por su cuenta; como el UPDATE solo toca
+    filas ACTIVO, dos barridos simultáneos no se pisan.
+    """
+
+    def __init__(
+        self,
+        engine: Engine,
+        ttl_horas: Dict[EstadoCompra, Optional[float]],
+        intervalo: float = 60.0,
+        tamano_lote: int = 500,
+        al_expirar: Optional[Callable[[List[str]], None]] = None,
+        al_expirar_compras: Optional[Callable[[List[int]], None]] = None,
+    ):
+        self.engine = engine
+        self.ttl_horas = ttl_horas
+        self.intervalo = intervalo
+        self.tamano_lote = tamano_lote
+        self.al_expirar = al_expirar
+        self.al_expirar_compras = al_expirar_compras
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.barridos = 0
+        self.expirados = 0
+        self.lotes = 0
+        self.errores = 0
+        self.ultimo_barrido_expirados = 0
+        self.ultimo_barrido_ms = 0.0
+        self.max_lote_ms = 0.0
+
+    def iniciar(self) -> None:
+        """Arrancar el hilo de barrido (idempotente; no hace nada con intervalo 0)."""
+        if self.intervalo <= 0:
+            return
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="qr-expiry", daemon=True)
+            self._hilo.start()
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Detener el hilo (llamar al apagar la app)."""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is None:
+            return
+        self._detener.set()
+        hilo.join(timeout)
+
+    def _bucle(self) -> None:
+        while not self._detener.wait(self.intervalo):
+            try:
+                self.barrer()
+            except Exception:
+                logger.exception("Falló el barrido de QR vencidos")
+                with self._lock:
+                    self.errores += 1
+
+    def barrer(self, ahora: Optional[datetime] = None) -> int:
+        """Expirar todos los QR vencidos, lote por lote. Retorna cuántos se expiraron."""
+        ahora = ahora or datetime.utcnow()
+        inicio = time.perf_counter()
+        total = 0
+        desde = 0
+        habilitado = any(horas is not None for horas in self.ttl_horas.values())
+        while habilitado and not self._detener.is_set():
+            inicio_lote = time.perf_counter()
+            with self.engine.begin() as conn:
+                ids = conn.scalars(consulta_vencidos(self.ttl_horas, ahora, desde, self.tamano_lote)).all()
+                expirados: List[Tuple[int, str]] = conn.execute(expirar_qrs(ids)).all() if ids else []
+            duracion_lote = (time.perf_counter() - inicio_lote) * 1000
+            if expirados:
+                total += len(expirados)
+                with self._lock:
+                    self.lotes += 1
+                    self.max_lote_ms = max(self.max_lote_ms, duracion_lote)
+                if self.al_expirar is not None:
+                    self.al_expirar([codigo for _, codigo in expirados])
+                if self.al_expirar_compras is not None:
+                    self.al_expirar_compras([id_compra for id_compra, _ in expirados])
+            if len(ids) < self.tamano_lote:
+                break
+            desde = ids[-1]
+        with self._lock:
+            self.barridos += 1
+            self.expirados += total
+            self.ultimo_barrido_expirados = total
+            self.ultimo_barrido_ms = (time.perf_counter() - inicio) * 1000
+        return total
+
+    def stats(self) -> Dict[str, object]:
+        """Contadores del barrido de expiración."""
+        with self._lock:
+            return {
+                "activo": self._hilo is not None and self._hilo.is_alive(),
+                "barridos": self.barridos,
+                "expirados": self.expirados,
+                "lotes": self.lotes,
+                "errores": self.errores,
+                "ultimo_barrido_expirados": self.ultimo_barrido_expirados,
+                "ultimo_barrido_ms": round(self.ultimo_barrido_ms, 1),
+                "max_lote_ms": round(self.max_lote_ms, 1),
+            }
+
+
+def _marcar_expirados(codigos: List[str]) -> None:
+    qr_index.marcar_varios(codigos, EstadoQR.EXPIRADO)
+
+
+qr_expiry_sweeper = QRExpirySweeper(
+    engine,
+    QR_TTL_HORAS_POR_ESTADO,
+    intervalo=QR_EXPIRACION_INTERVALO_SECONDS,
+    tamano_lote=QR_EXPIRACION_LOTE,
+    al_expirar=_marcar_expirados,
+)
@@ -0,0 +1,233 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import exists, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import QR, Compra, EstadoCompra, EstadoQR, Usuario
+
+logger = logging.getLogger(__name__)
+
+# Usar el índice de códigos en memoria para rechazar escaneos de códigos ya usados sin ir a la base
+QR_INDICE_MEMORIA = os.getenv("QR_INDICE_MEMORIA", "true").lower() in ("1", "true", "yes")
+# Recarga completa del índice en segundo plano (recoge canjes y expiraciones hechos en otros workers)
+QR_INDICE_TTL_SECONDS = float(os.getenv("QR_INDICE_TTL_SECONDS", "300"))
+
+
+def canjear_qr(codigo_qr_hash: str):
+    """
+    UPDATE condicional que pasa el QR de ACTIVO a CANJEADO solo si su orden está
+    LISTO, y retorna el id de la compra. Sin fila de resultado = código inexistente,
+    ya usado u orden no lista (ver `diagnosticar_qr`).
+    """
+    orden_lista = exists().where(Compra.id == QR.id_compra, Compra.estado == EstadoCompra.LISTO)
+    return (
+        update(QR)
+        .where(QR.codigo_qr_hash == codigo_qr_hash, QR.estado == EstadoQR.ACTIVO, orden_lista)
+        .values(estado=EstadoQR.CANJEADO)
+        .returning(QR.id_compra)
+    )
+
+
+def entregar_compra(id_compra: int, fecha: datetime):
+    """
+    UPDATE que pasa la compra de LISTO a ENTREGADO y retorna lo que muestra la
+    puerta (total, usuario y su nombre), sin cargar la compra ni el usuario.
+    """
+    nombre_cliente = select(Usuario.nombre).where(Usuario.id == Compra.id_usuario).scalar_subquery()
+    return (
+        update(Compra)
+        .where(Compra.id == id_compra, Compra.estado == EstadoCompra.LISTO)
+        .values(estado=EstadoCompra.ENTREGADO, fecha_entregado=fecha)
+        .returning(Compra.id, Compra.id_usuario, Compra.total, nombre_cliente)
+    )
+
+
+def diagnosticar_qr(codigo_qr_hash: str):
+    """Estado del QR y de su orden, para explicar por qué no se pudo canjear."""
+    return (
+        select(QR.estado, Compra.estado)
+        .join(Compra, Compra.id == QR.id_compra)
+        .where(QR.codigo_qr_hash == codigo_qr_hash)
+    )
+
+
+def leer_codigos(db: Session) -> List[Tuple[str, EstadoQR]]:
+    """Todos los códigos QR con su estado."""
+    return db.execute(select(QR.codigo_qr_hash, QR.estado)).all()
+
+
+def cargar_codigos() -> List[Tuple[str, EstadoQR]]:
+    with SessionLocal() as db:
+        return leer_codigos(db)
+
+
+def consultar_codigo(codigo_qr_hash: str) -> Optional[EstadoQR]:
+    """Estado de un código leído de la base (una búsqueda en el índice único), o None si no existe."""
+    with SessionLocal() as db:
+        return db.scalar(select(QR.estado).where(QR.codigo_qr_hash == codigo_qr_hash))
+
+
+class QRIndex:
+    """
+    Los códigos QR emitidos y su estado, en memoria, para responder sin tocar la
+    base el escaneo de un código ya canjeado o expirado (400; esos estados son
+    finales, nunca vuelven a ACTIVO).
+
+    Guarda `hash()` de cada código (un entero por código en vez del string de 64
+    caracteres). Que un código figure ACTIVO solo significa "puede canjearse": el
+    canje siempre lo confirma el UPDATE condicional, así que un dato viejo (p. ej.
+    un canje hecho en otro worker) cuesta una consulta y nunca un canje indebido.
+
+    Lo inverso sí importa: un código creado en otro worker todavía no está en el
+    índice. Por eso un código desconocido nunca se rechaza solo con el índice:
+    `buscar` lo consulta en la base por su hash antes de responder 404. La copia
+    completa se recarga en un hilo de fondo cada `ttl` segundos (ver `iniciar`),
+    nunca en una request.
+    """
+
+    def __init__(
+        self,
+        cargar: Callable[[], Iterable[Tuple[str, EstadoQR]]],
+        consultar: Callable[[str], Optional[EstadoQR]],
+        ttl: float,
+    ):
+        self._cargar = cargar
+        self._consultar = consultar
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._lock_carga = threading.Lock()
+        self._estados: Dict[int, EstadoQR] = {}
+        self._cargando = False
+        self._pendientes: List[Tuple[int, EstadoQR]] = []
+        self._cargado_en: Optional[float] = None
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.busquedas_en_base = 0
+        self.inexistentes = 0
+        self.recargas = 0
+        self.errores = 0
+
+    def iniciar(self) -> None:
+        """Arrancar el hilo que carga el índice y lo recarga cada `ttl` segundos (idempotente)."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="qr-index", daemon=True)
+            self._hilo.start()
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Detener el hilo de recarga (llamar al apagar la app)."""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is None:
+            return
+        self._detener.set()
+        hilo.join(timeout)
+
+    def _bucle(self) -> None:
+        espera = 0.0
+        while not self._detener.wait(espera):
+            try:
+                self.recargar()
+                espera = self.ttl
+            except Exception:
+                logger.exception("Falló la recarga del índice de QR")
+                with self._lock:
+                    self.errores += 1
+                # Sin copia cargada los escaneos consultan la base: reintentar pronto
+                espera = min(self.ttl, 10.0)
+
+    def recargar(self) -> None:
+        """Leer todos los códigos (bloqueante: la llama el hilo de fondo)."""
+        with self._lock_carga:
+            with self._lock:
+                self._pendientes = []
+                self._cargando = True
+            try:
+                codigos = self._cargar()
+            except Exception:
+                with self._lock:
+                    self._cargando = False
+                raise
+            estados = {hash(codigo): estado for codigo, estado in codigos}
+            with self._lock:
+                # Cambios registrados en este proceso mientras se leía la base
+                for h, estado in self._pendientes:
+                    if estado == EstadoQR.ACTIVO:
+                        estados.setdefault(h, estado)
+                    else:
+                        estados[h] = estado
+                self._estados = estados
+                self._pendientes = []
+                self._cargando = False
+                self._cargado_en = time.monotonic()
+                self.recargas += 1
+
+    def _registrar(self, h: int, estado: EstadoQR) -> None:
+        """Con `_lock` tomado."""
+        self._estados[h] = estado
+        if self._cargando:
+            self._pendientes.append((h, estado))
+
+    def agregar(self, codigo_qr_hash: str) -> None:
+        """Registrar el QR de una compra recién confirmada en este proceso."""
+        with self._lock:
+            self._registrar(hash(codigo_qr_hash), EstadoQR.ACTIVO)
+
+    def marcar(self, codigo_qr_hash: str, estado: EstadoQR) -> None:
+        """Registrar que un código pasó a CANJEADO o EXPIRADO."""
+        with self._lock:
+            self._registrar(hash(codigo_qr_hash), estado)
+
+    def marcar_varios(self, codigos: Iterable[str], estado: EstadoQR) -> None:
+        """Como `marcar`, para un lote de códigos (p. ej. los que expiró el barrido)."""
+        with self._lock:
+            for codigo in codigos:
+                self._registrar(hash(codigo), estado)
+
+    def estado(self, codigo_qr_hash: str) -> Optional[EstadoQR]:
+        """Estado conocido del código, o None si no figura (sin leer la base)."""
+        return self._estados.get(hash(codigo_qr_hash))
+
+    def buscar(self, codigo_qr_hash: str) -> Optional[EstadoQR]:
+        """
+        Como `estado`, pero un código desconocido se consulta en la base por su
+        hash (p. ej. uno creado en otro worker). None = el código no existe.
+        Puede leer la base: llamar desde el threadpool.
+        """
+        h = hash(codigo_qr_hash)
+        estado = self._estados.get(h)
+        if estado is not None:
+            return estado
+        estado = self._consultar(codigo_qr_hash)
+        with self._lock:
+            self.busquedas_en_base += 1
+            if estado is None:
+                self.inexistentes += 1
+            elif h not in self._estados:
+                self._registrar(h, estado)
+        return estado
+
+    def stats(self) -> Dict[str, object]:
+        activos = sum(1 for estado in list(self._estados.values()) if estado == EstadoQR.ACTIVO)
+        return {
+            "habilitado": QR_INDICE_MEMORIA,
+            "cargado": self._cargado_en is not None,
+            "codigos": len(self._estados),
+            "activos": activos,
+            "busquedas_en_base": self.busquedas_en_base,
+            "inexistentes": self.inexistentes,
+            "recargas": self.recargas,
+            "errores": self.errores,
+        }
+
+
+qr_index = QRIndex(cargar_codigos, consultar_codigo, QR_INDICE_TTL_SECONDS)
@@ -0,0 +1,243 @@
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from itertools import combinations
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+
+from database import SessionLocal
+from models import Compra, DetalleCompra
+from schemas import ProductoResponse
+
+logger = logging.getLogger(__name__)
+
+# Vida media de la popularidad: una venta de hace RECOMENDACIONES_VIDA_MEDIA_HORAS pesa la mitad
+VIDA_MEDIA_HORAS = float(os.getenv("RECOMENDACIONES_VIDA_MEDIA_HORAS", "24"))
+# Recarga completa desde la base (recoge compras hechas en otros workers)
+RECOMENDACIONES_TTL_SECONDS = float(os.getenv("RECOMENDACIONES_TTL_SECONDS", "600"))
+# Historial que lee cada recarga. Por defecto 20 vidas medias: una venta más vieja pesa
+# menos de una millonésima (la co-ocurrencia también se cuenta solo en esta ventana)
+RECOMENDACIONES_VENTANA_HORAS = float(os.getenv("RECOMENDACIONES_VENTANA_HORAS", str(20 * VIDA_MEDIA_HORAS)))
+# Órdenes con más productos distintos no suman a la co-ocurrencia (serían O(n²) pares)
+MAX_PRODUCTOS_POR_ORDEN = 30
+# Re-anclar los puntajes antes de que exp() crezca demasiado
+_MAX_EXPONENTE = 50.0
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _a_epoch(fecha: datetime) -> float:
+    return (fecha - _EPOCH).total_seconds()
+
+
+# (id_compra, id_producto, cantidad, fecha_hora), ordenadas por id_compra
+FilaHistorial = Tuple[int, int, int, datetime]
+
+
+def cargar_historial(desde: datetime) -> Tuple[int, Sequence[FilaHistorial]]:
+    """Última compra confirmada y las líneas de `detalles_compra` de las compras desde `desde` hasta ella."""
+    with SessionLocal() as db:
+        ultima = db.scalar(select(func.max(Compra.id))) or 0
+        filas = db.execute(
+            select(DetalleCompra.id_compra, DetalleCompra.id_producto, DetalleCompra.cantidad, Compra.fecha_hora)
+            .join(Compra, Compra.id == DetalleCompra.id_compra)
+            .where(Compra.id <= ultima, Compra.fecha_hora >= desde)
+            .order_by(DetalleCompra.id_compra)
+        ).all()
+    return ultima, filas
+
+
+class RecommendationEngine:
+    """
+    Popularidad con decaimiento exponencial y co-ocurrencia entre productos, en memoria.
+
+    Cada venta suma sus unidades multiplicadas por exp(λ·(t - t0)); como todos los
+    puntajes se "anclan" al mismo t0, ordenar por el valor guardado equivale a ordenar
+    por la popularidad decaída a hoy, sin recalcular nada al consultar. La matriz de
+    co-ocurrencia cuenta en cuántas órdenes aparecen juntos dos productos.
+
+    Se construye desde las compras de las últimas `ventana_horas` en un hilo de
+    fondo (ver `iniciar`), que la reconstruye cada `ttl` segundos para recoger las
+    compras de otros workers, y se actualiza con `registrar_compra` al confirmar cada
+    orden. Las consultas nunca esperan una lectura de la base: usan la última versión
+    construida (vacía hasta la primera, con `populares` en orden de menú).
+    """
+
+    def __init__(
+        self,
+        cargar: Callable[[datetime], Tuple[int, Sequence[FilaHistorial]]],
+        vida_media_horas: float,
+        ttl: float,
+        ventana_horas: Optional[float] = None,
+    ):
+        self._cargar = cargar
+        self.lambda_ = math.log(2) / (vida_media_horas * 3600)
+        self.ttl = ttl
+        self.ventana = timedelta(hours=ventana_horas if ventana_horas is not None else 20 * vida_media_horas)
+        self._lock = threading.Lock()
+        self._lock_construccion = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self._t0 = time.time()
+        self._puntajes: Dict[int, float] = defaultdict(float)
+        self._ordenes: Counter = Counter()
+        self._juntos: Dict[int, Counter] = defaultdict(Counter)
+        self._ultima_compra = 0
+        self._construido_en: Optional[float] = None
+        self._construyendo = False
+        self._pendientes: List[Tuple[int, Dict[int, int], float]] = []
+        self.compras_registradas = 0
+        self.construcciones = 0
+        self.errores = 0
+        self.ultima_construccion_ms = 0.0
+
+    def iniciar(self) -> None:
+        """Arrancar el hilo que construye el motor y lo reconstruye cada `ttl` segundos (idempotente)."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="recommendations", daemon=True)
+            self._hilo.start()
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Detener el hilo de reconstrucción (llamar al apagar la app)."""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is None:
+            return
+        self._detener.set()
+        hilo.join(timeout)
+
+    def _bucle(self) -> None:
+        espera = 0.0
+        while not self._detener.wait(espera):
+            try:
+                self.construir()
+                espera = self.ttl
+            except Exception:
+                logger.exception("Falló la reconstrucción de las recomendaciones")
+                with self._lock:
+                    self.errores += 1
+                # Se siguen sirviendo las estructuras anteriores: reintentar pronto
+                espera = min(self.ttl, 10.0)
+
+    def construir(self) -> None:
+        """Leer el historial de la ventana (bloqueante: la llama el hilo de fondo)."""
+        with self._lock_construccion:
+            self._construir()
+
+    def _construir(self) -> None:
+        inicio = time.perf_counter()
+        with self._lock:
+            self._construyendo = True
+            self._pendientes = []
+        try:
+            ultima, filas = self._cargar(datetime.utcnow() - self.ventana)
+        except Exception:
+            with self._lock:
+                self._construyendo = False
+            raise
+
+        # Armar las estructuras nuevas fuera del lock; las consultas siguen usando las viejas
+        nuevo = RecommendationEngine(self._cargar, 1.0, self.ttl)
+        nuevo.lambda_ = self.lambda_
+        compra_actual, cantidades, fecha = None, {}, None
+        for id_compra, id_producto, cantidad, fecha_hora in filas:
+            if id_compra != compra_actual:
+                if cantidades:
+                    nuevo._sumar(cantidades, _a_epoch(fecha))
+                compra_actual, cantidades, fecha = id_compra, {}, fecha_hora
+            cantidades[id_producto] = cantidades.get(id_producto, 0) + cantidad
+        if cantidades:
+            nuevo._sumar(cantidades, _a_epoch(fecha))
+
+        with self._lock:
+            self._t0, self._puntajes, self._ordenes, self._juntos = (
+                nuevo._t0, nuevo._puntajes, nuevo._ordenes, nuevo._juntos
+            )
+            self._ultima_compra = ultima
+            # Compras confirmadas mientras se leía el historial
+            for id_compra, cantidades, instante in self._pendientes:
+                if id_compra > ultima:
+                    self._sumar(cantidades, instante)
+            self._pendientes = []
+            self._construyendo = False
+            self._construido_en = time.monotonic()
+            self.construcciones += 1
+            self.ultima_construccion_ms = (time.perf_counter() - inicio) * 1000
+
+    def _sumar(self, cantidades: Dict[int, int], instante: float) -> None:
+        exponente = self.lambda_ * (instante - self._t0)
+        if exponente > _MAX_EXPONENTE:
+            # Mover el ancla a `instante`: escalar todo por el mismo factor no cambia el orden
+            factor = math.exp(-exponente)
+            for id_producto in self._puntajes:
+                self._puntajes[id_producto] *= factor
+            self._t0, exponente = instante, 0.0
+        peso = math.exp(exponente)
+        for id_producto, cantidad in cantidades.items():
+            self._puntajes[id_producto] += cantidad * peso
+            self._ordenes[id_producto] += 1
+        if len(cantidades) <= MAX_PRODUCTOS_POR_ORDEN:
+            for a, b in combinations(cantidades, 2):
+                self._juntos[a][b] += 1
+                self._juntos[b][a] += 1
+
+    def registrar_compra(self, id_compra: int, cantidades: Dict[int, int], fecha: Optional[datetime] = None) -> None:
+        """Sumar una compra confirmada (unidades por producto) sin volver a leer la base."""
+        instante = _a_epoch(fecha) if fecha else time.time()
+        with self._lock:
+            self.compras_registradas += 1
+            if self._construyendo:
+                self._pendientes.append((id_compra, dict(cantidades), instante))
+            elif self._construido_en is not None and id_compra > self._ultima_compra:
+                self._sumar(cantidades, instante)
+
+    def populares(self, productos: Iterable[ProductoResponse], limit: int) -> List[ProductoResponse]:
+        """Los `limit` productos con mayor popularidad decaída (desempate por id)."""
+        puntajes = self._puntajes
+        return heapq.nsmallest(limit, productos, key=lambda p: (-puntajes.get(p.id, 0.0), p.id))
+
+    def comprados_juntos(
+        self, id_producto: int, productos: Iterable[ProductoResponse], limit: int
+    ) -> List[ProductoResponse]:
+        """
+        Productos que más se compran junto a `id_producto`, por similitud coseno
+        (órdenes en común / √(órdenes de cada uno)) para no favorecer solo a los más vendidos.
+        """
+        vecinos = self._juntos.get(id_producto)
+        if not vecinos:
+            return []
+        vecinos = dict(vecinos)
+        base = self._ordenes[id_producto]
+        ordenes = self._ordenes
+        puntuados = [
+            (-(vecinos[p.id] / math.sqrt(base * ordenes[p.id])), -vecinos[p.id], p.id, p)
+            for p in productos
+            if p.id in vecinos and p.id != id_producto
+        ]
+        return [p for *_, p in heapq.nsmallest(limit, puntuados, key=lambda t: t[:3])]
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "construido": self._construido_en is not None,
+            "productos": len(self._puntajes),
+            "pares_co_ocurrencia": sum(len(v) for v in list(self._juntos.values())) // 2,
+            "compras_registradas": self.compras_registradas,
+            "construcciones": self.construcciones,
+            "errores": self.errores,
+            "ultima_construccion_ms": round(self.ultima_construccion_ms, 1),
+        }
+
+
+recommendation_engine = RecommendationEngine(
+    cargar_historial, VIDA_MEDIA_HORAS, RECOMENDACIONES_TTL_SECONDS, RECOMENDACIONES_VENTANA_HORAS
+)
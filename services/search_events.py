@@ -0,0 +1,151 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.engine import Engine
+
+from models import EventoBusquedaProducto
+from services.analytics_rollups import sumar_busquedas
+
+logger = logging.getLogger(__name__)
+
+# Marca que despierta al hilo para que escriba lo pendiente y termine
+_CERRAR = object()
+
+
+class SearchEventWriter:
+    """
+    Registra los eventos de búsqueda en lote, fuera del request.
+
+    `registrar` solo encola (nunca bloquea): si la cola está llena el evento se
+    descarta y se cuenta en `descartados`. Un hilo de fondo junta hasta
+    `tamano_lote` eventos, o lo que haya tras `intervalo` segundos, y los guarda
+    con un único INSERT, sumándolos en la misma transacción al resumen por hora
+    de /analytics. Así una búsqueda no abre una transacción de escritura
+    ni compite por el lock con las compras.
+    """
+
+    def __init__(self, engine: Engine, max_cola: int = 10000, tamano_lote: int = 500, intervalo: float = 1.0):
+        self.engine = engine
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self._cola: "queue.Queue" = queue.Queue(maxsize=max_cola)
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+        self.encolados = 0
+        self.descartados = 0
+        self.escritos = 0
+        self.lotes = 0
+        self.errores = 0
+
+    def iniciar(self) -> None:
+        """Arrancar el hilo de escritura (idempotente)."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="search-events", daemon=True)
+            self._hilo.start()
+
+    def registrar(self, termino: str, disponible: Optional[bool], limite: int, resultados: int) -> bool:
+        """Encolar un evento. Retorna False si se descartó por cola llena."""
+        if self._hilo is None:
+            self.iniciar()
+        evento = {
+            "termino": termino,
+            "disponible": disponible,
+            "limite": limite,
+            "resultados": resultados,
+            "creado_en": datetime.utcnow(),  # hora de la búsqueda, no del flush
+        }
+        try:
+            self._cola.put_nowait(evento)
+        except queue.Full:
+            with self._lock:
+                self.descartados += 1
+            return False
+        with self._lock:
+            self.encolados += 1
+        return True
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        """Escribir los eventos pendientes y detener el hilo (llamar al apagar la app)."""
+        with self._lock:
+            hilo = self._hilo
+            self._hilo = None
+        if hilo is None:
+            return
+        self._detener.set()
+        try:
+            # Despertar al hilo si está esperando eventos. Con la cola llena no está
+            # esperando: ve `_detener` al terminar el lote en curso
+            self._cola.put_nowait(_CERRAR)
+        except queue.Full:
+            pass
+        hilo.join(timeout)
+
+    def _bucle(self) -> None:
+        cerrar = False
+        while not cerrar and not self._detener.is_set():
+            evento = self._cola.get()
+            if evento is _CERRAR:
+                break
+            lote: List[Dict] = [evento]
+            # Completar el lote, esperando como máximo `intervalo` segundos
+            fin = time.monotonic() + self.intervalo
+            while len(lote) < self.tamano_lote:
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    evento = self._cola.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if evento is _CERRAR:
+                    cerrar = True
+                    break
+                lote.append(evento)
+            self._escribir(lote)
+
+        # Al cerrar, escribir lo que haya quedado en la cola
+        restantes = []
+        while True:
+            try:
+                evento = self._cola.get_nowait()
+            except queue.Empty:
+                break
+            if evento is not _CERRAR:
+                restantes.append(evento)
+        for inicio in range(0, len(restantes), self.tamano_lote):
+            self._escribir(restantes[inicio:inicio + self.tamano_lote])
+
+    def _escribir(self, lote: List[Dict]) -> None:
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(insert(EventoBusquedaProducto), lote)
+                conn.execute(*sumar_busquedas(self.engine.dialect.name, (evento["creado_en"] for evento in lote)))
+        except Exception:
+            logger.exception("No se pudieron guardar %d eventos de búsqueda", len(lote))
+            with self._lock:
+                self.errores += len(lote)
+            return
+        with self._lock:
+            self.escritos += len(lote)
+            self.lotes += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores del escritor y profundidad actual de la cola."""
+        with self._lock:
+            return {
+                "en_cola": self._cola.qsize(),
+                "encolados": self.encolados,
+                "descartados": self.descartados,
+                "escritos": self.escritos,
+                "lotes": self.lotes,
+                "errores": self.errores,
+            }
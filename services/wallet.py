@@ -0,0 +1,178 @@
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import Integer, and_, cast, delete, exists, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from models import MovimientoSaldo, SnapshotSaldo, TipoMovimientoSaldo, Usuario
+
+# Filas por lote al recorrer el libro en la verificación
+TAMANO_LOTE_VERIFICACION = 1000
+
+
+def a_centavos(monto: float) -> int:
+    """Monto en pesos (float) a centavos enteros, que es como se guarda en el libro."""
+    return int(round(monto * 100))
+
+
+def debitar_saldo(id_usuario: int, monto: float):
+    """
+    UPDATE condicional que descuenta `monto` solo si el saldo alcanza, y retorna el
+    saldo nuevo. Sin fila de resultado = saldo insuficiente.
+
+    La base compara y descuenta en una sola sentencia, así dos compras simultáneas
+    no pueden leer el mismo saldo y pisarse (nunca se usa un saldo leído antes en memoria).
+    """
+    return (
+        update(Usuario)
+        .where(Usuario.id == id_usuario, Usuario.saldo >= monto)
+        .values(saldo=Usuario.saldo - monto)
+        .returning(Usuario.saldo)
+    )
+
+
+def acreditar_saldo(id_usuario: int, monto: float):
+    """UPDATE que suma `monto` al saldo sobre el valor actual de la base y retorna el saldo nuevo."""
+    return (
+        update(Usuario)
+        .where(Usuario.id == id_usuario)
+        .values(saldo=Usuario.saldo + monto)
+        .returning(Usuario.saldo)
+    )
+
+
+def registrar_movimiento(
+    id_usuario: int,
+    tipo: TipoMovimientoSaldo,
+    monto: float,
+    saldo_resultante: float,
+    id_compra: Optional[int] = None,
+    id_recarga: Optional[int] = None,
+):
+    """
+    INSERT de un movimiento del libro. Va en la misma transacción que el UPDATE del
+    saldo, con el saldo que retornó ese UPDATE: el lock de la fila del usuario ordena
+    los movimientos, así cada saldo resultante es el anterior más el monto. `monto`
+    debe ser un número entero de centavos (el mismo que se sumó al saldo): si tuviera
+    fracción de centavo, el monto y el saldo se redondearían por separado.
+    """
+    return insert(MovimientoSaldo).values(
+        id_usuario=id_usuario,
+        tipo=tipo,
+        monto_centavos=a_centavos(monto),
+        saldo_centavos=a_centavos(saldo_resultante),
+        id_compra=id_compra,
+        id_recarga=id_recarga,
+    )
+
+
+def consulta_saldo_en(id_usuario: int, fecha: Optional[datetime] = None):
+    """
+    Último movimiento del usuario (hasta `fecha`, si se indica). Con el índice
+    (id_usuario, fecha_hora, id) es una sola búsqueda en el índice.
+    """
+    consulta = select(MovimientoSaldo).where(MovimientoSaldo.id_usuario == id_usuario)
+    if fecha is not None:
+        consulta = consulta.where(MovimientoSaldo.fecha_hora <= fecha)
+    return consulta.order_by(MovimientoSaldo.fecha_hora.desc(), MovimientoSaldo.id.desc()).limit(1)
+
+
+def abrir_libro(db: Session) -> int:
+    """
+    Movimiento de APERTURA para los usuarios con saldo que todavía no tienen
+    movimientos (saldos anteriores al libro). Retorna cuántos se crearon.
+    """
+    sin_movimientos = ~exists().where(MovimientoSaldo.id_usuario == Usuario.id)
+    centavos = cast(func.round(Usuario.saldo * 100), Integer)
+    apertura = literal(TipoMovimientoSaldo.APERTURA, MovimientoSaldo.tipo.type)
+    resultado = db.execute(
+        insert(MovimientoSaldo).from_select(
+            ["id_usuario", "tipo", "monto_centavos", "saldo_centavos"],
+            select(Usuario.id, apertura, centavos, centavos)
+            .where(Usuario.saldo != 0, sin_movimientos),
+        )
+    )
+    db.commit()
+    return resultado.rowcount
+
+
+def verificar_libro(db: Session, tamano_lote: int = TAMANO_LOTE_VERIFICACION) -> Dict[str, object]:
+    """
+    Recorrer el libro en streaming y detectar descuadres:
+    - un movimiento cuyo saldo resultante no es el anterior más el monto;
+    - un usuario cuyo `saldo` no coincide con el último saldo del libro.
+
+    Cada usuario arranca desde su snapshot (último saldo ya verificado), así una
+    corrida solo lee los movimientos nuevos. Los usuarios sin descuadres avanzan
+    su snapshot al último movimiento.
+    """
+    consulta = (
+        select(
+            Usuario.id,
+            Usuario.saldo,
+            SnapshotSaldo.id_movimiento,
+            SnapshotSaldo.saldo_centavos,
+            MovimientoSaldo.id,
+            MovimientoSaldo.monto_centavos,
+            MovimientoSaldo.saldo_centavos,
+        )
+        .outerjoin(SnapshotSaldo, SnapshotSaldo.id_usuario == Usuario.id)
+        .outerjoin(
+            MovimientoSaldo,
+            and_(
+                MovimientoSaldo.id_usuario == Usuario.id,
+                MovimientoSaldo.id > func.coalesce(SnapshotSaldo.id_movimiento, 0),
+            ),
+        )
+        .order_by(Usuario.id, MovimientoSaldo.id)
+        .execution_options(yield_per=tamano_lote)
+    )
+
+    descuadres: List[Dict[str, object]] = []
+    snapshots: List[Dict[str, int]] = []
+    usuarios = movimientos = 0
+    actual = None  # [id_usuario, saldo_usuario, saldo_libro, ultimo_movimiento, avanzo, con_descuadre]
+
+    def cerrar_usuario():
+        id_usuario, saldo_usuario, saldo_libro, ultimo, avanzo, con_descuadre = actual
+        if a_centavos(saldo_usuario) != saldo_libro:
+            descuadres.append({
+                "id_usuario": id_usuario, "id_movimiento": ultimo,
+                "esperado_centavos": saldo_libro, "registrado_centavos": a_centavos(saldo_usuario),
+                "motivo": "saldo del usuario distinto al del libro",
+            })
+        elif avanzo and not con_descuadre:
+            snapshots.append({"id_usuario": id_usuario, "id_movimiento": ultimo, "saldo_centavos": saldo_libro})
+
+    for id_usuario, saldo, snap_id, snap_saldo, mov_id, monto, saldo_mov in db.execute(consulta):
+        if actual is None or actual[0] != id_usuario:
+            if actual is not None:
+                cerrar_usuario()
+            usuarios += 1
+            actual = [id_usuario, saldo, snap_saldo or 0, snap_id, False, False]
+        if mov_id is None:
+            continue
+        movimientos += 1
+        if actual[2] + monto != saldo_mov:
+            descuadres.append({
+                "id_usuario": id_usuario, "id_movimiento": mov_id,
+                "esperado_centavos": actual[2] + monto, "registrado_centavos": saldo_mov,
+                "motivo": "saldo resultante distinto al anterior más el monto",
+            })
+            actual[5] = True
+        # Seguir desde lo registrado para no arrastrar un mismo error a los siguientes movimientos
+        actual[2], actual[3], actual[4] = saldo_mov, mov_id, True
+    if actual is not None:
+        cerrar_usuario()
+
+    for inicio in range(0, len(snapshots), tamano_lote):
+        lote = snapshots[inicio:inicio + tamano_lote]
+        db.execute(delete(SnapshotSaldo).where(SnapshotSaldo.id_usuario.in_([s["id_usuario"] for s in lote])))
+        db.execute(insert(SnapshotSaldo), lote)
+    db.commit()
+    return {
+        "usuarios": usuarios,
+        "movimientos_revisados": movimientos,
+        "snapshots_actualizados": len(snapshots),
+        "descuadres": descuadres,
+    }